@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from urllib.parse import urlencode
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import text
+from dotenv import load_dotenv
+from .database import engine
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError: # Redis backend is optional; the in-process cache is used without it
+    redis_asyncio = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Any Redis-protocol server works here (Redis, Valkey, KeyDB, Dragonfly); unset keeps the cache in-process.
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+CACHE_MAX_AGE_SECONDS = int(os.getenv('CACHE_MAX_AGE_SECONDS', '60'))
+DATA_VERSION_CHECK_SECONDS = float(os.getenv('DATA_VERSION_CHECK_SECONDS', '30'))
+
+# Only the read-only analytics routes are cached; health checks and docs always go through.
+CACHEABLE_PATHS = {"/top-products", "/product-availability", "/channel-visual-content", "/posting-trends", "/search"}
+CACHE_KEY_PREFIX = "api-cache"
+
+class LRUCache:
+    """In-process cache: least recently used entries are evicted past max_entries, and entries expire after ttl."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def clear(self):
+        self.entries.clear()
+
+    async def close(self):
+        pass
+
+    def size(self):
+        return len(self.entries)
+
+class RedisCache:
+    """Shared cache across API workers. Keys embed the data version, so stale versions simply expire."""
+
+    def __init__(self, url, ttl=CACHE_TTL_SECONDS):
+        self.client = redis_asyncio.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key):
+        value = await self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value):
+        await self.client.set(key, json.dumps(value), ex=self.ttl)
+
+    async def clear(self):
+        pass
+
+    async def close(self):
+        await self.client.aclose()
+
+    def size(self):
+        return None
+
+def create_backend():
+    if REDIS_URL:
+        if redis_asyncio is None:
+            logger.warning("REDIS_URL is set but the 'redis' package is not installed; using the in-process cache.")
+        else:
+            return RedisCache(REDIS_URL)
+    return LRUCache()
+
+backend = create_backend()
+stats = {"hits": 0, "misses": 0, "not_modified": 0, "stores": 0, "bypassed": 0, "invalidations": 0, "errors": 0}
+_data_version = {"value": None, "checked_at": float('-inf')}
+
+async def current_data_version():
+    """Build id of the last warehouse refresh, re-read from public.data_version every DATA_VERSION_CHECK_SECONDS."""
+    now = time.monotonic()
+    if now - _data_version["checked_at"] < DATA_VERSION_CHECK_SECONDS:
+        return _data_version["value"]
+    _data_version["checked_at"] = now
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT build_id FROM public.data_version LIMIT 1"))
+            row = result.first()
+        version = row[0] if row else "unversioned"
+    except Exception as e:
+        # Table not created yet (no dbt run) or database unavailable: keep serving under the last known version.
+        logger.warning(f"Could not read the data version: {e}")
+        return _data_version["value"] or "unversioned"
+    if _data_version["value"] is not None and version != _data_version["value"]:
+        stats["invalidations"] += 1
+        await backend.clear()
+        logger.info(f"Data version changed to {version}; response cache invalidated.")
+    _data_version["value"] = version
+    return version
+
+def cache_key(request, version):
+    """Route plus query parameters in sorted order, so ?a=1&b=2 and ?b=2&a=1 share an entry."""
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{CACHE_KEY_PREFIX}:{version}:{request.url.path}?{query}"
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def cached_response(request, entry, cache_status):
+    headers = dict(entry["headers"])
+    headers.update({"ETag": entry["etag"], "Cache-Control": f"public, max-age={CACHE_MAX_AGE_SECONDS}", "X-Cache": cache_status})
+    if etag_matches(request, entry["etag"]):
+        stats["not_modified"] += 1
+        headers.pop("content-type", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], status_code=200, headers=headers, media_type="application/json")
+
+async def response_cache_middleware(request: Request, call_next):
+    """Serves cached JSON for the analytics routes and answers If-None-Match with 304 when the ETag still matches."""
+    if request.method != "GET" or request.url.path not in CACHEABLE_PATHS:
+        return await call_next(request)
+
+    version = await current_data_version()
+    key = cache_key(request, version)
+    try:
+        entry = await backend.get(key)
+    except Exception as e:
+        stats["errors"] += 1
+        logger.warning(f"Cache read failed: {e}")
+        entry = None
+    if entry is not None:
+        stats["hits"] += 1
+        return cached_response(request, entry, "HIT")
+
+    stats["misses"] += 1
+    response = await call_next(request)
+    # Errors, NDJSON/CSV streams and anything else that isn't a plain JSON body pass through uncached.
+    if response.status_code != 200 or not response.headers.get("content-type", "").startswith("application/json"):
+        stats["bypassed"] += 1
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    entry = {
+        "body": body.decode("utf-8"),
+        "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        "headers": {k: v for k, v in response.headers.items() if k.lower() not in ("content-length", "content-type")},
+    }
+    try:
+        await backend.set(key, entry)
+        stats["stores"] += 1
+    except Exception as e:
+        stats["errors"] += 1
+        logger.warning(f"Cache write failed: {e}")
+    return cached_response(request, entry, "MISS")
+
+def cache_stats():
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "backend": type(backend).__name__,
+        "data_version": _data_version["value"],
+        "entries": backend.size(),
+        "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        **stats,
+    }
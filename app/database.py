@@ -1,23 +1,56 @@
-# from sqlalchemy import create_engine
-# from sqlalchemy.orm import sessionmaker
-# from dotenv import load_dotenv
-# import os
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from dotenv import load_dotenv
+import os
 
-# load_dotenv()
+load_dotenv()
 
-# PG_USER = os.getenv('POSTGRES_USER')
-# PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
-# PG_DB = os.getenv('POSTGRES_DB')
-# PG_HOST = os.getenv('POSTGRES_HOST')
-# PG_PORT = os.getenv('POSTGRES_PORT')
+PG_USER = os.getenv('POSTGRES_USER')
+PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
+PG_DB = os.getenv('POSTGRES_DB')
+PG_HOST = os.getenv('POSTGRES_HOST')
+PG_PORT = os.getenv('POSTGRES_PORT')
 
-# DATABASE_URL = f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
-# engine = create_engine(DATABASE_URL)
-# SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool limits. Requests beyond pool size + overflow wait up to DB_POOL_TIMEOUT seconds for a connection.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000'))
 
-# def get_db():
-#     db = SessionLocal()
-#     try:
-#         yield db
-#     finally:
-#         db.close()
\ No newline at end of file
+# asyncpg driver: queries await the network instead of blocking the event loop
+DATABASE_URL = f"postgresql+asyncpg://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={
+        "server_settings": {
+            "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+            "application_name": "medical-data-api",
+        }
+    },
+)
+SessionLocal = sessionmaker(engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
+# Dependency to get a database session
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+def pool_status():
+    """Snapshot of connection pool usage, for the readiness endpoint."""
+    pool = engine.pool
+    capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    checked_out = pool.checkedout()
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
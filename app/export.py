@@ -0,0 +1,132 @@
+import io
+import os
+import logging
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Written by scripts/export_parquet.py after each dbt run; the API only reads it
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'data/export')
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', '65536'))
+EXPORT_TABLES = ("fct_messages", "dim_channels", "dim_dates")
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# fct_messages is partitioned by day in Hive layout (date_day=YYYY-MM-DD/), so date filters skip whole directories
+DAY_PARTITIONING = ds.partitioning(pa.schema([("date_day", pa.date32())]), flavor="hive")
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that keeps what was written until drained, so a response can stream a file as it is built.
+
+    It counts the bytes itself because the Parquet writer records offsets from tell(), which must keep growing
+    after each drain.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def table_path(table):
+    if table == "fct_messages":
+        return os.path.join(EXPORT_DIR, table)
+    return os.path.join(EXPORT_DIR, f"{table}.parquet")
+
+def open_dataset(table):
+    path = table_path(table)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=503, detail=f"No Parquet export of {table} yet; run scripts/export_parquet.py.")
+    if table == "fct_messages":
+        return ds.dataset(path, format="parquet", partitioning=DAY_PARTITIONING)
+    return ds.dataset(path, format="parquet")
+
+def channel_sks(channel):
+    """channel_sk values of a channel name, looked up in the exported dim_channels."""
+    path = table_path("dim_channels")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=503, detail="No Parquet export of dim_channels yet; run scripts/export_parquet.py.")
+    rows = pq.read_table(path, columns=["channel_sk"], filters=[("channel_name", "==", channel)])
+    return rows.column("channel_sk").to_pylist()
+
+def export_filter(table, start_date, end_date, channel):
+    """Dataset filter expression for the date range and channel filters, or None for the whole table."""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date.")
+    if (start_date or end_date) and table == "dim_channels":
+        raise HTTPException(status_code=400, detail="dim_channels has no date to filter on.")
+    if channel and table == "dim_dates":
+        raise HTTPException(status_code=400, detail="dim_dates has no channel to filter on.")
+
+    predicates = []
+    if start_date:
+        predicates.append(ds.field("date_day") >= start_date)
+    if end_date:
+        predicates.append(ds.field("date_day") <= end_date)
+    if channel and table == "dim_channels":
+        predicates.append(ds.field("channel_name") == channel)
+    elif channel:
+        predicates.append(ds.field("channel_sk").isin(channel_sks(channel)))
+
+    expression = None
+    for predicate in predicates:
+        expression = predicate if expression is None else expression & predicate
+    return expression
+
+def stream_dataset(dataset, expression, fmt):
+    """Yields an Arrow IPC stream or a Parquet file of the matching rows, one record batch at a time."""
+    sink = ChunkSink()
+    scanner = dataset.scanner(filter=expression, batch_size=EXPORT_BATCH_ROWS)
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), dataset.schema)
+    else:
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), dataset.schema, compression="zstd")
+    try:
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    except Exception as e:
+        # Headers are already sent, so the error can only be logged and the stream cut short.
+        logger.error(f"Export stream failed: {e}")
+        return
+    finally:
+        writer.close()
+    yield sink.drain() # The Arrow end-of-stream marker, or the Parquet footer
+
+def export_response(table, fmt, start_date=None, end_date=None, channel=None):
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail=f"Invalid table. Must be one of: {', '.join(EXPORT_TABLES)}.")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}.")
+    expression = export_filter(table, start_date, end_date, channel)
+    dataset = open_dataset(table)
+    media_type, extension = EXPORT_FORMATS[fmt]
+    # A sync generator, so Starlette reads and encodes the batches in its thread pool, off the event loop
+    return StreamingResponse(stream_dataset(dataset, expression, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'})
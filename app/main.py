@@ -1,13 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
+import time
+from datetime import date
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from starlette.routing import Match
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from .models import TopProducts, ProductAvailability, ChannelVisualContent, DailyWeeklyTrends
-
-# Load environment variables
-load_dotenv()
+from .database import engine, get_db, pool_status
+from .cache import backend as cache_backend, response_cache_middleware, cache_stats
+from .pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_query, keyset_rows, cursor_for_row,
+                         set_next_page_headers, validate_format, streaming_response)
+from .export import export_response
+from . import snapshot
+from common.instrumentation import gauge, histogram, span, render_prometheus, start_profiler
+from .models import TopProducts, ProductAvailability, ChannelVisualContent, DailyWeeklyTrends, SearchResult
 
 app = FastAPI(
     title="Ethiopian Medical Data API",
@@ -15,150 +22,462 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Database connection details
-PG_USER = os.getenv('POSTGRES_USER')
-PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
-PG_DB = os.getenv('POSTGRES_DB')
-PG_HOST = os.getenv('POSTGRES_HOST')
-PG_PORT = os.getenv('POSTGRES_PORT')
+HTTP_REQUEST_SECONDS = histogram('http_request_duration_seconds', "API request latency, by route, method and status.")
+DB_POOL_CONNECTIONS = gauge('db_pool_connections', "Database pool connections, by state.")
+RESPONSE_CACHE = gauge('response_cache_events', "Response cache counters since the API started, by event.")
+profiler = None
+
+def route_template(request):
+    """Path template of the route serving the request, or "unmatched".
 
-DATABASE_URL = f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Cache hits are answered before routing sets scope["route"], so the route is then matched here instead.
+    """
+    route = request.scope.get("route")
+    if route is None:
+        route = next((r for r in app.router.routes if r.matches(request.scope)[0] == Match.FULL), None)
+    return route.path if route else "unmatched"
 
-# Dependency to get a database session
-def get_db():
-    db = SessionLocal()
+async def request_metrics_middleware(request: Request, call_next):
+    """Records every request's latency under its route template, so /search?q=... shares one series."""
+    start = time.perf_counter()
+    status = 500
     try:
-        yield db
+        response = await call_next(request)
+        status = response.status_code
+        return response
     finally:
-        db.close()
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route_template(request),
+                                     method=request.method, status=status)
+
+# Added last so it runs outermost and times cache hits too
+app.middleware("http")(response_cache_middleware)
+app.middleware("http")(request_metrics_middleware)
+
+@app.on_event("startup")
+async def start_sampling_profiler():
+    global profiler
+    profiler = start_profiler() # Only when PROFILE_SAMPLE_INTERVAL_MS is set
+
+@app.on_event("startup")
+async def load_serving_snapshot():
+    await snapshot.start() # Only when SERVING_MODE=snapshot
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    if profiler:
+        profiler.stop("api")
+    await cache_backend.close()
+    await engine.dispose()
 
 # Helper function to execute raw SQL and fetch results
-def fetch_data_from_db(db, query, params=None):
+async def fetch_data_from_db(db, query, params=None):
     try:
-        result = db.execute(text(query), params).fetchall()
-        return result
+        with span("db_query"):
+            result = await db.execute(text(query), params)
+            return result.fetchall()
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted, try again later.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
+async def list_rows(db, request, response, base_query, order_columns, params, row_to_dict,
+                    after, limit, output_format, default_limit=DEFAULT_PAGE_SIZE, snapshot_rows=None):
+    """
+    Serves a list endpoint one keyset page at a time, or streams every row after `after` as NDJSON/CSV.
+    The next page's cursor goes in the X-Next-Cursor and Link headers.
+    With snapshot_rows, a callable returning the same rows as base_query, JSON pages are served from the in-process
+    snapshot instead of the database.
+    """
+    validate_format(output_format)
+    if output_format != "json":
+        query, page_params = keyset_query(base_query, order_columns, after, limit)
+        return streaming_response(query, {**params, **page_params}, output_format, row_to_dict)
+
+    limit = limit or default_limit
+    # Fetch one extra row to learn whether another page follows
+    if snapshot_rows is not None:
+        with span("snapshot_query"):
+            rows = keyset_rows(snapshot_rows(), order_columns, after, limit + 1)
+    else:
+        query, page_params = keyset_query(base_query, order_columns, after, limit + 1)
+        rows = await fetch_data_from_db(db, query, {**params, **page_params})
+    if len(rows) > limit:
+        rows = rows[:limit]
+        set_next_page_headers(request, response, cursor_for_row(rows[-1], order_columns))
+    return [row_to_dict(r) for r in rows]
+
 @app.get("/", tags=["Health Check"])
 async def read_root():
     return {"message": "Welcome to the Ethiopian Medical Data API! Visit /docs for API documentation."}
 
+@app.get("/ready", tags=["Health Check"])
+async def readiness(db: AsyncSession = Depends(get_db)):
+    """
+    Readiness probe: checks the database answers and reports connection pool saturation.
+    """
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "detail": str(e), "pool": pool_status()})
+    return {"status": "ready", "pool": pool_status(), "serving": snapshot.snapshot_status()}
+
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: per-route latency histograms, database query spans, pool usage and cache counters.
+    """
+    status = pool_status()
+    for state in ("checked_in", "checked_out", "overflow"):
+        DB_POOL_CONNECTIONS.set(status[state], state=state)
+    for event, value in cache_stats().items():
+        if event in ("hits", "misses", "not_modified", "stores", "bypassed", "invalidations", "errors"):
+            RESPONSE_CACHE.set(value, event=event)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats", tags=["Health Check"])
+async def get_cache_stats():
+    """
+    Response cache hit/miss counters and the warehouse data version the cached entries belong to.
+    """
+    return cache_stats()
+
+LIMIT_QUERY = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size. In ndjson/csv mode, caps the streamed rows (default: all).")
+AFTER_QUERY = Query(None, description="Cursor from the previous page's X-Next-Cursor header.")
+FORMAT_QUERY = Query("json", alias="format", description="'json' (paged list), or 'ndjson'/'csv' to stream every row.")
+START_DATE_QUERY = Query(None, description="Only count messages posted on or after this date (YYYY-MM-DD).")
+END_DATE_QUERY = Query(None, description="Only count messages posted on or before this date (YYYY-MM-DD).")
+CHANNEL_QUERY = Query(None, description="Only count messages from this channel (channel name as scraped).")
+
+def filter_predicates(params, start_date, end_date, channel, channel_sk_column, date_column=None, date_sk_column=None):
+    """
+    SQL predicates for the date range and channel filters, written so Postgres can use the (channel_sk, date) indexes.
+    date_sk is a hash key, so date bounds on fact tables become a semi-join against dim_dates' date_day range.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date.")
+    bounds = []
+    if start_date:
+        params['start_date'] = start_date
+        bounds.append(("date_day", ">=", ":start_date"))
+    if end_date:
+        params['end_date'] = end_date
+        bounds.append(("date_day", "<=", ":end_date"))
+
+    predicates = []
+    if bounds and date_sk_column:
+        days = " AND ".join(f"{column} {op} {value}" for column, op, value in bounds)
+        predicates.append(f"{date_sk_column} IN (SELECT date_sk FROM dim_dates WHERE {days})")
+    elif bounds:
+        predicates += [f"{date_column} {op} {value}" for _, op, value in bounds]
+    if channel:
+        params['channel'] = channel
+        # Scalar subquery: resolved once, then used as an index condition on channel_sk
+        predicates.append(f"{channel_sk_column} = (SELECT channel_sk FROM dim_channels WHERE channel_name = :channel)")
+    return predicates
+
+def where_clause(predicates, keyword="WHERE"):
+    return f"{keyword} " + " AND ".join(predicates) if predicates else ""
+
 @app.get("/top-products", response_model=List[TopProducts], tags=["Analytics"])
-async def get_top_products(db: SessionLocal = Depends(get_db)):
+async def get_top_products(
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = START_DATE_QUERY,
+    end_date: Optional[date] = END_DATE_QUERY,
+    channel: Optional[str] = CHANNEL_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    after: Optional[str] = AFTER_QUERY,
+    output_format: str = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Returns the top 10 most frequently mentioned medical products or drugs.
-    This is a simplified example; actual product extraction would need NLP.
+    Returns the most frequently mentioned medical products or drugs, 10 per page by default.
+    Reads the agg_product_mentions mart, rolled up from the mentions scripts/extract_products.py finds by matching
+    messages against the drug dictionary. A message reposted within or across channels counts once per duplicate
+    group, in the channel and on the day of the group's first mention of the product.
     """
-    query = """
-    SELECT
-        LOWER(SUBSTRING(message_content FROM '[A-Za-z]+ drug|product|medication')) AS product_name,
-        COUNT(*) AS mention_count
-    FROM fct_messages
-    WHERE message_content ILIKE '%drug%' OR message_content ILIKE '%product%' OR message_content ILIKE '%medication%'
-    GROUP BY product_name
-    ORDER BY mention_count DESC
-    LIMIT 10;
-    """
-    # NOTE: This query is a very basic example.
-    # A robust solution would involve NLP techniques (NER, keyword extraction)
-    # on `message_content` to identify actual product names.
-    results = fetch_data_from_db(db, query)
-    return [{"product_name": r[0].strip() if r[0] else "Unknown", "mention_count": r[1]} for r in results]
+    params = {}
+    predicates = filter_predicates(params, start_date, end_date, channel,
+                                   channel_sk_column="channel_sk", date_column="date_day")
+    query = f"""
+    SELECT product AS product_name, SUM(mention_count)::BIGINT AS mention_count
+    FROM agg_product_mentions
+    {where_clause(predicates)}
+    GROUP BY product
+    HAVING SUM(mention_count) > 0
+    """
+    order_columns = [("mention_count", "desc", int), ("product_name", "asc", str)]
+    serving = await snapshot.active()
+    return await list_rows(db, request, response, query, order_columns, params,
+                           lambda r: {"product_name": r[0], "mention_count": r[1]},
+                           after, limit, output_format, default_limit=10,
+                           snapshot_rows=serving and (lambda: serving.top_products(start_date, end_date, channel)))
 
 @app.get("/product-availability", response_model=List[ProductAvailability], tags=["Analytics"])
 async def get_product_availability(
+    request: Request,
+    response: Response,
     product_name: str = Query(..., description="Name of the medical product/drug to query."),
-    db: SessionLocal = Depends(get_db)
+    start_date: Optional[date] = START_DATE_QUERY,
+    end_date: Optional[date] = END_DATE_QUERY,
+    channel: Optional[str] = CHANNEL_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    after: Optional[str] = AFTER_QUERY,
+    output_format: str = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Shows how the price or availability of a specific product might vary across channels.
-    This is a placeholder, as parsing prices/availability from free text is complex.
+    Shows how the price and availability of a specific product vary across channels.
+    Served from the (product, channel_sk) index on the agg_product_mentions mart; prices and availability are
+    parsed offline. A repost group counts once per channel, on the day of its first mention there.
     """
-    query = """
+    params = {'product_name': product_name.strip()}
+    predicates = ["pm.product = lower(:product_name)"] + filter_predicates(
+        params, start_date, end_date, channel, channel_sk_column="pm.channel_sk", date_column="pm.date_day")
+    query = f"""
     SELECT
         dc.channel_name,
-        COUNT(fm.message_id) AS mentions,
-        MAX(CASE WHEN fm.message_content ILIKE '%available%' THEN 1 ELSE 0 END) AS is_available_mention,
-        MAX(CASE WHEN fm.message_content ILIKE '%price%' OR fm.message_content ~* '\$\d+' THEN 1 ELSE 0 END) AS has_price_mention
-    FROM fct_messages fm
-    JOIN dim_channels dc ON fm.channel_sk = dc.channel_sk
-    WHERE fm.message_content ILIKE :product_name
+        SUM(pm.channel_mention_count)::BIGINT AS mentions,
+        BOOL_OR(pm.is_available_mention) AS is_available_mention,
+        BOOL_OR(pm.has_price_mention) AS has_price_mention,
+        MIN(pm.min_price) AS min_price,
+        MAX(pm.max_price) AS max_price,
+        MIN(pm.currency) AS currency
+    FROM agg_product_mentions pm
+    JOIN dim_channels dc ON pm.channel_sk = dc.channel_sk
+    {where_clause(predicates)}
     GROUP BY dc.channel_name
-    ORDER BY mentions DESC;
-    """
-    results = fetch_data_from_db(db, query, {'product_name': f'%{product_name}%'})
-    return [
-        {
-            "channel_name": r[0],
-            "mentions": r[1],
-            "is_available_mention": bool(r[2]),
-            "has_price_mention": bool(r[3])
-        } for r in results
-    ]
+    HAVING SUM(pm.channel_mention_count) > 0
+    """
+    order_columns = [("mentions", "desc", int), ("channel_name", "asc", str)]
+    return await list_rows(db, request, response, query, order_columns, params,
+                           lambda r: {
+                               "channel_name": r[0],
+                               "mentions": r[1],
+                               "is_available_mention": bool(r[2]),
+                               "has_price_mention": bool(r[3]),
+                               "min_price": float(r[4]) if r[4] is not None else None,
+                               "max_price": float(r[5]) if r[5] is not None else None,
+                               "currency": r[6]
+                           },
+                           after, limit, output_format)
 
 @app.get("/channel-visual-content", response_model=List[ChannelVisualContent], tags=["Analytics"])
-async def get_channel_visual_content(db: SessionLocal = Depends(get_db)):
+async def get_channel_visual_content(
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = START_DATE_QUERY,
+    end_date: Optional[date] = END_DATE_QUERY,
+    channel: Optional[str] = CHANNEL_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    after: Optional[str] = AFTER_QUERY,
+    output_format: str = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db)
+):
     """
     Returns which channels have the most visual content and a breakdown of detected objects.
-    Assumes `detected_objects` in `fct_messages` is populated by the YOLO enrichment script.
+    Reads the agg_channel_visual_content mart, built from the `detected_objects` the YOLO enrichment script populates.
+    The mart holds all-time totals, so a date range is aggregated from fct_messages over the (channel_sk, date_sk) index.
+    Counts cover only media messages with detected objects, and channels without any are not listed.
     """
-    query = """
-    SELECT
-        dc.channel_name,
-        COUNT(fm.message_id) AS total_messages,
-        COUNT(CASE WHEN fm.has_media = TRUE THEN fm.message_id END) AS messages_with_media,
-        SUM(jsonb_array_length(fm.detected_objects)) AS total_detected_objects,
-        jsonb_agg(DISTINCT jsonb_array_elements(fm.detected_objects)->>'class_name') AS distinct_detected_classes
-    FROM fct_messages fm
-    JOIN dim_channels dc ON fm.channel_sk = dc.channel_sk
-    WHERE fm.has_media = TRUE AND fm.detected_objects IS NOT NULL
-    GROUP BY dc.channel_name
-    ORDER BY messages_with_media DESC;
-    """
-    results = fetch_data_from_db(db, query)
-    return [
-        {
-            "channel_name": r[0],
-            "total_messages": r[1],
-            "messages_with_media": r[2],
-            "total_detected_objects": r[3] if r[3] else 0,
-            "distinct_detected_classes": r[4] if r[4] else []
-        } for r in results
-    ]
+    params = {}
+    if start_date or end_date:
+        counts_filter = ["fm.has_media = TRUE", "fm.detected_objects IS NOT NULL"] + filter_predicates(
+            params, start_date, end_date, channel, channel_sk_column="fm.channel_sk", date_sk_column="fm.date_sk")
+        classes_filter = filter_predicates(params, start_date, end_date, channel,
+                                           channel_sk_column="fm2.channel_sk", date_sk_column="fm2.date_sk")
+        query = f"""
+        SELECT
+            dc.channel_name,
+            c.total_messages,
+            c.messages_with_media,
+            c.total_detected_objects,
+            COALESCE(cls.distinct_detected_classes, '[]'::jsonb) AS distinct_detected_classes
+        FROM (
+            SELECT
+                fm.channel_sk,
+                COUNT(fm.message_id) AS total_messages,
+                COUNT(CASE WHEN fm.has_media = TRUE THEN fm.message_id END) AS messages_with_media,
+                COALESCE(SUM(jsonb_array_length(fm.detected_objects)), 0) AS total_detected_objects
+            FROM fct_messages fm
+            {where_clause(counts_filter)}
+            GROUP BY fm.channel_sk
+        ) c
+        JOIN dim_channels dc ON dc.channel_sk = c.channel_sk
+        LEFT JOIN LATERAL (
+            SELECT jsonb_agg(DISTINCT obj->>'class_name') AS distinct_detected_classes
+            FROM fct_messages fm2
+            CROSS JOIN LATERAL jsonb_array_elements(fm2.detected_objects) AS obj
+            WHERE fm2.channel_sk = c.channel_sk AND fm2.has_media = TRUE AND fm2.detected_objects IS NOT NULL
+            {where_clause(classes_filter, "AND")}
+        ) cls ON TRUE
+        """
+    else:
+        predicates = filter_predicates(params, None, None, channel, channel_sk_column="channel_sk")
+        query = f"""
+        SELECT
+            channel_name,
+            total_messages,
+            messages_with_media,
+            total_detected_objects,
+            distinct_detected_classes
+        FROM agg_channel_visual_content
+        {where_clause(predicates)}
+        """
+    order_columns = [("messages_with_media", "desc", int), ("channel_name", "asc", str)]
+    serving = await snapshot.active()
+    return await list_rows(db, request, response, query, order_columns, params,
+                           lambda r: {
+                               "channel_name": r[0],
+                               "total_messages": r[1],
+                               "messages_with_media": r[2],
+                               "total_detected_objects": r[3] if r[3] else 0,
+                               "distinct_detected_classes": r[4] if r[4] else []
+                           },
+                           after, limit, output_format,
+                           snapshot_rows=serving and (lambda: serving.channel_visual_content(start_date, end_date, channel)))
 
 @app.get("/posting-trends", response_model=List[DailyWeeklyTrends], tags=["Analytics"])
 async def get_posting_trends(
-    time_grain: str = Query("day", description="Time grain for trends: 'day' or 'week'."),
-    db: SessionLocal = Depends(get_db)
+    request: Request,
+    response: Response,
+    grain: Optional[str] = Query(None, description="Time grain for trends: 'day', 'week' or 'month'."),
+    time_grain: Optional[str] = Query(None, deprecated=True, description="Old name for `grain`."),
+    start_date: Optional[date] = START_DATE_QUERY,
+    end_date: Optional[date] = END_DATE_QUERY,
+    channel: Optional[str] = CHANNEL_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    after: Optional[str] = AFTER_QUERY,
+    output_format: str = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Returns daily and weekly trends in posting volume for health-related topics.
+    Returns daily, weekly or monthly trends in posting volume for health-related topics, oldest period first.
+    Months, and weeks cut by a date range, are rolled up from the daily mart's (date_day, channel_sk) rows.
     """
-    if time_grain not in ["day", "week"]:
-        raise HTTPException(status_code=400, detail="Invalid time_grain. Must be 'day' or 'week'.")
+    grain = grain or time_grain or "day"
+    if grain not in ["day", "week", "month"]:
+        raise HTTPException(status_code=400, detail="Invalid grain. Must be 'day', 'week' or 'month'.")
 
-    if time_grain == "day":
-        query = """
+    params = {}
+    predicates = filter_predicates(params, start_date, end_date, channel,
+                                   channel_sk_column="channel_sk", date_column="date_day")
+    if grain == "day":
+        query = f"""
+        SELECT
+            date_day AS trend_period,
+            SUM(posting_volume) AS posting_volume
+        FROM agg_daily_posting_volume
+        {where_clause(predicates)}
+        GROUP BY date_day
+        """
+        order_columns = [("trend_period", "asc", date.fromisoformat)]
+    elif grain == "week" and not (start_date or end_date):
+        query = f"""
+        SELECT
+            year || '-' || week_of_year AS trend_period,
+            SUM(posting_volume) AS posting_volume,
+            year,
+            week_of_year
+        FROM agg_weekly_posting_volume
+        {where_clause(predicates)}
+        GROUP BY year, week_of_year
+        """
+        order_columns = [("year", "asc", int), ("week_of_year", "asc", int)]
+    elif grain == "week":
+        # Same year/week numbering as dim_dates, so filtered and unfiltered weeks line up
+        query = f"""
         SELECT
-            dd.date_day AS trend_period,
-            COUNT(fm.message_id) AS posting_volume
-        FROM fct_messages fm
-        JOIN dim_dates dd ON fm.date_sk = dd.date_sk
-        GROUP BY dd.date_day
-        ORDER BY dd.date_day;
+            EXTRACT(YEAR FROM date_day) || '-' || EXTRACT(WEEK FROM date_day) AS trend_period,
+            SUM(posting_volume) AS posting_volume,
+            EXTRACT(YEAR FROM date_day) AS year,
+            EXTRACT(WEEK FROM date_day) AS week_of_year
+        FROM agg_daily_posting_volume
+        {where_clause(predicates)}
+        GROUP BY EXTRACT(YEAR FROM date_day), EXTRACT(WEEK FROM date_day)
         """
-    else: # week
-        query = """
+        order_columns = [("year", "asc", int), ("week_of_year", "asc", int)]
+    else: # month
+        query = f"""
         SELECT
-            dd.year || '-' || dd.week_of_year AS trend_period,
-            COUNT(fm.message_id) AS posting_volume
-        FROM fct_messages fm
-        JOIN dim_dates dd ON fm.date_sk = dd.date_sk
-        GROUP BY dd.year, dd.week_of_year
-        ORDER BY dd.year, dd.week_of_year;
+            to_char(date_trunc('month', date_day), 'YYYY-MM') AS trend_period,
+            SUM(posting_volume) AS posting_volume
+        FROM agg_daily_posting_volume
+        {where_clause(predicates)}
+        GROUP BY date_trunc('month', date_day)
         """
-    results = fetch_data_from_db(db, query)
-    return [{"trend_period": str(r[0]), "posting_volume": r[1]} for r in results]
\ No newline at end of file
+        order_columns = [("trend_period", "asc", str)]
+    serving = await snapshot.active()
+    return await list_rows(db, request, response, query, order_columns, params,
+                           lambda r: {"trend_period": str(r[0]), "posting_volume": r[1]},
+                           after, limit, output_format,
+                           snapshot_rows=serving and (lambda: serving.posting_trends(grain, start_date, end_date, channel)))
+
+# The expression must match fct_messages_content_fts_idx exactly for the planner to use the index.
+SEARCH_DOCUMENT = "to_tsvector('simple', COALESCE(fm.message_content, ''))"
+
+def search_match(fuzzy):
+    """/search's match predicate over fct_messages fm, for the :q parameter."""
+    match = f"{SEARCH_DOCUMENT} @@ plainto_tsquery('simple', :q)"
+    if fuzzy:
+        match = f"({match} OR :q <% fm.message_content)"
+    return match
+
+@app.get("/search", response_model=List[SearchResult], tags=["Search"])
+async def search_messages(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=2, description="Words to search for in message text."),
+    fuzzy: bool = Query(True, description="Also match misspellings and partial words by trigram similarity."),
+    start_date: Optional[date] = START_DATE_QUERY,
+    end_date: Optional[date] = END_DATE_QUERY,
+    channel: Optional[str] = CHANNEL_QUERY,
+    limit: Optional[int] = Query(None, ge=1, le=100, description="Maximum number of messages per page (default 20)."),
+    after: Optional[str] = AFTER_QUERY,
+    output_format: str = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ranked search over message text. Full-text matches come from the tsvector GIN index; with `fuzzy`,
+    word-similarity matches from the trigram index are added. Results are ordered by text rank, then similarity.
+    """
+    params = {'q': q}
+    predicates = [search_match(fuzzy)] + filter_predicates(params, start_date, end_date, channel,
+                                             channel_sk_column="fm.channel_sk", date_sk_column="fm.date_sk")
+    query = f"""
+    SELECT
+        fm.message_id,
+        dc.channel_name,
+        fm.message_content,
+        ts_rank({SEARCH_DOCUMENT}, plainto_tsquery('simple', :q)) AS rank,
+        word_similarity(:q, fm.message_content) AS similarity
+    FROM fct_messages fm
+    JOIN dim_channels dc ON fm.channel_sk = dc.channel_sk
+    {where_clause(predicates)}
+    """
+    order_columns = [("rank", "desc", float), ("similarity", "desc", float),
+                     ("message_id", "asc", int), ("channel_name", "asc", str)]
+    return await list_rows(db, request, response, query, order_columns, params,
+                           lambda r: {
+                               "message_id": r[0],
+                               "channel_name": r[1],
+                               "message_content": r[2],
+                               "rank": r[3],
+                               "similarity": r[4]
+                           },
+                           after, limit, output_format, default_limit=20)
+
+@app.get("/export", tags=["Export"])
+def export_table(
+    table: str = Query("fct_messages", description="Table to export: 'fct_messages', 'dim_channels' or 'dim_dates'."),
+    output_format: str = Query("arrow", alias="format", description="'arrow' (Arrow IPC stream) or 'parquet'."),
+    start_date: Optional[date] = Query(None, description="Only rows of messages posted on or after this date (YYYY-MM-DD)."),
+    end_date: Optional[date] = Query(None, description="Only rows of messages posted on or before this date (YYYY-MM-DD)."),
+    channel: Optional[str] = CHANNEL_QUERY
+):
+    """
+    Bulk export of a mart table, or a date/channel slice of it, as an Arrow IPC stream or a Parquet file.
+    Served from the Parquet files scripts/export_parquet.py writes after each dbt run rather than from Postgres,
+    so it lags the warehouse by at most one pipeline run; date filters on fct_messages only open the matching days.
+    """
+    return export_response(table, output_format, start_date, end_date, channel)
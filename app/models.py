@@ -10,7 +10,12 @@ class ProductAvailability(BaseModel):
     mentions: int
     is_available_mention: bool
     has_price_mention: bool
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    currency: Optional[str] = None
 
+# Counts cover only the channel's media messages with detected objects, so total_messages equals
+# messages_with_media; channels without detections are not listed.
 class ChannelVisualContent(BaseModel):
     channel_name: str
     total_messages: int
@@ -20,4 +25,11 @@ class ChannelVisualContent(BaseModel):
 
 class DailyWeeklyTrends(BaseModel):
     trend_period: str
-    posting_volume: int
\ No newline at end of file
+    posting_volume: int
+
+class SearchResult(BaseModel):
+    message_id: int
+    channel_name: str
+    message_content: Optional[str]
+    rank: float
+    similarity: float
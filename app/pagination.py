@@ -0,0 +1,119 @@
+import io
+import csv
+import json
+import base64
+import logging
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def encode_cursor(values):
+    """Opaque cursor for the sort key of the last row on a page."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, order_columns):
+    """Decodes a cursor back into typed sort key values; order_columns is [(column, 'asc'|'desc', type)]."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(order_columns):
+            raise ValueError("cursor does not match this endpoint's sort key")
+        return [parse(value) for value, (_, _, parse) in zip(values, order_columns)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid 'after' cursor: {e}")
+
+def keyset_query(base_query, order_columns, after=None, limit=None):
+    """Wraps base_query to return the rows strictly after the `after` cursor in order_columns order.
+
+    The predicate is the expanded row comparison (a > x) OR (a = x AND b > y) ..., which also handles
+    sort keys that mix ascending and descending columns.
+    """
+    params = {}
+    where = ""
+    if after is not None:
+        clauses = []
+        for i, (column, direction, _) in enumerate(order_columns):
+            op = ">" if direction == "asc" else "<"
+            equal = [f"page.{order_columns[j][0]} = :after_{j}" for j in range(i)]
+            clauses.append("(" + " AND ".join(equal + [f"page.{column} {op} :after_{i}"]) + ")")
+        where = "WHERE " + " OR ".join(clauses)
+        params = {f"after_{i}": value for i, value in enumerate(decode_cursor(after, order_columns))}
+    order_by = ", ".join(f"page.{column} {direction.upper()}" for column, direction, _ in order_columns)
+    query = f"SELECT * FROM ({base_query}) page {where} ORDER BY {order_by}"
+    if limit is not None:
+        query += " LIMIT :page_limit"
+        params["page_limit"] = limit
+    return query, params
+
+def keyset_rows(rows, order_columns, after=None, limit=None):
+    """keyset_query for rows already in memory: sorts them by order_columns and returns those after the cursor."""
+    for column, direction, _ in reversed(order_columns):
+        # Stable sorts, least significant column first, give the combined order with mixed directions
+        rows = sorted(rows, key=lambda row: row._mapping[column], reverse=direction == "desc")
+    if after is not None:
+        values = decode_cursor(after, order_columns)
+        rows = [row for row in rows if row_after(row, order_columns, values)]
+    return rows if limit is None else rows[:limit]
+
+def row_after(row, order_columns, values):
+    for (column, direction, _), value in zip(order_columns, values):
+        current = row._mapping[column]
+        if current != value:
+            return current > value if direction == "asc" else current < value
+    return False
+
+def cursor_for_row(row, order_columns):
+    return encode_cursor([row._mapping[column] for column, _, _ in order_columns])
+
+def set_next_page_headers(request, response, cursor):
+    """Advertises the next page in headers so the JSON body stays a plain list."""
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{request.url.include_query_params(after=cursor)}>; rel="next"'
+
+def validate_format(fmt):
+    if fmt != "json" and fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: json, {', '.join(STREAM_FORMATS)}.")
+
+def csv_value(value):
+    return json.dumps(value) if isinstance(value, (list, dict)) else value
+
+class RowEncoder:
+    """Encodes response items one at a time as NDJSON lines or CSV rows, the CSV header going out with the first."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.writer = None
+        self.buffer = io.StringIO()
+
+    def encode(self, item):
+        if self.fmt == "ndjson":
+            return json.dumps(item, default=str) + "\n"
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.buffer, fieldnames=list(item))
+            self.writer.writeheader()
+        self.writer.writerow({key: csv_value(value) for key, value in item.items()})
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+async def stream_rows(query, params, fmt, row_to_dict):
+    """Yields NDJSON lines or CSV rows straight off a server-side cursor, one row at a time."""
+    try:
+        async with engine.connect() as conn:
+            result = await conn.stream(text(query), params)
+            encoder = RowEncoder(fmt)
+            async for row in result:
+                yield encoder.encode(row_to_dict(row))
+    except Exception as e:
+        # Headers are already sent, so the error can only be logged and the stream cut short.
+        logger.error(f"Streaming query failed: {e}")
+
+def streaming_response(query, params, fmt, row_to_dict):
+    return StreamingResponse(stream_rows(query, params, fmt, row_to_dict), media_type=STREAM_FORMATS[fmt])
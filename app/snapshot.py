@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import logging
+import numpy as np
+from sqlalchemy import text
+from dotenv import load_dotenv
+from .database import engine
+from .cache import current_data_version
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 'sql' answers every request from Postgres; 'snapshot' answers the aggregate endpoints from an in-process snapshot
+# of the marts, rebuilt when the warehouse data version changes, and falls back to SQL while none is loaded.
+SERVING_MODE = os.getenv('SERVING_MODE', 'sql')
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'data/snapshot')
+SNAPSHOT_BUILD_TIMEOUT_MS = int(os.getenv('SNAPSHOT_BUILD_TIMEOUT_MS', '300000'))
+SNAPSHOT_RETRY_SECONDS = float(os.getenv('SNAPSHOT_RETRY_SECONDS', '60')) # Wait after a failed build before trying again
+SNAPSHOT_FETCH_ROWS = int(os.getenv('SNAPSHOT_FETCH_ROWS', '50000')) # Rows fetched and encoded at a time while building
+SNAPSHOTS_KEPT = 2 # The current build and the one before it, which other workers may still have mapped
+SNAPSHOT_FORMAT = 3 # Part of the build directory name, so a change to the arrays never reuses an older build
+
+# Everything the covered endpoints filter on is a channel and a day, so the snapshot is kept at (channel, day)
+# grain and each endpoint is a masked group-by over a few small arrays. Channels, products and classes are
+# dictionary-encoded; the arrays are .npy files memory-mapped read-only, so uvicorn workers share their pages.
+SNAPSHOT_QUERIES = {
+    "channel_days": """
+        SELECT fm.channel_sk, dd.date_day,
+               COUNT(fm.message_id),
+               COUNT(CASE WHEN fm.has_media = TRUE AND fm.detected_objects IS NOT NULL THEN fm.message_id END),
+               COALESCE(SUM(jsonb_array_length(fm.detected_objects)), 0)
+        FROM fct_messages fm
+        JOIN dim_dates dd ON fm.date_sk = dd.date_sk
+        GROUP BY fm.channel_sk, dd.date_day
+    """,
+    "channel_classes": """
+        SELECT DISTINCT fm.channel_sk, dd.date_day, obj->>'class_name'
+        FROM fct_messages fm
+        JOIN dim_dates dd ON fm.date_sk = dd.date_sk
+        CROSS JOIN LATERAL jsonb_array_elements(fm.detected_objects) AS obj
+        WHERE fm.has_media = TRUE AND fm.detected_objects IS NOT NULL AND obj->>'class_name' IS NOT NULL
+    """,
+    # The mart already counts each repost group once, in the channel and day of its first mention
+    "mentions": """
+        SELECT product, channel_sk, date_day, mention_count
+        FROM agg_product_mentions
+        WHERE mention_count > 0
+    """,
+}
+
+# Columns of each query's rows, in order, as (array name, dictionary the values are encoded with, dtype)
+SNAPSHOT_COLUMNS = {
+    "channel_days": [("channel", "channel", np.int32), ("day", None, "datetime64[D]"), ("messages", None, np.int64),
+                     ("visual", None, np.int64), ("objects", None, np.int64)],
+    "channel_classes": [("channel", "channel", np.int32), ("day", None, "datetime64[D]"), ("class", "class", np.int32)],
+    "mentions": [("product", "product", np.int32), ("channel", "channel", np.int32), ("day", None, "datetime64[D]"),
+                 ("count", None, np.int64)],
+}
+
+class SnapshotRow(tuple):
+    """A result row that reads like SQLAlchemy's: by position for row_to_dict, by column name through _mapping."""
+
+    def __new__(cls, columns, values):
+        row = super().__new__(cls, values)
+        row._mapping = dict(zip(columns, values))
+        return row
+
+def rows(columns, records):
+    return [SnapshotRow(columns, record) for record in records]
+
+class Snapshot:
+    """One build of the snapshot, loaded from SNAPSHOT_DIR/<version>/."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "labels.json"), "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        self.version = labels["version"]
+        self.built_at = labels["built_at"]
+        self.channel_sks = labels["channel_sks"]
+        self.channel_names = labels["channel_names"] # Aligned with channel_sks; None for a channel not in dim_channels
+        self.products = labels["products"]
+        self.classes = labels["classes"]
+        self.channel_codes = {name: code for code, name in enumerate(self.channel_names) if name is not None}
+        self.arrays = {
+            file_name[:-4]: np.load(os.path.join(path, file_name), mmap_mode="r")
+            for file_name in os.listdir(path) if file_name.endswith(".npy")
+        }
+
+    def mask(self, table, start_date=None, end_date=None, channel=None):
+        days = self.arrays[f"{table}_day"]
+        mask = np.ones(len(days), dtype=bool)
+        # NaT (mentions without a message_date) compares False, so those rows drop out of any date range, as in SQL
+        if start_date:
+            mask &= days >= np.datetime64(start_date, "D")
+        if end_date:
+            mask &= days <= np.datetime64(end_date, "D")
+        if channel is not None:
+            mask &= self.arrays[f"{table}_channel"] == self.channel_codes.get(channel, -1)
+        return mask
+
+    def top_products(self, start_date=None, end_date=None, channel=None):
+        mask = self.mask("mentions", start_date, end_date, channel)
+        counts = np.bincount(self.arrays["mentions_product"][mask], weights=self.arrays["mentions_count"][mask],
+                             minlength=len(self.products)).astype(np.int64)
+        return rows(("product_name", "mention_count"),
+                    [(self.products[code], int(counts[code])) for code in np.flatnonzero(counts)])
+
+    def posting_trends(self, grain, start_date=None, end_date=None, channel=None):
+        mask = self.mask("channel_days", start_date, end_date, channel)
+        days = self.arrays["channel_days_day"][mask]
+        volume = self.arrays["channel_days_messages"][mask]
+        if grain == "day":
+            periods, inverse = np.unique(days, return_inverse=True)
+            totals = np.bincount(inverse, weights=volume, minlength=len(periods)).astype(np.int64)
+            return rows(("trend_period", "posting_volume"),
+                        [(period.item(), int(total)) for period, total in zip(periods, totals)])
+        if grain == "week":
+            # Postgres' EXTRACT(WEEK) is the ISO week, paired (as in dim_dates) with the calendar year
+            weekday = (days.astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday; Monday is 0
+            thursday = days - weekday.astype("timedelta64[D]") + np.timedelta64(3, "D")
+            week = (thursday - thursday.astype("datetime64[Y]").astype("datetime64[D]")).astype(np.int64) // 7 + 1
+            year = days.astype("datetime64[Y]").astype(np.int64) + 1970
+            periods, inverse = np.unique(year * 100 + week, return_inverse=True)
+            totals = np.bincount(inverse, weights=volume, minlength=len(periods)).astype(np.int64)
+            return rows(("trend_period", "posting_volume", "year", "week_of_year"),
+                        [(f"{period // 100}-{period % 100}", int(total), int(period // 100), int(period % 100))
+                         for period, total in zip(periods, totals)])
+        periods, inverse = np.unique(days.astype("datetime64[M]"), return_inverse=True)
+        totals = np.bincount(inverse, weights=volume, minlength=len(periods)).astype(np.int64)
+        return rows(("trend_period", "posting_volume"),
+                    [(str(period), int(total)) for period, total in zip(periods, totals)])
+
+    def channel_visual_content(self, start_date=None, end_date=None, channel=None):
+        mask = self.mask("channel_days", start_date, end_date, channel)
+        channels = self.arrays["channel_days_channel"][mask]
+        size = len(self.channel_sks)
+        # Like the mart, only media messages with detected objects count, and channels without any are left out
+        totals = {
+            column: np.bincount(channels, weights=self.arrays[f"channel_days_{column}"][mask], minlength=size).astype(np.int64)
+            for column in ("visual", "objects")
+        }
+        class_mask = self.mask("channel_classes", start_date, end_date, channel)
+        pairs = np.unique(self.arrays["channel_classes_channel"][class_mask].astype(np.int64) * len(self.classes)
+                          + self.arrays["channel_classes_class"][class_mask])
+        classes = {}
+        for pair in pairs.tolist():
+            classes.setdefault(pair // len(self.classes), []).append(self.classes[pair % len(self.classes)])
+        return rows(("channel_name", "total_messages", "messages_with_media", "total_detected_objects", "distinct_detected_classes"),
+                    [(self.channel_names[code], int(totals["visual"][code]), int(totals["visual"][code]),
+                      int(totals["objects"][code]), sorted(classes.get(code, [])))
+                     for code in np.flatnonzero(totals["visual"]) if self.channel_names[code] is not None])
+
+def version_dir(version):
+    return os.path.join(SNAPSHOT_DIR, f"v{SNAPSHOT_FORMAT}-" + re.sub(r"[^\w.-]", "_", str(version)))
+
+class SnapshotBuilder:
+    """Dictionary-encodes the snapshot queries' rows into column arrays, one fetched chunk at a time, and writes them.
+
+    Its methods are CPU and disk work, so build() runs them in a worker thread rather than on the event loop.
+    """
+
+    def __init__(self):
+        self.codes = {kind: {} for kind in ("channel", "product", "class")}
+        self.chunks = {f"{table}_{column}": [] for table, columns in SNAPSHOT_COLUMNS.items() for column, _, _ in columns}
+
+    def add(self, table, records):
+        for i, (column, kind, dtype) in enumerate(SNAPSHOT_COLUMNS[table]):
+            if kind is None:
+                values = [record[i] for record in records]
+            else:
+                codes = self.codes[kind]
+                values = [codes.setdefault(record[i], len(codes)) for record in records]
+            self.chunks[f"{table}_{column}"].append(np.array(values, dtype=dtype))
+
+    def write(self, path, version, names):
+        """Writes the arrays and labels under a private name and renames them into place, so a worker only ever
+        maps a complete build."""
+        dtypes = {f"{table}_{column}": dtype for table, columns in SNAPSHOT_COLUMNS.items() for column, _, dtype in columns}
+        channels = self.codes["channel"]
+        labels = {
+            "version": version,
+            "built_at": time.time(),
+            "channel_sks": list(channels),
+            "channel_names": [names.get(channel_sk) for channel_sk in channels],
+            "products": list(self.codes["product"]),
+            "classes": list(self.codes["class"]),
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, chunks in self.chunks.items():
+            array = np.concatenate(chunks) if chunks else np.array([], dtype=dtypes[name])
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "labels.json"), "w", encoding="utf-8") as f:
+            json.dump(labels, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True) # Another worker finished the same version first
+
+async def build(version):
+    """Reads the marts into SNAPSHOT_DIR/<version>/, unless another worker already has; returns the directory.
+
+    Rows are streamed off a server-side cursor SNAPSHOT_FETCH_ROWS at a time and encoded in a worker thread, so
+    the event loop keeps serving requests (from SQL) while a build runs.
+    """
+    path = version_dir(version)
+    if os.path.exists(path):
+        return path
+    start = time.perf_counter()
+    builder = SnapshotBuilder()
+    async with engine.connect() as conn:
+        # A full scan of fct_messages can outlast the API's per-request statement timeout
+        await conn.execute(text(f"SET LOCAL statement_timeout = {SNAPSHOT_BUILD_TIMEOUT_MS}"))
+        for table, query in SNAPSHOT_QUERIES.items():
+            result = await conn.stream(text(query))
+            async for records in result.partitions(SNAPSHOT_FETCH_ROWS):
+                await asyncio.to_thread(builder.add, table, records)
+        names = dict((await conn.execute(text("SELECT channel_sk, channel_name FROM dim_channels"))).fetchall())
+    await asyncio.to_thread(builder.write, path, version, names)
+    logger.info(f"Built the serving snapshot for data version {version} in {time.perf_counter() - start:.2f}s.")
+    return path
+
+def prune():
+    builds = [os.path.join(SNAPSHOT_DIR, entry) for entry in os.listdir(SNAPSHOT_DIR) if not entry.endswith(".tmp")]
+    # Files still mapped by a worker stay readable after removal; their pages are freed when it lets go
+    for path in sorted(builds, key=os.path.getmtime, reverse=True)[SNAPSHOTS_KEPT:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+_state = {"snapshot": None, "task": None, "error": None, "failed_at": float('-inf')}
+
+async def load(version):
+    try:
+        path = await build(version)
+        _state["snapshot"] = Snapshot(path)
+        _state["error"] = None
+        prune()
+    except Exception as e:
+        _state["error"] = str(e)
+        _state["failed_at"] = time.monotonic()
+        logger.warning(f"Could not load the serving snapshot for data version {version}; serving from SQL: {e}")
+
+async def start():
+    """Loads the snapshot for the current data version before the API takes traffic."""
+    if SERVING_MODE != "snapshot":
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    await load(await current_data_version())
+
+async def active():
+    """The snapshot to answer from, or None to use SQL.
+
+    A snapshot is only used while it matches the current data version; after a warehouse refresh, requests go to
+    SQL while the new snapshot is built in the background.
+    """
+    if SERVING_MODE != "snapshot":
+        return None
+    version = await current_data_version()
+    snapshot = _state["snapshot"]
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    idle = _state["task"] is None or _state["task"].done()
+    if idle and time.monotonic() - _state["failed_at"] >= SNAPSHOT_RETRY_SECONDS:
+        _state["task"] = asyncio.create_task(load(version))
+    return None
+
+def snapshot_status():
+    snapshot = _state["snapshot"]
+    return {
+        "mode": SERVING_MODE,
+        "version": snapshot.version if snapshot else None,
+        "built_at": snapshot.built_at if snapshot else None,
+        "error": _state["error"],
+    }
@@ -0,0 +1,177 @@
+"""Compares enrichment inference backends on the same images: load time, throughput and detection agreement.
+
+    python benchmarks/bench_inference.py --images-dir data/raw/telegram_images --backends torch,onnx --limit 200
+    python benchmarks/bench_inference.py --backends onnx --workers 4 --intra-op-threads 1
+
+The first backend is the reference: every other one must report the same classes per image (confidences may
+drift slightly between runtimes), or the script exits non-zero. --workers also times each backend through
+enrich_data's process pool. With --output the results are written in run_benchmarks.py's format, so compare.py
+can diff two runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from collections import Counter
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'scripts'))
+os.chdir(REPO_ROOT)
+os.makedirs('logs', exist_ok=True) # enrich_data logs to logs/scraper.log
+import enrich_data
+from run_benchmarks import git_revision
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp')
+
+def find_images(images_dir, limit):
+    paths = []
+    for root, _, files in os.walk(images_dir):
+        for file_name in sorted(files):
+            if file_name.lower().endswith(IMAGE_SUFFIXES):
+                paths.append(os.path.join(root, file_name))
+    return sorted(paths)[:limit]
+
+def decode_images(paths):
+    images = []
+    for i, path in enumerate(paths):
+        _, _, image, _, _, _ = enrich_data.decode_image(i, path)
+        if image is not None:
+            images.append(image)
+    return images
+
+def batches(images, batch_size):
+    return [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+
+def bench_backend(name, images, args):
+    """Times one backend in this process; returns (results, detections per image)."""
+    start = time.perf_counter()
+    backend = enrich_data.BACKENDS[name](args.model)
+    load_seconds = time.perf_counter() - start
+    backend.detect(images[:args.batch_size]) # Warm-up: first-call allocation and graph optimisation
+
+    detected, latencies = [], []
+    start = time.perf_counter()
+    for batch in batches(images, args.batch_size):
+        batch_start = time.perf_counter()
+        detected.extend(backend.detect(batch))
+        latencies.append((time.perf_counter() - batch_start) * 1000)
+    seconds = time.perf_counter() - start
+    return {
+        'load_seconds': load_seconds,
+        'seconds': seconds,
+        'images_per_second': len(images) / seconds,
+        'per_image_ms': seconds * 1000 / len(images),
+        'batch_p50_ms': statistics.median(latencies),
+        'batch_max_ms': max(latencies),
+    }, detected
+
+def bench_pool(name, images, args):
+    """Times one backend sharded across --workers processes, as enrich_data runs it with ENRICH_INFERENCE_WORKERS."""
+    inference = enrich_data.Inference(name, args.model, workers=args.workers)
+    try:
+        # Warm-up: one batch per worker, so every process has loaded its model before timing starts
+        for future in [inference.submit(images[:args.batch_size]) for _ in range(args.workers)]:
+            future.result()
+        start = time.perf_counter()
+        for future in [inference.submit(batch) for batch in batches(images, args.batch_size)]:
+            future.result()
+        seconds = time.perf_counter() - start
+    finally:
+        inference.close()
+    return {'seconds': seconds, 'images_per_second': len(images) / seconds, 'per_image_ms': seconds * 1000 / len(images)}
+
+def agreement(reference, candidate):
+    """Share of images with the same detected classes (with counts), and the confidence drift on those classes."""
+    matching, drifts = 0, []
+    for expected, actual in zip(reference, candidate):
+        expected_classes = Counter(d['class_name'] for d in expected)
+        if expected_classes != Counter(d['class_name'] for d in actual):
+            continue
+        matching += 1
+        for class_name in expected_classes:
+            pairs = zip(sorted(d['confidence'] for d in expected if d['class_name'] == class_name),
+                        sorted(d['confidence'] for d in actual if d['class_name'] == class_name))
+            drifts.extend(abs(a - b) for a, b in pairs)
+    return {
+        'matching_images': matching / len(reference) if reference else 1.0,
+        'confidence_drift_mean': statistics.mean(drifts) if drifts else 0.0,
+        'confidence_drift_max': max(drifts) if drifts else 0.0,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare enrichment inference backends on the same images.")
+    parser.add_argument('--images-dir', default=os.getenv('RAW_IMAGES_DIR', 'data/raw/telegram_images'))
+    parser.add_argument('--backends', default='torch,onnx', help=f"Comma-separated, reference first: {', '.join(enrich_data.BACKENDS)}.")
+    parser.add_argument('--model', default=enrich_data.ENRICH_MODEL)
+    parser.add_argument('--limit', type=int, default=200, help="Images to run through each backend.")
+    parser.add_argument('--batch-size', type=int, default=enrich_data.ENRICH_BATCH_SIZE)
+    parser.add_argument('--intra-op-threads', type=int, default=enrich_data.ENRICH_INTRA_OP_THREADS)
+    parser.add_argument('--inter-op-threads', type=int, default=enrich_data.ENRICH_INTER_OP_THREADS)
+    parser.add_argument('--workers', type=int, default=1, help="Also time each backend sharded across this many processes.")
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help="Share of images whose classes must match the reference (default 0.95).")
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--output', default=None, help="Write the results as JSON (e.g. into benchmarks/results/).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    unknown = set(names) - set(enrich_data.BACKENDS)
+    if unknown:
+        raise SystemExit(f"Unknown backends: {', '.join(sorted(unknown))}")
+    enrich_data.ENRICH_INTRA_OP_THREADS = args.intra_op_threads
+    enrich_data.ENRICH_INTER_OP_THREADS = args.inter_op_threads
+
+    images = decode_images(find_images(args.images_dir, args.limit))
+    if not images:
+        raise SystemExit(f"No readable images under {args.images_dir}")
+    print(f"{len(images)} images, batch size {args.batch_size}, intra-op threads {args.intra_op_threads or 'auto'}, "
+          f"inter-op threads {args.inter_op_threads or 'auto'}.")
+
+    results, reference = {}, None
+    for name in names:
+        results[name], detected = bench_backend(name, images, args)
+        if reference is None:
+            reference = detected
+        else:
+            results[name]['agreement'] = agreement(reference, detected)
+        if args.workers > 1:
+            results[f"{name}_x{args.workers}"] = bench_pool(name, images, args)
+
+    print(f"{'backend':<14} {'load s':>8} {'img/s':>9} {'ms/img':>8} {'agree':>7} {'drift':>7}")
+    for name, result in results.items():
+        match = result.get('agreement')
+        load = f"{result['load_seconds']:.2f}" if 'load_seconds' in result else ''
+        agree = f"{match['matching_images']:.1%}" if match else ''
+        drift = f"{match['confidence_drift_max']:.3f}" if match else ''
+        print(f"{name:<14} {load:>8} {result['images_per_second']:>9.1f} {result['per_image_ms']:>8.2f} {agree:>7} {drift:>7}")
+
+    if args.output:
+        commit, dirty = git_revision()
+        report = {
+            'label': args.label,
+            'commit': commit,
+            'dirty': dirty,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+            'corpus': {'messages': len(images), 'images_dir': args.images_dir},
+            'results': {'inference': results},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    disagreeing = [name for name, result in results.items()
+                   if result.get('agreement', {}).get('matching_images', 1.0) < args.min_agreement]
+    if disagreeing:
+        print(f"Detections of {', '.join(disagreeing)} match the reference on fewer than {args.min_agreement:.0%} of images.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
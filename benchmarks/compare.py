@@ -0,0 +1,78 @@
+"""Compares two run_benchmarks.py results files and exits non-zero when the candidate regressed.
+
+    python benchmarks/compare.py baseline.json candidate.json --threshold 0.10
+
+Metrics are judged by name: *_seconds and *_ms are better lower, *_per_second better higher; other values are
+shown for context only.
+"""
+import sys
+import json
+import argparse
+
+def flatten(results, prefix=''):
+    """{'api': {'/search': {'p95_ms': 3}}} -> {'api./search.p95_ms': 3}, numeric leaves only."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def direction(metric):
+    """-1 when lower is better, +1 when higher is better, 0 when the metric is informational."""
+    leaf = metric.rsplit('.', 1)[-1]
+    if leaf.endswith('_seconds') or leaf.endswith('_ms'):
+        return -1
+    if leaf.endswith('_per_second'):
+        return 1
+    return 0
+
+def compare(baseline, candidate, threshold):
+    """Returns [(metric, old, new, change, verdict)] for the metrics both runs report."""
+    old_metrics, new_metrics = flatten(baseline['results']), flatten(candidate['results'])
+    rows = []
+    for metric in sorted(set(old_metrics) & set(new_metrics)):
+        sign = direction(metric)
+        old, new = old_metrics[metric], new_metrics[metric]
+        if not sign or not old:
+            continue
+        change = (new - old) / old
+        improvement = change * sign
+        verdict = 'regressed' if improvement < -threshold else 'improved' if improvement > threshold else ''
+        rows.append((metric, old, new, change, verdict))
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare two benchmark results files.")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative change tolerated before a metric counts as regressed (default 0.10 = 10%%).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline.get('corpus', {}).get('messages') != candidate.get('corpus', {}).get('messages'):
+        print("Warning: the two runs used corpora of different sizes; absolute timings are not comparable.")
+
+    rows = compare(baseline, candidate, args.threshold)
+    print(f"baseline  {str(baseline.get('commit'))[:10]}  {baseline.get('label') or ''}")
+    print(f"candidate {str(candidate.get('commit'))[:10]}  {candidate.get('label') or ''}")
+    width = max((len(row[0]) for row in rows), default=10)
+    for metric, old, new, change, verdict in rows:
+        print(f"{metric:<{width}}  {old:>12.3f}  {new:>12.3f}  {change:>+8.1%}  {verdict}")
+
+    regressions = [row for row in rows if row[4] == 'regressed']
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}.")
+        sys.exit(1)
+    print("No regressions.")
+
+if __name__ == "__main__":
+    main()
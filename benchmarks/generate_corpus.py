@@ -0,0 +1,187 @@
+"""Synthetic Telegram corpus in the layout scrape_telegram.py writes.
+
+Messages go to <output-dir>/YYYY-MM-DD/<channel>.jsonl[.gz|.zst] with exactly the fields build_message_data()
+produces, and media to <images-dir>/<channel>/<file id>.jpg. Output is streamed, so 10M messages need no more
+memory than 10k, and the same --seed always produces the same corpus.
+"""
+import os
+import csv
+import gzip
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+try:
+    from PIL import Image
+except ImportError: # Only needed with --images
+    Image = None
+try:
+    import zstandard
+except ImportError: # Only needed with --compression zstd
+    zstandard = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DRUG_DICTIONARY = os.path.join(REPO_ROOT, 'scripts', 'drug_dictionary.csv')
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'data', 'telegram_messages')
+DEFAULT_IMAGES_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'data', 'telegram_images')
+CORPUS_SUMMARY_FILE = 'corpus.json'
+
+CHANNELS = ['CheMed Pharmacy', 'Lobelia Cosmetics', 'Tikvah Pharma', 'Addis Medical Supply', 'Yetebaberut Pharmacy',
+            'Hakim Drug Store', 'Betezata Pharma', 'Sheger Health Shop']
+TEMPLATES = [
+    "{product} {strength}mg available now, price {price} birr. Call 09{phone}",
+    "New stock: {product} and {product2}. {price} ETB per pack, delivery in Addis.",
+    "{product} አለ ዋጋ {price} ብር",
+    "Sorry, {product} is out of stock. {product2} in stock for {price}br",
+    "{product} {strength}mg x{count} tablets - ${usd}",
+    "Stay healthy this season! Visit our pharmacy for all your needs.",
+    "Pharmacist tip: take {product} after meals and drink plenty of water.",
+    "",
+]
+COMPRESSED_SUFFIXES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+def load_aliases(path=DRUG_DICTIONARY):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['alias'] for row in csv.DictReader(f)]
+
+def channel_username(channel_name):
+    return channel_name.replace(' ', '').lower()
+
+def message_text(rng, aliases):
+    template = rng.choice(TEMPLATES)
+    return template.format(
+        product=rng.choice(aliases).title(),
+        product2=rng.choice(aliases).title(),
+        strength=rng.choice([5, 10, 20, 250, 500, 1000]),
+        price=f"{rng.randint(20, 4000):,}",
+        usd=rng.randint(2, 60),
+        count=rng.choice([10, 20, 30]),
+        phone=rng.randint(10000000, 99999999),
+    )
+
+def open_output(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise SystemExit("--compression zstd requires the 'zstandard' package")
+        return zstandard.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+def render_image_pool(images_dir, count, rng, size=(640, 480)):
+    """Renders `count` distinct JPEGs once; messages link to them, so duplicate images occur as they do in real channels."""
+    if Image is None:
+        raise SystemExit("--images requires Pillow")
+    pool_dir = os.path.join(images_dir, '_pool')
+    os.makedirs(pool_dir, exist_ok=True)
+    pool = []
+    for i in range(count):
+        path = os.path.join(pool_dir, f"{i}.jpg")
+        if not os.path.exists(path):
+            image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+            # A few solid blocks so images differ in structure, not only in colour
+            for _ in range(4):
+                x, y = rng.randrange(size[0] - 80), rng.randrange(size[1] - 80)
+                image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 80, y + 80))
+            image.save(path, 'JPEG', quality=85)
+        pool.append(path)
+    return pool
+
+def place_image(source, target):
+    if os.path.exists(target):
+        return
+    try:
+        os.link(source, target) # Hard link: no extra disk space per message at large scales
+    except OSError:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            dst.write(src.read())
+
+def generate(messages=10000, channels=4, days=30, output_dir=DEFAULT_OUTPUT_DIR, images_dir=DEFAULT_IMAGES_DIR,
+             media_ratio=0.3, images=False, unique_images=200, compression=None, seed=7):
+    """Writes the corpus and returns its summary (also saved as corpus.json in output_dir)."""
+    rng = random.Random(seed)
+    aliases = load_aliases()
+    channel_names = [CHANNELS[i] if i < len(CHANNELS) else f"Synthetic Pharma {i}" for i in range(channels)]
+    pool = render_image_pool(images_dir, unique_images, rng) if images else []
+    suffix = COMPRESSED_SUFFIXES.get(compression, '.jsonl')
+    end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    start = end - timedelta(days=days)
+
+    summary = {'messages': 0, 'media_messages': 0, 'images_written': 0, 'channels': channels, 'days': days,
+               'files': 0, 'bytes': 0, 'seed': seed, 'compression': compression, 'output_dir': output_dir,
+               'images_dir': images_dir}
+    per_channel = [messages // channels + (1 if i < messages % channels else 0) for i in range(channels)]
+    for channel_index, channel_name in enumerate(channel_names):
+        channel_id = 1000000000 + channel_index
+        username = channel_username(channel_name)
+        file_stem = channel_name.replace(' ', '_').replace('/', '')
+        channel_image_dir = os.path.join(images_dir, channel_name.replace(' ', '_'))
+        if images:
+            os.makedirs(channel_image_dir, exist_ok=True)
+        count = per_channel[channel_index]
+        per_day = [count // days + (1 if d < count % days else 0) for d in range(days)]
+        message_id = 0
+        for day in range(days):
+            if not per_day[day]:
+                continue
+            day_start = start + timedelta(days=day)
+            day_dir = os.path.join(output_dir, day_start.strftime('%Y-%m-%d'))
+            os.makedirs(day_dir, exist_ok=True)
+            path = os.path.join(day_dir, f"{file_stem}{suffix}")
+            # Sorted offsets keep message ids increasing with message dates, as Telegram assigns them
+            offsets = sorted(rng.randrange(86400) for _ in range(per_day[day]))
+            with open_output(path, compression) as f:
+                for offset in offsets:
+                    message_id += 1
+                    has_media = rng.random() < media_ratio
+                    media_path = None
+                    if has_media:
+                        file_id = 5000000000000000000 + channel_index * 10 ** 12 + message_id
+                        media_path = os.path.join(channel_image_dir, f"{file_id}.jpg")
+                        if images:
+                            place_image(rng.choice(pool), media_path)
+                            summary['images_written'] += 1
+                        summary['media_messages'] += 1
+                    message = {
+                        'message_id': message_id,
+                        'date': (day_start + timedelta(seconds=offset)).isoformat(),
+                        'text': message_text(rng, aliases),
+                        'sender_id': -channel_id,
+                        'views': rng.randint(50, 20000),
+                        'media_path': media_path,
+                        'media_type': 'photo' if has_media else None,
+                        'is_sponsored': False,
+                        'replies_count': rng.randint(0, 20),
+                        'forwards': rng.randint(0, 200),
+                        'post_channel_id': channel_id,
+                        'post_channel_name': channel_name,
+                        'message_link': f"https://t.me/{username}/{message_id}"
+                    }
+                    f.write(json.dumps(message, ensure_ascii=False) + '\n')
+            summary['files'] += 1
+            summary['bytes'] += os.path.getsize(path)
+        summary['messages'] += message_id
+
+    with open(os.path.join(output_dir, CORPUS_SUMMARY_FILE), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Telegram corpus in the scraper's output format.")
+    parser.add_argument('--messages', type=int, default=10000, help="Total messages across all channels.")
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--days', type=int, default=30, help="Days of history; one partition directory per day.")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--images-dir', default=DEFAULT_IMAGES_DIR)
+    parser.add_argument('--media-ratio', type=float, default=0.3, help="Fraction of messages with a photo.")
+    parser.add_argument('--images', action='store_true', help="Write placeholder JPEGs for media messages (needs Pillow).")
+    parser.add_argument('--unique-images', type=int, default=200, help="Distinct images the media messages share.")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--seed', type=int, default=7)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = generate(args.messages, args.channels, args.days, args.output_dir, args.images_dir, args.media_ratio,
+                       args.images, args.unique_images, args.compression, args.seed)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,296 @@
+"""Timed benchmarks for each pipeline stage against a local Postgres, written to a JSON results file.
+
+    docker compose up -d db
+    python benchmarks/run_benchmarks.py --messages 100000 --stages loader,dbt,extract,enrich,api
+    python benchmarks/compare.py benchmarks/results/<baseline>.json benchmarks/results/<candidate>.json
+
+Stages run the real scripts as subprocesses with RAW_DATA_DIR/RAW_IMAGES_DIR pointed at the synthetic corpus.
+Connection settings come from the usual POSTGRES_* variables (.env is read too).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from dotenv import load_dotenv
+from generate_corpus import generate, DEFAULT_OUTPUT_DIR, DEFAULT_IMAGES_DIR, CORPUS_SUMMARY_FILE
+
+load_dotenv()
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(REPO_ROOT, 'benchmarks')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+DBT_PROJECT_DIR = os.path.join(REPO_ROOT, 'dbt_project')
+STAGES = ['loader', 'dbt', 'extract', 'enrich', 'api']
+
+# Requests the API benchmark sends; each is timed separately
+API_ENDPOINTS = [
+    "/top-products",
+    "/product-availability?product_name=paracetamol",
+    "/channel-visual-content",
+    "/posting-trends?grain=day",
+    "/posting-trends?grain=month",
+    "/posting-trends?grain=day&channel=Tikvah+Pharma&start_date=2024-12-01&end_date=2024-12-31",
+    "/search?q=paracetamol",
+    "/search?q=amoxicilin&fuzzy=true",
+]
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv('POSTGRES_DB'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        host=os.getenv('POSTGRES_HOST', 'localhost'),
+        port=os.getenv('POSTGRES_PORT', '5432')
+    )
+
+def wait_for_database(timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            get_connection().close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+def reset_tables(statements):
+    """Drops or truncates stage outputs so every run starts from the same state."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            for statement in statements:
+                cur.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+def run_timed(name, command, env, log_dir):
+    """Runs one command, logging its output to <log_dir>/<name>.log; returns (seconds, ok)."""
+    os.makedirs(log_dir, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(log_dir, f"{name}.log"), 'w') as log:
+        result = subprocess.run(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start
+    status = 'ok' if result.returncode == 0 else f'exit code {result.returncode}'
+    print(f"  {name}: {seconds:.2f}s ({status})")
+    return seconds, result.returncode == 0
+
+def stage_env(corpus):
+    env = dict(os.environ)
+    env.update({
+        'RAW_DATA_DIR': corpus['output_dir'],
+        'RAW_IMAGES_DIR': corpus['images_dir'],
+        'POSTGRES_HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'POSTGRES_PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+def bench_loader(corpus, env, args):
+    reset_tables(["DROP TABLE IF EXISTS raw.telegram_messages", "DROP TABLE IF EXISTS raw.load_manifest"])
+    command = [sys.executable, 'scripts/load_to_postgress.py', '--mode', 'bulk', '--workers', str(args.loader_workers)]
+    cold, ok = run_timed('loader_cold', command, env, args.log_dir)
+    # Second pass: every file is in the manifest, so this measures the no-op rescan
+    rerun, rerun_ok = run_timed('loader_rerun', command, env, args.log_dir)
+    return {
+        'cold_seconds': cold,
+        'messages_per_second': corpus['messages'] / cold if ok else None,
+        'megabytes_per_second': corpus['bytes'] / 1e6 / cold if ok else None,
+        'rerun_seconds': rerun,
+        'ok': ok and rerun_ok,
+    }
+
+def bench_dbt(corpus, env, args):
+    base = ['dbt', 'run', '--project-dir', DBT_PROJECT_DIR, '--profiles-dir', DBT_PROJECT_DIR]
+    if not os.path.isdir(os.path.join(DBT_PROJECT_DIR, 'dbt_packages')):
+        run_timed('dbt_deps', ['dbt', 'deps', '--project-dir', DBT_PROJECT_DIR, '--profiles-dir', DBT_PROJECT_DIR],
+                  env, args.log_dir)
+    full, ok = run_timed('dbt_full_refresh', base + ['--full-refresh'], env, args.log_dir)
+    incremental, incremental_ok = run_timed('dbt_incremental', base, env, args.log_dir)
+    return {
+        'full_refresh_seconds': full,
+        'messages_per_second': corpus['messages'] / full if ok else None,
+        'incremental_noop_seconds': incremental,
+        'ok': ok and incremental_ok,
+    }
+
+def bench_extract(corpus, env, args):
+    seconds, ok = run_timed('extract_products', [sys.executable, 'scripts/extract_products.py', '--full-refresh'],
+                            env, args.log_dir)
+    return {'seconds': seconds, 'messages_per_second': corpus['messages'] / seconds if ok else None, 'ok': ok}
+
+def bench_enrich(corpus, env, args):
+    if not corpus['images_written']:
+        return {'skipped': "corpus has no images; generate it with --images"}
+    reset_tables(["DROP TABLE IF EXISTS image_detections", "DROP TABLE IF EXISTS detection_cache"])
+    env = dict(env)
+    # Stub ultralytics first on the path: the real model is not what this benchmark measures
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [STUBS_DIR, env.get('PYTHONPATH')]))
+    env['BENCH_STUB_INFERENCE_MS'] = str(args.stub_inference_ms)
+    os.makedirs(os.path.join(REPO_ROOT, 'logs'), exist_ok=True)
+    seconds, ok = run_timed('enrich', [sys.executable, 'scripts/enrich_data.py'], env, args.log_dir)
+    return {
+        'seconds': seconds,
+        'images_per_second': corpus['images_written'] / seconds if ok else None,
+        'stub_delay_per_image': args.stub_inference_ms / 1000,
+        'ok': ok,
+    }
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def timed_request(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def bench_api(corpus, env, args):
+    env = dict(env)
+    if not args.api_cache:
+        env['CACHE_TTL_SECONDS'] = '0' # Every request reaches Postgres; entries expire as they are stored
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port),
+                               '--workers', str(args.api_workers), '--log-level', 'warning'],
+                              cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while timed_request(f"{base_url}/ready")[1] is False:
+            if time.monotonic() > deadline or server.poll() is not None:
+                return {'ok': False, 'error': "API did not become ready"}
+            time.sleep(0.5)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=args.api_concurrency) as pool:
+            for endpoint in API_ENDPOINTS:
+                url = base_url + endpoint
+                timed_request(url) # Warm-up: connection pool and plan cache
+                start = time.perf_counter()
+                samples = list(pool.map(timed_request, [url] * args.api_requests))
+                wall = time.perf_counter() - start
+                latencies = [ms for ms, ok in samples if ok]
+                results[endpoint] = {
+                    'requests_per_second': len(samples) / wall,
+                    'p50_ms': statistics.median(latencies) if latencies else None,
+                    'p95_ms': percentile(latencies, 0.95) if latencies else None,
+                    'p99_ms': percentile(latencies, 0.99) if latencies else None,
+                    'errors': len(samples) - len(latencies),
+                }
+                print(f"  {endpoint}: {results[endpoint]['requests_per_second']:.1f} req/s, "
+                      f"p95 {results[endpoint]['p95_ms'] or 0:.1f} ms, {results[endpoint]['errors']} errors")
+        return {'concurrency': args.api_concurrency, 'requests': args.api_requests, 'cache': args.api_cache,
+                'endpoints': results}
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+BENCHMARKS = {'loader': bench_loader, 'dbt': bench_dbt, 'extract': bench_extract, 'enrich': bench_enrich, 'api': bench_api}
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=REPO_ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def load_or_generate_corpus(args):
+    summary_path = os.path.join(args.corpus_dir, CORPUS_SUMMARY_FILE)
+    if os.path.exists(summary_path) and not args.regenerate:
+        with open(summary_path) as f:
+            corpus = json.load(f)
+        matches = (corpus['messages'], corpus['channels'], corpus['days'], corpus['seed']) == \
+            (args.messages, args.channels, args.days, args.seed)
+        if matches and (corpus['images_written'] or not args.images):
+            print(f"Reusing corpus of {corpus['messages']} messages in {args.corpus_dir}.")
+            return corpus
+    print(f"Generating a corpus of {args.messages} messages in {args.corpus_dir}...")
+    return generate(messages=args.messages, channels=args.channels, days=args.days, output_dir=args.corpus_dir,
+                    images_dir=args.images_dir, images=args.images, compression=args.compression, seed=args.seed)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic corpus.")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated subset of: {', '.join(STAGES)}.")
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--images', action='store_true', help="Write placeholder images (required for the enrich stage).")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--corpus-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--images-dir', default=DEFAULT_IMAGES_DIR)
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate the corpus even if a matching one exists.")
+    parser.add_argument('--loader-workers', type=int, default=4)
+    parser.add_argument('--stub-inference-ms', type=float, default=0.0, help="Simulated model latency per image.")
+    parser.add_argument('--api-concurrency', type=int, default=16)
+    parser.add_argument('--api-requests', type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument('--api-workers', type=int, default=1, help="uvicorn worker processes.")
+    parser.add_argument('--api-cache', action='store_true', help="Leave the response cache on.")
+    parser.add_argument('--start-db', action='store_true', help="Run `docker compose up -d db` first.")
+    parser.add_argument('--label', default=None, help="Free-form label stored in the results file.")
+    parser.add_argument('--output', default=None, help="Results file (default: benchmarks/results/<commit>-<time>.json).")
+    args = parser.parse_args()
+    args.log_dir = os.path.join(RESULTS_DIR, 'logs')
+    return args
+
+def main():
+    args = parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    if args.start_db:
+        subprocess.run(['docker', 'compose', 'up', '-d', 'db'], cwd=REPO_ROOT, check=True)
+    wait_for_database()
+
+    corpus = load_or_generate_corpus(args)
+    env = stage_env(corpus)
+    commit, dirty = git_revision()
+    report = {
+        'label': args.label,
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'corpus': corpus,
+        'results': {},
+    }
+    for stage in STAGES:
+        if stage in stages:
+            print(f"[{stage}]")
+            report['results'][stage] = BENCHMARKS[stage](corpus, env, args)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{(commit or 'unknown')[:10]}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""The warehouse data version: a single row in public.data_version that the API's response cache is keyed on.
+
+Every writer whose output the API serves bumps it when it finishes: enrich_data.py and extract_products.py through
+mark_data_version(), and dbt through its on-run-end hook. The table is defined here only; the loader creates it
+with the raw tables, so it exists before dbt's first run.
+"""
+import uuid
+
+DATA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS public.data_version (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        build_id TEXT NOT NULL,
+        source TEXT,
+        built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+def create_data_version_table(cursor):
+    cursor.execute(DATA_VERSION_DDL)
+
+def mark_data_version(conn, source):
+    """Bumps public.data_version so the API's response cache drops results computed before this write."""
+    with conn.cursor() as cur:
+        create_data_version_table(cur)
+        cur.execute("""
+            INSERT INTO public.data_version (build_id, source) VALUES (%s, %s)
+            ON CONFLICT (id) DO UPDATE SET build_id = EXCLUDED.build_id, source = EXCLUDED.source, built_at = now();
+        """, (f"{source}-{uuid.uuid4()}", source))
+    conn.commit()
@@ -0,0 +1,234 @@
+"""Shared instrumentation for the pipeline scripts and the API: timing spans, counters, gauges and histograms.
+
+Batch jobs wrap their run in job(), which dumps every metric to METRICS_DIR as JSON when the job ends; the API
+serves the same registry in Prometheus text format at /metrics. Metrics are per process: worker processes report
+their figures back to the parent, which records them.
+
+Set PROFILE_SAMPLE_INTERVAL_MS to also sample every thread's stack during a job (or the API's lifetime). The profile
+is written next to the metrics dump in collapsed-stack format, which flamegraph.pl and speedscope read.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter as StackCounts
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_DIR = os.getenv('METRICS_DIR', 'logs/metrics')
+METRICS_LOG_SPANS = os.getenv('METRICS_LOG_SPANS', '').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '0')) # 0 disables the profiler
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_registry = {}
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield '', dict(key), value
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def set_max(self, value, **labels):
+        """Keeps the highest value seen, for peaks such as queue depth."""
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield '', dict(key), value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            entry = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'max': value})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+            entry['max'] = max(entry['max'], value)
+
+    def samples(self):
+        for key, entry in self.values.items():
+            labels = dict(key)
+            for bound, count in zip(self.buckets, entry['buckets']):
+                yield '_bucket', {**labels, 'le': repr(float(bound))}, count
+            yield '_bucket', {**labels, 'le': '+Inf'}, entry['count']
+            yield '_sum', labels, entry['sum']
+            yield '_count', labels, entry['count']
+
+def _get_or_create(cls, name, description, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, description, **kwargs)
+    if not isinstance(metric, cls):
+        raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}")
+    return metric
+
+def counter(name, description):
+    return _get_or_create(Counter, name, description)
+
+def gauge(name, description):
+    return _get_or_create(Gauge, name, description)
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, description, buckets=buckets)
+
+SPAN_SECONDS = histogram('span_duration_seconds', "Wall time of instrumented code blocks, by span name.")
+
+@contextmanager
+def span(name, **labels):
+    """Times a block into span_duration_seconds{span=name, ...}; also logged as JSON when METRICS_LOG_SPANS is set."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        SPAN_SECONDS.observe(seconds, span=name, **labels)
+        if METRICS_LOG_SPANS:
+            logger.info(json.dumps({'span': name, 'seconds': round(seconds, 6), **labels}, default=str))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def render_prometheus():
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """Every registered metric as plain data, for the end-of-job JSON dump."""
+    data = {}
+    with _lock:
+        for metric in _registry.values():
+            values = []
+            for key, value in metric.values.items():
+                if metric.kind == 'histogram':
+                    value = {'count': value['count'], 'sum': value['sum'], 'max': value['max'],
+                             'mean': value['sum'] / value['count'] if value['count'] else 0.0}
+                values.append({'labels': dict(key), 'value': value})
+            data[metric.name] = {'type': metric.kind, 'description': metric.description, 'values': values}
+    return data
+
+def _output_path(job_name, suffix):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    return os.path.join(METRICS_DIR, f"{job_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+def dump(job_name):
+    """Writes the metrics snapshot to METRICS_DIR and logs the time spent per span."""
+    path = _output_path(job_name, '.metrics.json')
+    data = snapshot()
+    with open(path, 'w') as f:
+        json.dump({'job': job_name, 'created_at': datetime.now().isoformat(), 'metrics': data}, f, indent=2, default=str)
+    for entry in data.get(SPAN_SECONDS.name, {}).get('values', []):
+        labels = ', '.join(f"{k}={v}" for k, v in entry['labels'].items())
+        stats = entry['value']
+        logger.info(f"[{job_name}] {labels}: {stats['count']} x, {stats['sum']:.3f}s total, {stats['mean'] * 1000:.1f} ms mean")
+    logger.info(f"[{job_name}] Metrics written to {path}")
+    return path
+
+class SamplingProfiler:
+    """Samples the stack of every other thread at a fixed interval on a daemon thread.
+
+    Stacks are aggregated by function (file:function), so the output stays small however long the job runs.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = StackCounts()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, job_name):
+        self._stop.set()
+        self._thread.join()
+        path = _output_path(job_name, '.profile.txt')
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"[{job_name}] {sum(self.stacks.values())} profile samples written to {path}")
+        return path
+
+def start_profiler():
+    """Starts the sampling profiler if PROFILE_SAMPLE_INTERVAL_MS is set; returns it, or None."""
+    if PROFILE_SAMPLE_INTERVAL_MS <= 0:
+        return None
+    profiler = SamplingProfiler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    profiler.start()
+    return profiler
+
+@contextmanager
+def job(job_name):
+    """Wraps a batch job: times it as a span, profiles it when enabled, and dumps the metrics when it ends."""
+    profiler = start_profiler()
+    try:
+        with span('job', job=job_name):
+            yield
+    finally:
+        if profiler:
+            profiler.stop(job_name)
+        dump(job_name)
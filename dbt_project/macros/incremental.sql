@@ -0,0 +1,11 @@
+{#
+    Incremental filter on stg_telegram_messages: on incremental runs, keeps only the rows scraped after
+    the latest watermark already stored in the model's own table. Full refreshes read everything.
+#}
+{% macro scraped_after_watermark(watermark_column='scraped_at') %}
+    {% if is_incremental() %}
+    WHERE scraped_at > (SELECT COALESCE(MAX({{ watermark_column }}), '-infinity') FROM {{ this }})
+    {% else %}
+    WHERE TRUE
+    {% endif %}
+{% endmacro %}
@@ -0,0 +1,40 @@
+-- Per-channel media and detected-object rollup; detected_objects is unnested once here instead of on every request.
+-- Like the original /channel-visual-content query, it covers only media messages with detected objects: the counts
+-- are over those messages, and channels without any are left out.
+WITH visual_messages AS (
+    SELECT channel_sk, message_id, has_media, detected_objects
+    FROM {{ ref('fct_messages') }}
+    WHERE has_media = TRUE AND detected_objects IS NOT NULL
+),
+
+message_counts AS (
+    SELECT
+        channel_sk,
+        COUNT(message_id) AS total_messages,
+        COUNT(CASE WHEN has_media = TRUE THEN message_id END) AS messages_with_media,
+        COALESCE(SUM(jsonb_array_length(detected_objects)), 0) AS total_detected_objects
+    FROM visual_messages
+    GROUP BY channel_sk
+),
+
+detected_classes AS (
+    SELECT
+        vm.channel_sk,
+        jsonb_agg(DISTINCT obj->>'class_name') AS distinct_detected_classes
+    FROM visual_messages vm
+    CROSS JOIN LATERAL jsonb_array_elements(vm.detected_objects) AS obj
+    GROUP BY vm.channel_sk
+)
+
+SELECT
+    dc.channel_sk,
+    dc.channel_name,
+    mc.total_messages,
+    mc.messages_with_media,
+    mc.total_detected_objects,
+    COALESCE(cls.distinct_detected_classes, '[]'::jsonb) AS distinct_detected_classes
+FROM {{ ref('dim_channels') }} dc
+JOIN message_counts mc
+    ON dc.channel_sk = mc.channel_sk
+LEFT JOIN detected_classes cls
+    ON dc.channel_sk = cls.channel_sk
@@ -0,0 +1,19 @@
+{{
+    config(
+        post_hook=[
+            "CREATE INDEX IF NOT EXISTS {{ this.name }}_channel_day_idx ON {{ this }} (channel_sk, date_day)",
+            "CREATE INDEX IF NOT EXISTS {{ this.name }}_day_idx ON {{ this }} (date_day)"
+        ]
+    )
+}}
+
+-- Daily posting volume per channel, so /posting-trends reads one row per channel-day instead of scanning fct_messages.
+SELECT
+    fm.channel_sk,
+    fm.date_sk,
+    dd.date_day,
+    COUNT(fm.message_id) AS posting_volume
+FROM {{ ref('fct_messages') }} fm
+JOIN {{ ref('dim_dates') }} dd
+    ON fm.date_sk = dd.date_sk
+GROUP BY fm.channel_sk, fm.date_sk, dd.date_day
@@ -0,0 +1,72 @@
+{{
+    config(
+        post_hook=[
+            "CREATE INDEX IF NOT EXISTS {{ this.name }}_product_channel_idx ON {{ this }} (product, channel_sk)",
+            "CREATE INDEX IF NOT EXISTS {{ this.name }}_day_channel_idx ON {{ this }} (date_day, channel_sk)"
+        ]
+    )
+}}
+
+{#- Product mentions per product, channel and day, so /top-products and /product-availability read one row per
+    product-channel-day instead of product_mentions, which grows with the fact table.
+
+    Reposts count once, and a repost group can span channels and days, so a cell's distinct-group count could not
+    be summed across cells. Each group is counted in one cell instead, the one holding its first mention of the
+    product: mention_count for /top-products (first mention anywhere), channel_mention_count for the per-channel
+    /product-availability (first mention in that channel). Prices and availability roll up with MIN/MAX/BOOL_OR.
+
+    product_mentions is written by extract_products.py, which reads fct_messages, so it only exists once
+    extraction has run; run_pipeline.py rebuilds this model after extraction. -#}
+{%- set product_mentions = adapter.get_relation(database=target.database, schema='public', identifier='product_mentions') -%}
+
+{% if product_mentions %}
+WITH mentions AS (
+    SELECT
+        product,
+        channel_sk,
+        message_date,
+        price,
+        currency,
+        available,
+        ROW_NUMBER() OVER (
+            PARTITION BY product, COALESCE(duplicate_group_id, message_id)
+            ORDER BY message_date NULLS LAST, message_id
+        ) AS group_rank,
+        ROW_NUMBER() OVER (
+            PARTITION BY product, COALESCE(duplicate_group_id, message_id), channel_sk
+            ORDER BY message_date NULLS LAST, message_id
+        ) AS channel_group_rank
+    FROM {{ product_mentions }}
+)
+
+SELECT
+    m.product,
+    m.channel_sk,
+    dd.date_sk,
+    m.message_date AS date_day,
+    COUNT(CASE WHEN m.group_rank = 1 THEN 1 END) AS mention_count,
+    COUNT(CASE WHEN m.channel_group_rank = 1 THEN 1 END) AS channel_mention_count,
+    BOOL_OR(m.available IS TRUE) AS is_available_mention,
+    BOOL_OR(m.price IS NOT NULL) AS has_price_mention,
+    MIN(m.price) AS min_price,
+    MAX(m.price) AS max_price,
+    MIN(m.currency) AS currency
+FROM mentions m
+LEFT JOIN {{ ref('dim_dates') }} dd
+    ON m.message_date = dd.date_day
+GROUP BY m.product, m.channel_sk, dd.date_sk, m.message_date
+{% else %}
+SELECT
+    NULL::TEXT AS product,
+    NULL::TEXT AS channel_sk,
+    NULL::TEXT AS date_sk,
+    NULL::DATE AS date_day,
+    0::BIGINT AS mention_count,
+    0::BIGINT AS channel_mention_count,
+    NULL::BOOLEAN AS is_available_mention,
+    NULL::BOOLEAN AS has_price_mention,
+    NULL::NUMERIC(12, 2) AS min_price,
+    NULL::NUMERIC(12, 2) AS max_price,
+    NULL::TEXT AS currency
+WHERE FALSE
+{% endif %}
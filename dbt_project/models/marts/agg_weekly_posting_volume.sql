@@ -0,0 +1,16 @@
+{{
+    config(
+        post_hook="CREATE INDEX IF NOT EXISTS {{ this.name }}_channel_week_idx ON {{ this }} (channel_sk, year, week_of_year)"
+    )
+}}
+
+-- Weekly posting volume per channel, keyed like dim_dates (year, week_of_year).
+SELECT
+    fm.channel_sk,
+    dd.year,
+    dd.week_of_year,
+    COUNT(fm.message_id) AS posting_volume
+FROM {{ ref('fct_messages') }} fm
+JOIN {{ ref('dim_dates') }} dd
+    ON fm.date_sk = dd.date_sk
+GROUP BY fm.channel_sk, dd.year, dd.week_of_year
@@ -1,5 +1,17 @@
-SELECT DISTINCT
+{{
+    config(
+        materialized='incremental',
+        unique_key='channel_sk',
+        incremental_strategy='delete+insert',
+        post_hook="CREATE UNIQUE INDEX IF NOT EXISTS dim_channels_channel_name_idx ON {{ this }} (channel_name)"
+    )
+}}
+
+SELECT
     {{ dbt_utils.surrogate_key(['channel_name']) }} AS channel_sk,
-    channel_name
+    channel_name,
+    MAX(scraped_at) AS last_scraped_at
 FROM {{ ref('stg_telegram_messages') }}
-WHERE channel_name IS NOT NULL
\ No newline at end of file
+{{ scraped_after_watermark('last_scraped_at') }}
+    AND channel_name IS NOT NULL
+GROUP BY channel_name
@@ -1,4 +1,44 @@
-WITH date_spine AS (
+{{
+    config(
+        materialized='incremental',
+        unique_key='date_sk',
+        incremental_strategy='delete+insert',
+        post_hook=[
+            "UPDATE {{ this }}
+            SET is_current_day = (date_day = CURRENT_DATE),
+                is_yesterday = (date_day = CURRENT_DATE - 1)
+            WHERE is_current_day OR is_yesterday OR date_day >= CURRENT_DATE - 1",
+            "CREATE UNIQUE INDEX IF NOT EXISTS dim_dates_date_day_idx ON {{ this }} (date_day) INCLUDE (date_sk)"
+        ]
+    )
+}}
+
+-- One scan of the new staging rows for both bounds. Incremental runs extend the spine from the day after the
+-- current last day (so no gap is left) to the newest message; the post-hook keeps the current/yesterday flags fresh.
+WITH new_messages AS (
+    SELECT
+        MIN(message_timestamp)::date AS min_day,
+        MAX(message_timestamp)::date AS max_day,
+        MAX(scraped_at) AS last_scraped_at
+    FROM {{ ref('stg_telegram_messages') }}
+    {{ scraped_after_watermark('last_scraped_at') }}
+),
+
+bounds AS (
+    SELECT
+        {% if is_incremental() %}
+        LEAST(n.min_day, (SELECT MAX(date_day) FROM {{ this }}) + 1) AS start_day,
+        GREATEST(n.max_day, (SELECT MAX(date_day) FROM {{ this }})) AS end_day,
+        {% else %}
+        n.min_day AS start_day,
+        n.max_day AS end_day,
+        {% endif %}
+        n.last_scraped_at
+    FROM new_messages n
+    WHERE n.max_day IS NOT NULL
+),
+
+date_spine AS (
     SELECT
         date::date AS date_day,
         EXTRACT(YEAR FROM date) AS year,
@@ -11,14 +51,14 @@ WITH date_spine AS (
         TO_CHAR(date, 'Month') AS month_name,
         CAST(date AS DATE) = CURRENT_DATE AS is_current_day,
         CAST(date AS DATE) = (CURRENT_DATE - INTERVAL '1 day') AS is_yesterday,
-        CASE WHEN EXTRACT(DOW FROM date) IN (0, 6) THEN TRUE ELSE FALSE END AS is_weekend
-    FROM (
-        SELECT GENERATE_SERIES(
-            (SELECT MIN(message_timestamp) FROM {{ ref('stg_telegram_messages') }})::date,
-            (SELECT MAX(message_timestamp) FROM {{ ref('stg_telegram_messages') }})::date + INTERVAL '1 day',
-            '1 day'::interval
-        ) AS date
-    ) AS dates
+        CASE WHEN EXTRACT(DOW FROM date) IN (0, 6) THEN TRUE ELSE FALSE END AS is_weekend,
+        b.last_scraped_at
+    FROM bounds b
+    CROSS JOIN LATERAL GENERATE_SERIES(
+        b.start_day,
+        b.end_day + INTERVAL '1 day',
+        '1 day'::interval
+    ) AS date
 )
 
 SELECT
@@ -34,5 +74,6 @@ SELECT
     month_name,
     is_current_day,
     is_yesterday,
-    is_weekend
-FROM date_spine
\ No newline at end of file
+    is_weekend,
+    last_scraped_at
+FROM date_spine
@@ -1,3 +1,92 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['message_id', 'channel_sk'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        post_hook=[
+            "CREATE INDEX IF NOT EXISTS fct_messages_content_fts_idx ON {{ this }} USING GIN (to_tsvector('simple', COALESCE(message_content, '')))",
+            "CREATE INDEX IF NOT EXISTS fct_messages_content_trgm_idx ON {{ this }} USING GIN (message_content gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS fct_messages_channel_date_idx ON {{ this }} (channel_sk, date_sk)",
+            "CREATE INDEX IF NOT EXISTS fct_messages_date_idx ON {{ this }} (date_sk)"
+        ]
+    )
+}}
+
+{#- Search indexes: full-text (ranked word search) and trigram (substring ILIKE and fuzzy matching) over message_content.
+    The tsvector is an expression index rather than a stored generated column, so delete+insert runs, which copy
+    the target's columns from the temp relation, keep working. Queries must use the same expression. -#}
+
+{#- API filters: channel_sk equality plus a date_sk set from dim_dates, served by the (channel_sk, date_sk) index;
+    date-only filters use the date_sk index. -#}
+
+{#- Detections live in the enrichment script's image_detections side table, so they survive rebuilds; this model is
+    the only writer of fct_messages. Incremental runs also re-select the messages whose detections were recorded
+    after the newest detections_processed_at already built. The table only exists once enrichment has run. -#}
+
+{#- Reposts are grouped by the dedup_messages script into message_duplicates (also only there once it has run).
+    Enrichment only runs for a group's representative, so a message with media takes its detections from
+    duplicate_group_id, and detections recorded for a representative re-select the whole group. Messages
+    (re)grouped after the newest grouped_at already built are re-selected too, so a `dedup_messages.py
+    --full-refresh` that reassigns groups reaches this table. A table built before grouping existed has no
+    grouped_at: its first run re-selects every row, so duplicate_group_id is filled in everywhere. -#}
+{%- set image_detections = adapter.get_relation(database=target.database, schema='public', identifier='image_detections') -%}
+{%- set message_duplicates = adapter.get_relation(database=target.database, schema='public', identifier='message_duplicates') -%}
+{%- set existing_columns = (adapter.get_columns_in_relation(this) | map(attribute='name') | list) if is_incremental() else [] -%}
+{%- set has_detection_watermark = 'detections_processed_at' in existing_columns -%}
+{%- set needs_group_backfill = is_incremental() and 'grouped_at' not in existing_columns -%}
+{%- set detection_watermark -%}
+    {% if has_detection_watermark %}(SELECT COALESCE(MAX(detections_processed_at), '-infinity') FROM {{ this }}){% else %}'-infinity'{% endif %}
+{%- endset -%}
+{%- set grouping_watermark -%}
+    (SELECT COALESCE(MAX(grouped_at), '-infinity') FROM {{ this }})
+{%- endset -%}
+
+WITH new_messages AS (
+    SELECT *
+    FROM {{ ref('stg_telegram_messages') }}
+    {%- if needs_group_backfill %}
+    WHERE TRUE
+    {%- else %}
+    {{ scraped_after_watermark('scraped_at') }}
+    {%- endif %}
+    {%- if is_incremental() and not needs_group_backfill and (image_detections or message_duplicates) %}
+       OR message_id IN (
+           {%- if image_detections %}
+           SELECT message_id
+           FROM {{ image_detections }}
+           WHERE processed_at > {{ detection_watermark }}
+           {%- if message_duplicates %}
+           UNION
+           SELECT dup.message_id
+           FROM {{ message_duplicates }} dup
+           JOIN {{ image_detections }} det
+               ON det.message_id = dup.duplicate_group_id
+           WHERE det.processed_at > {{ detection_watermark }}
+           UNION
+           {%- endif %}
+           {%- endif %}
+           {%- if message_duplicates %}
+           SELECT message_id
+           FROM {{ message_duplicates }}
+           WHERE processed_at > {{ grouping_watermark }}
+           {%- endif %}
+       )
+    {%- endif %}
+)
+
+{%- if image_detections %},
+
+latest_detections AS (
+    SELECT DISTINCT ON (message_id)
+        message_id,
+        detected_objects,
+        processed_at
+    FROM {{ image_detections }}
+    ORDER BY message_id, processed_at DESC
+)
+{%- endif %}
+
 SELECT
     m.message_id,
     c.channel_sk,
@@ -12,11 +101,25 @@ SELECT
     m.media_path,
     m.entities,
     LENGTH(m.message_content) AS message_length,
-    -- Placeholder for enriched data (e.g., YOLO object detection results)
-    NULL AS detected_objects,
+    -- Duplicate group: the representative's message_id, the message's own when it isn't a repost
+    {% if message_duplicates %}COALESCE(dup.duplicate_group_id, m.message_id){% else %}m.message_id{% endif %}::BIGINT AS duplicate_group_id,
+    {% if message_duplicates %}COALESCE(dup.duplicate_group_id <> m.message_id, FALSE){% else %}FALSE{% endif %} AS is_duplicate,
+    -- Enriched data (YOLO object detection results)
+    {% if image_detections %}CASE WHEN m.has_media AND jsonb_array_length(det.detected_objects) > 0 THEN det.detected_objects END{% else %}NULL::JSONB{% endif %} AS detected_objects,
+    {% if image_detections %}det.processed_at{% else %}NULL::TIMESTAMPTZ{% endif %} AS detections_processed_at,
+    -- When dedup_messages.py last (re)grouped the message: the watermark for regrouping
+    {% if message_duplicates %}dup.processed_at{% else %}NULL::TIMESTAMPTZ{% endif %} AS grouped_at,
     m.scraped_at
-FROM {{ ref('stg_telegram_messages') }} m
+FROM new_messages m
 JOIN {{ ref('dim_channels') }} c
     ON m.channel_name = c.channel_name
 JOIN {{ ref('dim_dates') }} d
-    ON m.message_timestamp::date = d.date_day
\ No newline at end of file
+    ON m.message_timestamp::date = d.date_day
+{%- if message_duplicates %}
+LEFT JOIN {{ message_duplicates }} dup
+    ON m.message_id = dup.message_id
+{%- endif %}
+{%- if image_detections %}
+LEFT JOIN latest_detections det
+    ON det.message_id = {% if message_duplicates %}COALESCE(dup.duplicate_group_id, m.message_id){% else %}m.message_id{% endif %}
+{%- endif %}
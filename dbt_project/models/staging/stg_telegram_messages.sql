@@ -0,0 +1,17 @@
+{#- The loader writes raw.telegram_messages with typed columns, so staging is a plain projection: no JSON is
+    parsed per row. message_timestamp is the UTC wall-clock time, independent of the session time zone. -#}
+SELECT
+    id AS message_id,
+    sender_id,
+    date AT TIME ZONE 'UTC' AS message_timestamp,
+    text AS message_content,
+    COALESCE(views, 0) AS views_count,
+    COALESCE(forwards, 0) AS forwards_count,
+    COALESCE(replies_count, 0) AS replies_count,
+    (media_path IS NOT NULL OR media_type IS NOT NULL) AS has_media,
+    media_type,
+    media_path,
+    NULL::JSONB AS entities, -- Not captured by the scraper
+    channel_name,
+    loaded_at AS scraped_at -- Moves forward whenever the loader refreshes the row
+FROM {{ source('raw_data', 'telegram_messages') }}
@@ -0,0 +1,323 @@
+"""Groups reposted messages so downstream stages can handle one representative per group.
+
+Runs between loading and dbt. Each message is compared with the representatives of existing groups and joins the
+earliest one it matches, or becomes the representative of a new group; message_duplicates records its
+duplicate_group_id (the representative's message_id, so a message that is nobody's duplicate is its own group).
+
+Two messages match when:
+    - their texts are near-duplicates: MinHash estimate of the Jaccard similarity of their word 3-shingles of at
+      least DEDUP_THRESHOLD, or, for texts too short to shingle, the same normalised text; and
+    - their images agree: the same content hash, or no media on either. A message with an image never joins a
+      group whose representative has a different image or none, so every distinct image keeps a representative
+      for enrichment, and a text-only message never joins one with an image, whose detections it would inherit.
+      Media whose file can't be found or hashed gets a hash of its own (UNKNOWN_IMAGE_PREFIX and the message id),
+      so it neither joins a group nor is joined.
+
+Candidates come from LSH buckets (DEDUP_BANDS bands of the signature) and exact image/text hash lookups, all held
+in Postgres and indexed, so memory is bounded by DEDUP_BATCH_SIZE however many messages are stored. A run only
+reads messages that are new or reloaded since they were last grouped.
+"""
+import os
+import re
+import sys
+import time
+import zlib
+import hashlib
+import argparse
+import logging
+import numpy as np
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+import media_store
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PG_USER = os.getenv('POSTGRES_USER')
+PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
+PG_DB = os.getenv('POSTGRES_DB')
+PG_HOST = os.getenv('POSTGRES_HOST')
+PG_PORT = os.getenv('POSTGRES_PORT')
+
+DEDUP_BATCH_SIZE = int(os.getenv('DEDUP_BATCH_SIZE', '5000'))
+DEDUP_NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', '64')) # MinHash signature length
+DEDUP_BANDS = int(os.getenv('DEDUP_BANDS', '16')) # LSH bands; DEDUP_NUM_PERM / DEDUP_BANDS rows each
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8')) # Minimum estimated Jaccard similarity of the texts
+DEDUP_MIN_SHINGLES = int(os.getenv('DEDUP_MIN_SHINGLES', '3')) # Shorter texts must match exactly
+SHINGLE_WORDS = 3
+
+# Fixed seed: signatures stored by earlier runs must stay comparable with new ones
+_random = np.random.RandomState(20240601)
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+PERM_A = _random.randint(1, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+PERM_B = _random.randint(0, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+
+UNKNOWN_IMAGE_PREFIX = 'unknown:' # image_hash of media that couldn't be hashed, followed by the message id
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+|t\.me/\S+|@\w+")
+WORD_PATTERN = re.compile(r"\w+")
+
+def get_connection():
+    return psycopg2.connect(dbname=PG_DB, user=PG_USER, password=PG_PASSWORD, host=PG_HOST, port=PG_PORT)
+
+def create_tables(conn):
+    """Creates message_duplicates and the LSH bucket table if they don't exist.
+
+    Only representatives carry a signature and bucket rows: later messages are compared with representatives,
+    so the candidate set grows with the number of groups rather than the number of messages.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS message_duplicates (
+                message_id BIGINT PRIMARY KEY, -- raw.telegram_messages.id
+                duplicate_group_id BIGINT NOT NULL, -- message_id of the group's representative
+                text_hash TEXT,
+                image_hash TEXT,
+                signature BYTEA, -- MinHash signature; representatives with enough text only
+                source_loaded_at TIMESTAMP WITH TIME ZONE, -- loaded_at of the raw row that was grouped
+                processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS message_duplicates_group_idx ON message_duplicates (duplicate_group_id);")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS message_duplicates_image_idx ON message_duplicates (image_hash)
+                WHERE message_id = duplicate_group_id;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS message_duplicates_text_idx ON message_duplicates (text_hash)
+                WHERE message_id = duplicate_group_id;
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS message_lsh_buckets (
+                bucket BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                PRIMARY KEY (bucket, message_id)
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS message_lsh_buckets_message_idx ON message_lsh_buckets (message_id);")
+    conn.commit()
+
+def normalize(text):
+    """Lower-cased words with links and @mentions removed, so reposts that only differ in those still match."""
+    return WORD_PATTERN.findall(URL_PATTERN.sub(' ', (text or '').lower()))
+
+def minhash(words):
+    """MinHash signature of the text's word 3-shingles, or None when it has fewer than DEDUP_MIN_SHINGLES."""
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    if len(shingles) < DEDUP_MIN_SHINGLES:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Universal hashing, one permutation per column; uint64 arithmetic wraps, which is deterministic
+    permuted = (np.outer(hashes, PERM_A) + PERM_B) % MERSENNE_PRIME
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+def similarity(a, b):
+    return float(np.count_nonzero(a == b)) / len(a)
+
+def buckets(signature):
+    """One bucket per band, with the band number folded into the hash so bands can share one indexed column."""
+    rows = len(signature) // DEDUP_BANDS
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes(),
+                                       digest_size=8).digest(), 'big', signed=True)
+        for band in range(DEDUP_BANDS)
+    ]
+
+def image_hash(media_path, channel_name):
+    """Content hash of the message's media: the store key's digest, or the SHA-256 of a pre-store file."""
+    if not media_path:
+        return None
+    if media_store.is_key(media_path):
+        return media_store.key_digest(media_path)
+    path = media_store.resolve(media_path, channel_name)
+    return media_store.file_sha256(path) if path else None
+
+def lookup_keys(item):
+    """Keys under which a message finds, or a representative is found by, its possible matches."""
+    keys = [('band', bucket) for bucket in item.buckets]
+    if item.image_hash:
+        keys.append(('image', item.image_hash))
+    if item.signature is None and item.text_hash:
+        keys.append(('text', item.text_hash)) # Too short for MinHash: exact text only
+    return keys
+
+class Representative:
+    __slots__ = ('message_id', 'text_hash', 'image_hash', 'signature', 'buckets')
+
+    def __init__(self, message_id, text_hash, image_hash, signature):
+        self.message_id = message_id
+        self.text_hash = text_hash
+        self.image_hash = image_hash
+        self.signature = signature
+        self.buckets = buckets(signature) if signature is not None else []
+
+class Message(Representative):
+    __slots__ = ('loaded_at', 'group_id')
+
+    def __init__(self, message_id, loaded_at, text, media_path, channel_name, group_id=None):
+        words = normalize(text)
+        content_hash = image_hash(media_path, channel_name)
+        if media_path and content_hash is None:
+            content_hash = f"{UNKNOWN_IMAGE_PREFIX}{message_id}"
+        super().__init__(message_id, hashlib.md5(' '.join(words).encode('utf-8')).hexdigest() if words else None,
+                         content_hash, minhash(words))
+        self.loaded_at = loaded_at
+        self.group_id = group_id # Current group, for a reloaded message
+
+    def matches(self, representative):
+        if self.image_hash != representative.image_hash:
+            return False # A different image, media on only one side, or media of unknown content
+        if self.signature is not None and representative.signature is not None:
+            return similarity(self.signature, representative.signature) >= DEDUP_THRESHOLD
+        return self.text_hash == representative.text_hash
+
+class CandidateIndex:
+    """The representatives a batch could join, indexed by lookup key so each message is only compared with the
+    few that share a bucket, image or text with it."""
+
+    def __init__(self, representatives=()):
+        self.representatives = {}
+        self.keys = {}
+        for representative in representatives:
+            self.add(representative)
+
+    def add(self, representative):
+        self.representatives[representative.message_id] = representative
+        for key in lookup_keys(representative):
+            self.keys.setdefault(key, set()).add(representative.message_id)
+
+    def candidates(self, message):
+        ids = set()
+        for key in lookup_keys(message):
+            ids |= self.keys.get(key, set())
+        ids.discard(message.message_id)
+        return [self.representatives[i] for i in ids]
+
+def find_candidates(conn, messages):
+    """CandidateIndex of the stored groups any message in the batch could join."""
+    keys = [key for m in messages for key in lookup_keys(m)]
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT d.message_id, d.text_hash, d.image_hash, d.signature
+            FROM message_duplicates d
+            WHERE d.message_id = d.duplicate_group_id
+              AND d.message_id IN (
+                  -- A union of index lookups rather than ORed conditions, which would scan the whole table
+                  SELECT message_id FROM message_lsh_buckets WHERE bucket = ANY(%s)
+                  UNION
+                  SELECT message_id FROM message_duplicates WHERE image_hash = ANY(%s) AND message_id = duplicate_group_id
+                  UNION
+                  SELECT message_id FROM message_duplicates WHERE text_hash = ANY(%s) AND message_id = duplicate_group_id
+              );
+        """, ([v for kind, v in keys if kind == 'band'], [v for kind, v in keys if kind == 'image'],
+              [v for kind, v in keys if kind == 'text']))
+        return CandidateIndex(
+            Representative(message_id, text_hash, image_hash,
+                           np.frombuffer(bytes(signature), dtype=np.uint32) if signature is not None else None)
+            for message_id, text_hash, image_hash, signature in cur.fetchall()
+        )
+
+def group_batch(messages, index):
+    """Assigns each message a group; returns the representatives this batch created or changed.
+
+    Messages are taken in posting order, so within a batch the earliest copy becomes the representative and
+    later ones are compared with it too.
+    """
+    changed = []
+    for message in messages:
+        if message.group_id == message.message_id:
+            # A reloaded representative keeps its group (its members were matched against it); only its hashes
+            # and buckets are refreshed
+            changed.append(message)
+            index.add(message)
+            continue
+        matching = [rep.message_id for rep in index.candidates(message) if message.matches(rep)]
+        if matching:
+            message.group_id = min(matching)
+        else:
+            message.group_id = message.message_id
+            changed.append(message)
+            index.add(message)
+    return changed
+
+def write_batch(conn, messages, representatives):
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO message_duplicates (message_id, duplicate_group_id, text_hash, image_hash, signature, source_loaded_at)
+            VALUES %s
+            ON CONFLICT (message_id) DO UPDATE SET
+                duplicate_group_id = EXCLUDED.duplicate_group_id,
+                text_hash = EXCLUDED.text_hash,
+                image_hash = EXCLUDED.image_hash,
+                signature = EXCLUDED.signature,
+                source_loaded_at = EXCLUDED.source_loaded_at,
+                processed_at = CURRENT_TIMESTAMP;
+        """, [(m.message_id, m.group_id, m.text_hash, m.image_hash,
+               psycopg2.Binary(m.signature.tobytes()) if m.signature is not None and m.group_id == m.message_id else None,
+               m.loaded_at) for m in messages])
+        # Members of a reloaded message's old group don't move; a regrouped former representative leaves its buckets
+        cur.execute("DELETE FROM message_lsh_buckets WHERE message_id = ANY(%s);", ([m.message_id for m in messages],))
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO message_lsh_buckets (bucket, message_id) VALUES %s ON CONFLICT DO NOTHING;
+        """, [(bucket, rep.message_id) for rep in representatives for bucket in rep.buckets])
+    conn.commit()
+
+def run_dedup(full_refresh=False):
+    """Groups the messages that are new or reloaded since they were last grouped."""
+    read_conn = write_conn = None
+    try:
+        read_conn = get_connection()
+        write_conn = get_connection()
+        create_tables(write_conn)
+        if full_refresh:
+            with write_conn.cursor() as cur:
+                cur.execute("TRUNCATE message_duplicates, message_lsh_buckets;")
+            write_conn.commit()
+
+        start = time.perf_counter()
+        processed = grouped = 0
+        # Server-side cursor: messages are streamed in DEDUP_BATCH_SIZE chunks, oldest post first
+        with read_conn.cursor(name='message_dedup') as cur:
+            cur.itersize = DEDUP_BATCH_SIZE
+            cur.execute("""
+                SELECT r.id, r.loaded_at, r.text, r.media_path, r.channel_name, d.duplicate_group_id
+                FROM raw.telegram_messages r
+                LEFT JOIN message_duplicates d ON d.message_id = r.id
+                WHERE d.message_id IS NULL OR r.loaded_at > d.source_loaded_at
+                ORDER BY r.date, r.id;
+            """)
+            while True:
+                batch = cur.fetchmany(DEDUP_BATCH_SIZE)
+                if not batch:
+                    break
+                messages = [Message(*row) for row in batch]
+                representatives = group_batch(messages, find_candidates(write_conn, messages))
+                write_batch(write_conn, messages, representatives)
+                processed += len(messages)
+                grouped += sum(1 for m in messages if m.group_id != m.message_id)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        logging.info(f"Grouped {processed} messages in {elapsed:.2f}s ({processed / elapsed:.0f} messages/sec); "
+                     f"{grouped} are duplicates of an earlier message.")
+        return True
+    except psycopg2.Error as e:
+        logging.critical(f"Database connection or operation error: {e}")
+        return False
+    finally:
+        for conn in (read_conn, write_conn):
+            if conn:
+                conn.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Assign near-duplicate messages to duplicate groups.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Forget every group and regroup all messages (group ids may change).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if not run_dedup(full_refresh=parse_args().full_refresh):
+        sys.exit(1)
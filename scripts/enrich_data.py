@@ -1,11 +1,25 @@
 import os
+import sys
+import time
 import psycopg2
+import psycopg2.extras
 import json
-from ultralytics import YOLO
+import hashlib
+import ast
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from itertools import islice
 from dotenv import load_dotenv
 import logging
+from io import BytesIO
 from PIL import Image
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root, for the shared common package
+from common.data_version import mark_data_version
+from common.instrumentation import counter, histogram, job
+import media_store
+
 # Load environment variables
 load_dotenv()
 
@@ -19,103 +33,555 @@ PG_DB = os.getenv('POSTGRES_DB')
 PG_HOST = os.getenv('POSTGRES_HOST')
 PG_PORT = os.getenv('POSTGRES_PORT')
 
-# Load a pre-trained YOLO model (e.g., YOLOv8n for 'nano' version)
-# You might need to download this model once, or it will download automatically.
-# Consider using a model specifically fine-tuned for medical products if available.
-model = YOLO('yolov8n.pt')
+# Pipeline settings: image decoding threads, images per model call, and results buffered per database write
+ENRICH_DECODE_WORKERS = int(os.getenv('ENRICH_DECODE_WORKERS', '4'))
+ENRICH_BATCH_SIZE = int(os.getenv('ENRICH_BATCH_SIZE', '16'))
+ENRICH_WRITE_BATCH = int(os.getenv('ENRICH_WRITE_BATCH', '500'))
+ENRICH_MODEL = os.getenv('ENRICH_MODEL', 'yolov8n.pt')
 
-def get_messages_with_media_paths():
-    """Fetches messages with media paths from the raw_telegram_messages table."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            dbname=PG_DB,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            host=PG_HOST,
-            port=PG_PORT
-        )
-        cur = conn.cursor()
+# Inference: 'torch' runs the ultralytics model on PyTorch; 'onnx' runs its ONNX export on ONNX Runtime, with the
+# execution provider from ENRICH_ONNX_PROVIDERS (e.g. OpenVINOExecutionProvider with onnxruntime-openvino).
+# Thread counts of 0 leave the choice to the runtime. ENRICH_INFERENCE_WORKERS > 1 shards batches across processes.
+ENRICH_BACKEND = os.getenv('ENRICH_BACKEND', 'torch')
+ENRICH_ONNX_PROVIDERS = os.getenv('ENRICH_ONNX_PROVIDERS', 'CPUExecutionProvider').split(',')
+ENRICH_INTRA_OP_THREADS = int(os.getenv('ENRICH_INTRA_OP_THREADS', '0'))
+ENRICH_INTER_OP_THREADS = int(os.getenv('ENRICH_INTER_OP_THREADS', '0'))
+ENRICH_INFERENCE_WORKERS = int(os.getenv('ENRICH_INFERENCE_WORKERS', '1'))
+ENRICH_IMAGE_SIZE = 640
+ENRICH_CONFIDENCE = 0.25 # ultralytics' predict() defaults, so both backends report the same detections
+ENRICH_IOU = 0.7
+ENRICH_MAX_DETECTIONS = 300
+UNREADABLE_IMAGE_HASH = 'unreadable' # image_hash recorded for media files that could not even be read
+
+def get_model_version(model_path=ENRICH_MODEL):
+    """Identifies the weights in use, so processed markers and cached detections are per model.
+
+    Changing or retraining the weights changes the version, which invalidates only the entries made with the old ones.
+    """
+    if not os.path.exists(model_path):
+        return os.path.basename(model_path)
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"{os.path.basename(model_path)}@{digest.hexdigest()[:12]}"
+
+MODEL_VERSION = get_model_version()
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=PG_DB,
+        user=PG_USER,
+        password=PG_PASSWORD,
+        host=PG_HOST,
+        port=PG_PORT
+    )
+
+def create_enrichment_tables(conn):
+    """Creates the processed-marker table and the detection cache if they don't exist.
+
+    image_detections records every message handled per model version (including ones with no detections),
+    so each run only picks up new media. detection_cache maps image content (SHA-256, and a perceptual
+    hash for near-identical copies) to detections, so reposted images skip inference.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS image_detections (
+                message_id BIGINT NOT NULL,
+                model_version TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                detected_objects JSONB NOT NULL,
+                processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (message_id, model_version)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS detection_cache (
+                image_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                perceptual_hash BIGINT NOT NULL,
+                detected_objects JSONB NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (image_hash, model_version)
+            );
+        """)
         cur.execute("""
-            SELECT id, media_path FROM raw_telegram_messages
-            WHERE has_media = TRUE AND media_path IS NOT NULL AND media_path != '';
+            CREATE INDEX IF NOT EXISTS detection_cache_perceptual_hash_idx
+                ON detection_cache (model_version, perceptual_hash);
         """)
-        return cur.fetchall()
+    conn.commit()
+
+def get_messages_with_media_paths(conn):
+    """Fetches messages with media paths that have not been processed by the current model yet.
+
+    Once dedup_messages.py has grouped reposts, only group representatives are fetched: fct_messages gives
+    the other members their representative's detections. Messages not grouped yet are still fetched.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.message_duplicates') IS NOT NULL;")
+            grouped = cur.fetchone()[0]
+            cur.execute(f"""
+                SELECT r.id, r.media_path, r.channel_name FROM raw.telegram_messages r
+                LEFT JOIN image_detections d
+                    ON d.message_id = r.id AND d.model_version = %s
+                {"LEFT JOIN message_duplicates dup ON dup.message_id = r.id" if grouped else ""}
+                WHERE r.media_path IS NOT NULL AND r.media_path != ''
+                  AND d.message_id IS NULL
+                  {"AND (dup.duplicate_group_id IS NULL OR dup.duplicate_group_id = r.id)" if grouped else ""};
+            """, (MODEL_VERSION,))
+            return cur.fetchall()
     except psycopg2.Error as e:
         logging.critical(f"Database connection or operation error: {e}")
+        conn.rollback()
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def update_detected_objects(message_id, detected_objects_json):
-    """Updates the detected_objects column in fct_messages."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            dbname=PG_DB,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            host=PG_HOST,
-            port=PG_PORT
-        )
-        cur = conn.cursor()
+def get_cached_detections(conn, batch):
+    """Looks up a batch of decoded images in detection_cache by exact and perceptual hash."""
+    with conn.cursor() as cur:
         cur.execute("""
-            UPDATE fct_messages
-            SET detected_objects = %s
-            WHERE message_id = %s;
-        """, (detected_objects_json, message_id))
+            SELECT image_hash, perceptual_hash, detected_objects FROM detection_cache
+            WHERE model_version = %s AND (image_hash = ANY(%s) OR perceptual_hash = ANY(%s));
+        """, (MODEL_VERSION, [item[3] for item in batch], [item[4] for item in batch]))
+        rows = cur.fetchall()
+    conn.commit() # Don't leave the read transaction open while the model runs
+    return rows
+
+def write_results(conn, results):
+    """Writes a batch of (message_id, image_hash, perceptual_hash, detected_objects_json, inferred) rows.
+
+    Marks the messages processed and caches newly inferred detections, in one transaction. fct_messages belongs
+    to dbt: its next run picks up every message whose detections changed.
+    """
+    if not results:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE detected_objects_stage (
+                    message_id BIGINT,
+                    image_hash TEXT,
+                    perceptual_hash BIGINT,
+                    detected_objects JSONB,
+                    inferred BOOLEAN
+                ) ON COMMIT DROP;
+            """)
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO detected_objects_stage (message_id, image_hash, perceptual_hash, detected_objects, inferred)
+                VALUES %s;
+            """, results)
+            cur.execute("""
+                INSERT INTO image_detections (message_id, model_version, image_hash, detected_objects)
+                SELECT DISTINCT ON (message_id) message_id, %s, image_hash, detected_objects
+                FROM detected_objects_stage
+                ON CONFLICT (message_id, model_version) DO UPDATE
+                SET image_hash = EXCLUDED.image_hash,
+                    detected_objects = EXCLUDED.detected_objects,
+                    processed_at = CURRENT_TIMESTAMP;
+            """, (MODEL_VERSION,))
+            cur.execute("""
+                INSERT INTO detection_cache (image_hash, model_version, perceptual_hash, detected_objects)
+                SELECT DISTINCT ON (image_hash) image_hash, %s, perceptual_hash, detected_objects
+                FROM detected_objects_stage
+                WHERE inferred
+                ON CONFLICT (image_hash, model_version) DO NOTHING;
+            """, (MODEL_VERSION,))
         conn.commit()
-        logging.info(f"Updated detected objects for message_id: {message_id}")
+        logging.info(f"Recorded detections for {len(results)} messages.")
     except psycopg2.Error as e:
-        logging.error(f"Error updating detected objects for message_id {message_id}: {e}")
-    finally:
+        conn.rollback()
+        logging.error(f"Error writing detections for {len(results)} messages: {e}")
+
+ENRICH_STAGE_SECONDS = histogram('enrich_stage_seconds', "Duration of each enrichment step call (decode, cache lookup, inference, write).")
+ENRICH_SECONDS_PER_IMAGE = histogram('enrich_seconds_per_image', "Enrichment step time divided by the images it handled, by stage.")
+ENRICH_IMAGES = counter('enrich_images_total', "Images enriched, by where their detections came from.")
+
+class StageTimer:
+    """Accumulates busy time and item counts for one pipeline stage, and records each call in the shared metrics."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.items = 0
+
+    def add(self, seconds, items):
+        self.seconds += seconds
+        self.items += items
+        ENRICH_STAGE_SECONDS.observe(seconds, stage=self.name)
+        if items:
+            ENRICH_SECONDS_PER_IMAGE.observe(seconds / items, stage=self.name)
+
+    def report(self):
+        rate = self.items / self.seconds if self.seconds else 0.0
+        return f"{self.name}: {self.items} images in {self.seconds:.2f}s ({rate:.1f} images/sec)"
+
+def detections_from_result(result, names):
+    detected_objects = []
+    for box in result.boxes:
+        class_id = int(box.cls[0])
+        class_name = names[class_id]
+        confidence = float(box.conf[0])
+        # You might want to save bounding box coordinates as well
+        detected_objects.append({
+            'class_name': class_name,
+            'confidence': confidence
+        })
+    return detected_objects
+
+class TorchBackend:
+    """The ultralytics model on PyTorch."""
+    name = 'torch'
+
+    def __init__(self, model_path=None):
+        from ultralytics import YOLO # Imported here: runs with nothing to infer never pay for it
+        if ENRICH_INTRA_OP_THREADS or ENRICH_INTER_OP_THREADS:
+            import torch
+            if ENRICH_INTRA_OP_THREADS:
+                torch.set_num_threads(ENRICH_INTRA_OP_THREADS)
+            if ENRICH_INTER_OP_THREADS:
+                torch.set_num_interop_threads(ENRICH_INTER_OP_THREADS)
+        self.model = YOLO(model_path or ENRICH_MODEL)
+
+    def detect(self, images):
+        """Detections per image, as lists of {'class_name', 'confidence'}."""
+        results = self.model(images, verbose=False, conf=ENRICH_CONFIDENCE, iou=ENRICH_IOU, max_det=ENRICH_MAX_DETECTIONS)
+        return [detections_from_result(result, self.model.names) for result in results]
+
+def export_onnx(model_path):
+    """Path of model_path's ONNX export, exporting it with ultralytics when it is missing or older than the weights."""
+    if model_path.endswith('.onnx'):
+        return model_path
+    onnx_path = os.path.splitext(model_path)[0] + '.onnx'
+    stale = os.path.exists(onnx_path) and os.path.exists(model_path) and os.path.getmtime(onnx_path) < os.path.getmtime(model_path)
+    if not os.path.exists(onnx_path) or stale:
+        from ultralytics import YOLO
+        logging.info(f"Exporting {model_path} to ONNX...")
+        # Dynamic axes, so whole batches go through one session.run()
+        onnx_path = YOLO(model_path).export(format='onnx', imgsz=ENRICH_IMAGE_SIZE, dynamic=True)
+    return onnx_path
+
+class OnnxBackend:
+    """A YOLOv8 ONNX export on ONNX Runtime, with its own letterboxing and non-maximum suppression.
+
+    Only class names and confidences are kept, so boxes stay in the letterboxed frame.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path=None):
+        import numpy as np
+        import onnxruntime as ort
+        self.np = np
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ENRICH_INTRA_OP_THREADS
+        options.inter_op_num_threads = ENRICH_INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if ENRICH_INTER_OP_THREADS > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(export_onnx(model_path or ENRICH_MODEL), options, providers=ENRICH_ONNX_PROVIDERS)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # A static export takes a fixed batch size; a dynamic one reports the batch axis by name
+        self.batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def letterbox(self, image):
+        """Resizes to fit ENRICH_IMAGE_SIZE square, padded with grey as ultralytics does, as a CHW float array."""
+        size = ENRICH_IMAGE_SIZE
+        scale = min(size / image.width, size / image.height)
+        resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+        canvas = Image.new('RGB', (size, size), (114, 114, 114))
+        canvas.paste(resized, ((size - resized.width) // 2, (size - resized.height) // 2))
+        return self.np.asarray(canvas, dtype=self.np.float32).transpose(2, 0, 1) / 255.0
+
+    def non_max_suppression(self, boxes, scores):
+        np = self.np
+        order = scores.argsort()[::-1]
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        kept = []
+        while order.size and len(kept) < ENRICH_MAX_DETECTIONS:
+            best, rest = order[0], order[1:]
+            kept.append(best)
+            width = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+            height = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+            overlap = width * height
+            order = rest[overlap / (areas[best] + areas[rest] - overlap + 1e-9) <= ENRICH_IOU]
+        return kept
+
+    def detections(self, output):
+        """Detections from one image's (4 + classes, anchors) output."""
+        np = self.np
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= ENRICH_CONFIDENCE
+        boxes, class_ids, confidences = predictions[keep, :4], class_ids[keep], confidences[keep]
+        # Centre/size to corners, offset per class so boxes of different classes never suppress each other
+        offset = class_ids[:, None] * 7680.0
+        corners = np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1) + offset
+        return [{'class_name': self.names.get(int(class_ids[i]), str(int(class_ids[i]))), 'confidence': float(confidences[i])}
+                for i in self.non_max_suppression(corners, confidences)]
+
+    def detect(self, images):
+        """Detections per image, as lists of {'class_name', 'confidence'}."""
+        step = self.batch_size or len(images)
+        detected = []
+        for i in range(0, len(images), step):
+            batch = self.np.stack([self.letterbox(image) for image in images[i:i + step]])
+            output = self.session.run(None, {self.input_name: batch})[0]
+            detected.extend(self.detections(prediction) for prediction in output)
+        return detected
+
+BACKENDS = {'torch': TorchBackend, 'onnx': OnnxBackend}
+_backend = None
+
+def get_backend():
+    """The configured backend, built on first use."""
+    global _backend
+    if _backend is None:
+        start = time.perf_counter()
+        _backend = BACKENDS[ENRICH_BACKEND]()
+        logging.info(f"Loaded {ENRICH_MODEL} on the {ENRICH_BACKEND} backend in {time.perf_counter() - start:.2f}s.")
+    return _backend
+
+def infer_batch(images):
+    """Returns (detections per image, seconds spent in the model)."""
+    start = time.perf_counter()
+    detected = get_backend().detect(images)
+    return detected, time.perf_counter() - start
+
+def init_inference_worker(backend_name, model_path, intra_op_threads):
+    global ENRICH_BACKEND, ENRICH_MODEL, ENRICH_INTRA_OP_THREADS
+    ENRICH_BACKEND, ENRICH_MODEL, ENRICH_INTRA_OP_THREADS = backend_name, model_path, intra_op_threads
+
+class Inference:
+    """Runs batches through the backend in this process, or shards them across `workers` processes.
+
+    submit() returns a future of infer_batch()'s result. Each worker builds its own backend, and by default
+    gets an equal share of the cores as its intra-op thread count, so the processes don't oversubscribe the CPU.
+    """
+
+    def __init__(self, backend_name=None, model_path=None, workers=ENRICH_INFERENCE_WORKERS):
+        self.pool = None
+        self.max_in_flight = 1
+        if workers > 1:
+            backend_name, model_path = backend_name or ENRICH_BACKEND, model_path or ENRICH_MODEL
+            if backend_name == 'onnx':
+                export_onnx(model_path) # Once, before the workers race to do it
+            threads = ENRICH_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // workers)
+            # spawn, not fork: forking a process whose math libraries have started their thread pools can deadlock
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_inference_worker,
+                                            initargs=(backend_name, model_path, threads))
+            self.max_in_flight = 2 * workers
+
+    def submit(self, images):
+        if self.pool:
+            return self.pool.submit(infer_batch, images)
+        future = Future()
+        try:
+            future.set_result(infer_batch(images))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+def perceptual_hash(image):
+    """64-bit difference hash (dHash), stable across resizing and recompression, as a signed BIGINT."""
+    pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits - (1 << 63)
+
+def decode_image(message_id, media_path, channel_name=None):
+    """Verifies, hashes and decodes one image.
+
+    Media in the content-addressed store is read from its thumbnail, which is already at the model's input size,
+    and hashed by its key. Returns (message_id, media_path, image, sha256, perceptual_hash, seconds); image is
+    None if unusable, and sha256 is also None if the file is missing (it may still be downloaded).
+    """
+    start = time.perf_counter()
+    if media_store.is_key(media_path):
+        file_path = media_store.make_thumbnail(media_path) or media_store.resolve(media_path)
+        content_hash = media_store.key_digest(media_path)
+    else:
+        file_path = media_store.resolve(media_path, channel_name)
+        content_hash = None
+    if not file_path:
+        logging.warning(f"Media path {media_path} for message {message_id} does not exist. Skipping.")
+        return message_id, media_path, None, None, None, time.perf_counter() - start
+    data = None
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        # Check if the file is a valid image before processing
+        with Image.open(BytesIO(data)) as img:
+            img.verify() # Verify that it is an image
+        # verify() leaves the image unusable, so decode it again for the model
+        with Image.open(BytesIO(data)) as img:
+            image = img.convert('RGB')
+        return (message_id, media_path, image, content_hash or hashlib.sha256(data).hexdigest(),
+                perceptual_hash(image), time.perf_counter() - start)
+    except Exception as e:
+        # Anything Pillow raises on a bad file (truncated data, decompression bombs, MemoryError, ...) only costs
+        # this image. It keeps a hash so it is recorded as processed rather than read again on every run.
+        logging.error(f"File at {file_path} for message {message_id} is not a valid image: {e}")
+        image_hash = content_hash or (hashlib.sha256(data).hexdigest() if data is not None else UNREADABLE_IMAGE_HASH)
+        return message_id, media_path, None, image_hash, None, time.perf_counter() - start
+
+def decoded_batches(messages, pool, decode_timer, undecodable, batch_size=ENRICH_BATCH_SIZE):
+    """Decodes images on the thread pool, keeping about two batches in flight ahead of the model.
+
+    Images that exist but could not be decoded are appended to `undecodable` as (message_id, image_hash).
+    """
+    messages = iter(messages)
+    in_flight = deque(pool.submit(decode_image, *m) for m in islice(messages, 2 * batch_size))
+    batch = []
+    while in_flight:
+        *decoded, seconds = in_flight.popleft().result()
+        decode_timer.add(seconds, 1)
+        for next_message in islice(messages, 1):
+            in_flight.append(pool.submit(decode_image, *next_message))
+        if decoded[2] is not None:
+            batch.append(tuple(decoded))
+        elif decoded[3] is not None:
+            undecodable.append((decoded[0], decoded[3]))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_object_detection():
+    """Runs YOLO object detection on new downloaded images and updates the database.
+
+    Images are decoded, verified and hashed on a thread pool ahead of the model. Images whose content
+    (or perceptual hash) already has detections for this model reuse them; the rest are inferred
+    in batches of ENRICH_BATCH_SIZE on the ENRICH_BACKEND backend, which is only loaded once there is something
+    to infer. Results are written back in bulk on a single connection.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        create_enrichment_tables(conn)
+    except psycopg2.Error as e:
+        logging.critical(f"Database connection or operation error: {e}")
         if conn:
             conn.close()
+        return False
 
-def run_object_detection():
-    """Runs YOLO object detection on downloaded images and updates the database."""
-    messages_to_process = get_messages_with_media_paths()
-    if not messages_to_process:
-        logging.info("No messages with media paths found for object detection.")
-        return
+    timers = {name: StageTimer(name) for name in ('decode', 'cache lookup', 'inference', 'write')}
+    reused = {'exact': 0, 'perceptual': 0}
+    failed = {'undecodable': 0}
+    try:
+        messages_to_process = get_messages_with_media_paths(conn)
+        if not messages_to_process:
+            logging.info(f"No new messages with media paths found for object detection with {MODEL_VERSION}.")
+            return True
 
-    logging.info(f"Found {len(messages_to_process)} messages with media to process for object detection.")
+        logging.info(f"Found {len(messages_to_process)} messages with media to process for object detection with {MODEL_VERSION}.")
 
-    for message_id, media_path in messages_to_process:
-        if not media_path or not os.path.exists(media_path):
-            logging.warning(f"Media path {media_path} for message {message_id} does not exist. Skipping.")
-            continue
+        # Detections seen during this run, by exact and perceptual hash, in front of the database cache
+        known_exact, known_perceptual = {}, {}
+        # Images waiting on a batch still being inferred, by hash: copies queue here instead of being inferred again
+        waiting = {}
+        in_flight = deque()
+        pending_writes = []
+        undecodable = []
+        inference = Inference()
 
-        try:
-            # Check if the file is a valid image before processing
-            with Image.open(media_path) as img:
-                img.verify() # Verify that it is an image
-            
-            # Perform inference
-            results = model(media_path)
-
-            detected_objects = []
-            for r in results:
-                for box in r.boxes:
-                    class_id = int(box.cls[0])
-                    class_name = model.names[class_id]
-                    confidence = float(box.conf[0])
-                    # You might want to save bounding box coordinates as well
-                    detected_objects.append({
-                        'class_name': class_name,
-                        'confidence': confidence
-                    })
-
-            if detected_objects:
-                update_detected_objects(message_id, json.dumps(detected_objects))
+        def collect(to_infer, future):
+            try:
+                results, seconds = future.result()
+            except Exception as e:
+                logging.error(f"Error running inference on a batch of {len(to_infer)} images: {e}")
+                results = []
             else:
-                logging.info(f"No objects detected in media for message_id: {message_id}")
+                # Only batches that produced detections count towards inference throughput and images inferred
+                timers['inference'].add(seconds, len(to_infer))
+            for (message_id, image_hash, phash), detected_objects in zip(to_infer, results):
+                known_exact[image_hash] = detected_objects
+                known_perceptual.setdefault(phash, detected_objects)
+                pending_writes.append((message_id, image_hash, phash, json.dumps(detected_objects), True))
+                for copy_id, copy_phash in waiting.pop(image_hash, []):
+                    reused['exact'] += 1
+                    pending_writes.append((copy_id, image_hash, copy_phash, json.dumps(detected_objects), False))
+            for _, image_hash, _ in to_infer:
+                waiting.pop(image_hash, None) # Copies of a failed batch are retried on the next run
 
-        except (IOError, SyntaxError) as e:
-            logging.error(f"File at {media_path} for message {message_id} is not a valid image: {e}")
-        except Exception as e:
-            logging.error(f"Error processing media for message_id {message_id} at {media_path}: {e}")
+        try:
+            with ThreadPoolExecutor(max_workers=ENRICH_DECODE_WORKERS) as pool:
+                for batch in decoded_batches(messages_to_process, pool, timers['decode'], undecodable):
+                    # Undecodable images are recorded with no detections, so they are not read again next run
+                    pending_writes.extend((message_id, image_hash, None, '[]', False) for message_id, image_hash in undecodable)
+                    failed['undecodable'] += len(undecodable)
+                    undecodable.clear()
+                    start = time.perf_counter()
+                    for image_hash, phash, detected_objects in get_cached_detections(conn, batch):
+                        known_exact[image_hash] = detected_objects
+                        known_perceptual.setdefault(phash, detected_objects)
+                    timers['cache lookup'].add(time.perf_counter() - start, len(batch))
+
+                    to_infer, images = [], []
+                    for message_id, media_path, image, image_hash, phash in batch:
+                        if image_hash in known_exact:
+                            detected_objects = known_exact[image_hash]
+                            reused['exact'] += 1
+                        elif phash in known_perceptual:
+                            detected_objects = known_perceptual[phash]
+                            reused['perceptual'] += 1
+                        elif image_hash in waiting:
+                            waiting[image_hash].append((message_id, phash))
+                            continue
+                        else:
+                            waiting[image_hash] = []
+                            to_infer.append((message_id, image_hash, phash))
+                            images.append(image)
+                            continue
+                        pending_writes.append((message_id, image_hash, phash, json.dumps(detected_objects), False))
+
+                    if to_infer:
+                        # The whole batch goes through one model call, here or on an inference worker
+                        in_flight.append((to_infer, inference.submit(images)))
+                    while in_flight and (len(in_flight) >= inference.max_in_flight or in_flight[0][1].done()):
+                        collect(*in_flight.popleft())
+
+                    if len(pending_writes) >= ENRICH_WRITE_BATCH:
+                        start = time.perf_counter()
+                        write_results(conn, pending_writes)
+                        timers['write'].add(time.perf_counter() - start, len(pending_writes))
+                        pending_writes.clear()
+            while in_flight:
+                collect(*in_flight.popleft())
+            # Failures decoded after the last full batch
+            pending_writes.extend((message_id, image_hash, None, '[]', False) for message_id, image_hash in undecodable)
+            failed['undecodable'] += len(undecodable)
+        finally:
+            inference.close()
+
+        start = time.perf_counter()
+        write_results(conn, pending_writes)
+        timers['write'].add(time.perf_counter() - start, len(pending_writes))
+        mark_data_version(conn, 'enrich_data')
+        return True
+    finally:
+        conn.close()
+        logging.info(f"Reused cached detections for {reused['exact']} identical and "
+                     f"{reused['perceptual']} near-identical images; {failed['undecodable']} images could not be decoded.")
+        ENRICH_IMAGES.inc(reused['exact'], source='exact_cache')
+        ENRICH_IMAGES.inc(reused['perceptual'], source='perceptual_cache')
+        ENRICH_IMAGES.inc(timers['inference'].items, source='inference')
+        ENRICH_IMAGES.inc(failed['undecodable'], source='undecodable')
+        for timer in timers.values():
+            logging.info(timer.report())
 
 if __name__ == "__main__":
-    run_object_detection()
\ No newline at end of file
+    with job('enrich'):
+        succeeded = run_object_detection()
+    if not succeeded:
+        sys.exit(1)
@@ -0,0 +1,197 @@
+"""Exports the marts to Parquet for analysts and the API's /export endpoint.
+
+    EXPORT_DIR/fct_messages/date_day=YYYY-MM-DD/data.parquet   one file per day (Hive partitioning)
+    EXPORT_DIR/dim_channels.parquet
+    EXPORT_DIR/dim_dates.parquet
+
+Each run compares a cheap signature of every day of fct_messages (row count and newest scraped_at /
+detections_processed_at / grouped_at) and of each dimension with the one recorded at the last export, and rewrites only what
+changed; days that no longer exist are removed. Files are written to a temporary name and renamed into place, so
+readers never see a half-written file.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import psycopg2
+from dotenv import load_dotenv
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root, for the shared common package
+from common.instrumentation import counter, job
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PG_USER = os.getenv('POSTGRES_USER')
+PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
+PG_DB = os.getenv('POSTGRES_DB')
+PG_HOST = os.getenv('POSTGRES_HOST')
+PG_PORT = os.getenv('POSTGRES_PORT')
+
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'data/export')
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'zstd')
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '50000')) # Rows fetched (and written as a row group) at a time
+EXPORT_STATE_FILE = '_export_state.json'
+FACT_TABLE = 'fct_messages'
+DIMENSIONS = {'dim_channels': 'channel_sk', 'dim_dates': 'date_sk'} # Table -> ordering key
+
+# Postgres type OIDs -> Arrow types; JSON columns are exported as their text, anything unknown as text too
+ARROW_TYPES = {
+    16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(), 700: pa.float32(), 701: pa.float64(),
+    1700: pa.float64(), 25: pa.string(), 1043: pa.string(), 1082: pa.date32(),
+    1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+}
+JSON_TYPES = {114, 3802}
+
+EXPORTED_ROWS = counter('export_rows_total', "Rows written to Parquet, by table.")
+EXPORTED_FILES = counter('export_files_total', "Parquet files written or removed, by table and outcome.")
+
+def get_connection():
+    return psycopg2.connect(dbname=PG_DB, user=PG_USER, password=PG_PASSWORD, host=PG_HOST, port=PG_PORT)
+
+def arrow_schema(description):
+    return pa.schema([(column.name, ARROW_TYPES.get(column.type_code, pa.string())) for column in description])
+
+def to_record_batch(rows, description, schema):
+    columns = []
+    for i, column in enumerate(description):
+        values = [row[i] for row in rows]
+        if column.type_code in JSON_TYPES:
+            values = [None if value is None else json.dumps(value, ensure_ascii=False) for value in values]
+        elif column.type_code not in ARROW_TYPES:
+            values = [None if value is None else str(value) for value in values]
+        elif column.type_code == 1700:
+            values = [None if value is None else float(value) for value in values]
+        columns.append(pa.array(values, type=schema.field(i).type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def write_query(conn, query, params, path, cursor_name):
+    """Streams a query into one Parquet file through a server-side cursor; returns the number of rows."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    rows_written = 0
+    writer = None
+    try:
+        with conn.cursor(name=cursor_name) as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if writer is None:
+                    # The description is only known once the named cursor has fetched
+                    schema = arrow_schema(cur.description)
+                    writer = pq.ParquetWriter(tmp_path, schema, compression=EXPORT_COMPRESSION)
+                if not rows:
+                    break
+                writer.write_batch(to_record_batch(rows, cur.description, schema))
+                rows_written += len(rows)
+        writer.close()
+        writer = None
+        os.replace(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    conn.commit()
+    return rows_written
+
+def load_state(export_dir):
+    path = os.path.join(export_dir, EXPORT_STATE_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'partitions': {}, 'dimensions': {}}
+
+def save_state(export_dir, state):
+    path = os.path.join(export_dir, EXPORT_STATE_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def partition_signatures(conn):
+    """{date_day: [rows, newest scraped_at, detections_processed_at, grouped_at]} for every day in fct_messages."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT d.date_day, COUNT(*), MAX(fm.scraped_at), MAX(fm.detections_processed_at), MAX(fm.grouped_at)
+            FROM {FACT_TABLE} fm
+            JOIN dim_dates d ON fm.date_sk = d.date_sk
+            GROUP BY d.date_day;
+        """)
+        return {str(day): [count, str(scraped_at), str(detected_at), str(grouped_at)]
+                for day, count, scraped_at, detected_at, grouped_at in cur.fetchall()}
+
+def dimension_signature(conn, table, key):
+    # The dimensions are small: a digest over every row catches any change, including the daily date flags
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*), md5(string_agg(t::text, '|' ORDER BY {key})) FROM {table} t;")
+        return [str(value) for value in cur.fetchone()]
+
+def partition_path(export_dir, day):
+    return os.path.join(export_dir, FACT_TABLE, f"date_day={day}", 'data.parquet')
+
+def run_export(export_dir=EXPORT_DIR, full_refresh=False):
+    """Rewrites the Parquet files whose source rows changed since the last export."""
+    os.makedirs(export_dir, exist_ok=True)
+    state = {'partitions': {}, 'dimensions': {}} if full_refresh else load_state(export_dir)
+    conn = get_connection()
+    start = time.perf_counter()
+    written = 0
+    try:
+        for table, key in DIMENSIONS.items():
+            signature = dimension_signature(conn, table, key)
+            if state['dimensions'].get(table) == signature:
+                continue
+            rows = write_query(conn, f"SELECT * FROM {table} ORDER BY {key}", None,
+                               os.path.join(export_dir, f"{table}.parquet"), f"export_{table}")
+            EXPORTED_ROWS.inc(rows, table=table)
+            EXPORTED_FILES.inc(table=table, outcome='written')
+            state['dimensions'][table] = signature
+            save_state(export_dir, state)
+
+        signatures = partition_signatures(conn)
+        changed = sorted(day for day, signature in signatures.items() if state['partitions'].get(day) != signature)
+        removed = sorted(set(state['partitions']) - set(signatures))
+        logging.info(f"{len(changed)} of {len(signatures)} days of {FACT_TABLE} changed since the last export; "
+                     f"{len(removed)} removed.")
+        for day in changed:
+            # Ordered by the fact's unique key so unchanged rows land in the same place in each rewrite
+            rows = write_query(conn, f"""
+                SELECT fm.*
+                FROM {FACT_TABLE} fm
+                WHERE fm.date_sk = (SELECT date_sk FROM dim_dates WHERE date_day = %s)
+                ORDER BY fm.channel_sk, fm.message_id
+            """, (day,), partition_path(export_dir, day), 'export_fct_messages')
+            EXPORTED_ROWS.inc(rows, table=FACT_TABLE)
+            EXPORTED_FILES.inc(table=FACT_TABLE, outcome='written')
+            written += rows
+            # Recorded per day, so an interrupted export resumes with the days it had not reached
+            state['partitions'][day] = signatures[day]
+            save_state(export_dir, state)
+        for day in removed:
+            shutil.rmtree(os.path.dirname(partition_path(export_dir, day)), ignore_errors=True)
+            EXPORTED_FILES.inc(table=FACT_TABLE, outcome='removed')
+            del state['partitions'][day]
+        save_state(export_dir, state)
+    finally:
+        conn.close()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    logging.info(f"Exported {written} {FACT_TABLE} rows from {len(changed)} days to {export_dir} in {elapsed:.2f}s.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export fct_messages, dim_channels and dim_dates to Parquet.")
+    parser.add_argument('--export-dir', default=EXPORT_DIR)
+    parser.add_argument('--full-refresh', action='store_true', help="Rewrite every file, ignoring the export state.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with job('export'):
+        run_export(args.export_dir, args.full_refresh)
@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+import logging
+from collections import deque
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root, for the shared common package
+from common.data_version import mark_data_version
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PG_USER = os.getenv('POSTGRES_USER')
+PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
+PG_DB = os.getenv('POSTGRES_DB')
+PG_HOST = os.getenv('POSTGRES_HOST')
+PG_PORT = os.getenv('POSTGRES_PORT')
+
+# Curated product dictionary: one (product, alias) row per name a product is advertised under
+DRUG_DICTIONARY = os.getenv('DRUG_DICTIONARY', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drug_dictionary.csv'))
+EXTRACT_BATCH_SIZE = int(os.getenv('EXTRACT_BATCH_SIZE', '5000'))
+PRICE_WINDOW = 80 # Max characters between a product mention and the price attributed to it
+STAGE_NAME = 'extract_products'
+# Second watermark over fct_messages.grouped_at: messages dedup_messages.py regrouped since the last run are
+# re-extracted so product_mentions.duplicate_group_id follows the new groups
+GROUPS_STAGE_NAME = 'extract_products_groups'
+
+# Prices such as "250 birr", "ETB 1,200", "1200br", "350 ብር" or "$12"
+AMOUNT = r"\d[\d,]*(?:\.\d+)?"
+PRICE_PATTERN = re.compile(
+    rf"(?:(?P<prefix_currency>etb|birr|br\.?|\$)\s*(?P<prefix_amount>{AMOUNT}))"
+    rf"|(?:(?P<amount>{AMOUNT})\s*(?P<currency>etb\b|birr\b|br\b|ብር|\$))",
+    re.IGNORECASE
+)
+# Whole words only: Ethiopic letters are word characters too, so \b keeps አለ ("available") from matching
+# inside longer words such as አለመኖሩ ("its absence")
+UNAVAILABLE_PATTERN = re.compile(r"\b(?:out of stock|not available|unavailable|sold out|የለም)\b", re.IGNORECASE)
+AVAILABLE_PATTERN = re.compile(r"\b(?:available|in stock|አለ)\b", re.IGNORECASE)
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every dictionary alias in a text in a single pass."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for alias, product in patterns.items():
+            node = 0
+            for char in alias:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = next_node
+                node = next_node
+            self.output[node].append((len(alias), product))
+
+        # Breadth-first pass to set each node's failure link to its longest proper suffix in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_node] = self.goto[fallback].get(char, 0)
+                self.output[next_node] = self.output[next_node] + self.output[self.fail[next_node]]
+
+    def search(self, text):
+        """Yields (start, end, product) for every alias occurrence in text."""
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length, product in self.output[node]:
+                yield i - length + 1, i + 1, product
+
+def load_dictionary(path=DRUG_DICTIONARY):
+    """Reads the product dictionary as {alias: product}, lower-cased."""
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['alias'].strip().lower(): row['product'].strip().lower() for row in csv.DictReader(f)}
+
+def is_word_boundary(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+def find_prices(text):
+    """Returns [(start, end, amount, currency)] for every price in text."""
+    prices = []
+    for match in PRICE_PATTERN.finditer(text):
+        amount = match.group('prefix_amount') or match.group('amount')
+        currency = match.group('prefix_currency') or match.group('currency')
+        prices.append((match.start(), match.end(), float(amount.replace(',', '')),
+                       'USD' if currency == '$' else 'ETB'))
+    return prices
+
+def availability(text):
+    """True/False when the message says a product is (un)available, None when it says neither."""
+    if UNAVAILABLE_PATTERN.search(text):
+        return False
+    if AVAILABLE_PATTERN.search(text):
+        return True
+    return None
+
+def extract_mentions(text, matcher):
+    """Returns [(product, price, currency, available)] for each dictionary product a message mentions.
+
+    An alias inside a longer one ("amoxicillin" in "amoxicillin clavulanate") is not a mention of its own.
+    A product gets the nearest price following its first mention within PRICE_WINDOW characters,
+    or failing that the nearest one before it when the price opens the message ahead of every mention.
+    """
+    lowered = text.lower()
+    matches = [m for m in matcher.search(lowered) if is_word_boundary(lowered, m[0], m[1])]
+    mentions = {}
+    covered_until = -1
+    # By start, longest first, so a match ending within the one before it is contained in it
+    for start, end, product in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if end <= covered_until:
+            continue
+        covered_until = end
+        mentions.setdefault(product, (start, end))
+    if not mentions:
+        return []
+
+    prices = find_prices(lowered)
+    available = availability(lowered)
+    first_mention_end = min(end for _, end in mentions.values())
+    rows = []
+    for product, (start, end) in mentions.items():
+        after = [p for p in prices if end <= p[0] <= end + PRICE_WINDOW]
+        before = [p for p in prices if start - PRICE_WINDOW <= p[0] < first_mention_end and p[1] <= start]
+        price = after[0] if after else (before[-1] if before else None)
+        rows.append((product, price[2] if price else None, price[3] if price else None, available))
+    return rows
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=PG_DB,
+        user=PG_USER,
+        password=PG_PASSWORD,
+        host=PG_HOST,
+        port=PG_PORT
+    )
+
+def create_tables(conn):
+    """Creates the product_mentions mart table and the shared pipeline_watermarks table if they don't exist."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS product_mentions (
+                message_id BIGINT NOT NULL,
+                channel_sk TEXT NOT NULL,
+                product TEXT NOT NULL,
+                price NUMERIC(12, 2),
+                currency TEXT,
+                available BOOLEAN,
+                message_date DATE,
+                duplicate_group_id BIGINT, -- fct_messages.duplicate_group_id: mentions in reposts count once
+                extracted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (message_id, channel_sk, product)
+            );
+        """)
+        # Tables created before message_date / duplicate_group_id were tracked; run with --full-refresh to back-fill them
+        cur.execute("ALTER TABLE product_mentions ADD COLUMN IF NOT EXISTS message_date DATE;")
+        cur.execute("ALTER TABLE product_mentions ADD COLUMN IF NOT EXISTS duplicate_group_id BIGINT;")
+        cur.execute("CREATE INDEX IF NOT EXISTS product_mentions_product_idx ON product_mentions (product, channel_sk);")
+        cur.execute("CREATE INDEX IF NOT EXISTS product_mentions_date_idx ON product_mentions (message_date, channel_sk);")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_watermarks (
+                stage TEXT PRIMARY KEY,
+                watermark TIMESTAMP WITH TIME ZONE,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+def get_watermark(conn, stage=STAGE_NAME):
+    with conn.cursor() as cur:
+        cur.execute("SELECT watermark FROM pipeline_watermarks WHERE stage = %s;", (stage,))
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+def set_watermark(conn, watermark, stage=STAGE_NAME):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO pipeline_watermarks (stage, watermark) VALUES (%s, %s)
+            ON CONFLICT (stage) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = CURRENT_TIMESTAMP;
+        """, (stage, watermark))
+    conn.commit()
+
+def write_batch(conn, messages, rows):
+    """Replaces the mentions of a batch of (message_id, channel_sk) messages, so re-running a batch is idempotent."""
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, """
+            DELETE FROM product_mentions pm
+            USING (VALUES %s) AS batch (message_id, channel_sk)
+            WHERE pm.message_id = batch.message_id AND pm.channel_sk = batch.channel_sk;
+        """, messages)
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO product_mentions (message_id, channel_sk, product, price, currency, available, message_date,
+                                          duplicate_group_id)
+            VALUES %s
+            ON CONFLICT (message_id, channel_sk, product) DO NOTHING;
+        """, rows)
+    conn.commit()
+
+def run_extraction(full_refresh=False):
+    """Extracts product mentions from the messages added to or regrouped in fct_messages since the last run.
+
+    Returns False on failure.
+    """
+    matcher = AhoCorasick(load_dictionary())
+    read_conn = write_conn = None
+    try:
+        read_conn = get_connection()
+        write_conn = get_connection()
+        create_tables(write_conn)
+        if full_refresh:
+            with write_conn.cursor() as cur:
+                cur.execute("TRUNCATE product_mentions;")
+            write_conn.commit()
+        watermark = None if full_refresh else get_watermark(write_conn)
+        groups_watermark = None if full_refresh else get_watermark(write_conn, stage=GROUPS_STAGE_NAME)
+        logging.info(f"Extracting product mentions from messages scraped after {watermark or 'the beginning'} "
+                     f"or regrouped after {groups_watermark or 'the beginning'}.")
+
+        start = time.perf_counter()
+        processed = mentioned = 0
+        new_watermark = watermark
+        new_groups_watermark = groups_watermark
+        # Server-side cursor: messages are streamed in EXTRACT_BATCH_SIZE chunks instead of fetched all at once
+        with read_conn.cursor(name='product_extraction') as cur:
+            cur.itersize = EXTRACT_BATCH_SIZE
+            cur.execute("""
+                SELECT fm.message_id, fm.channel_sk, fm.message_content, fm.scraped_at, dd.date_day,
+                       fm.duplicate_group_id, fm.grouped_at
+                FROM fct_messages fm
+                JOIN dim_dates dd ON fm.date_sk = dd.date_sk
+                WHERE (fm.scraped_at > COALESCE(%s, '-infinity') OR fm.grouped_at > COALESCE(%s, '-infinity'))
+                  AND fm.message_content IS NOT NULL AND fm.message_content <> '';
+            """, (watermark, groups_watermark))
+            while True:
+                batch = cur.fetchmany(EXTRACT_BATCH_SIZE)
+                if not batch:
+                    break
+                rows = []
+                for message_id, channel_sk, message_content, scraped_at, message_date, group_id, grouped_at in batch:
+                    for product, price, currency, available in extract_mentions(message_content, matcher):
+                        rows.append((message_id, channel_sk, product, price, currency, available, message_date, group_id))
+                    if new_watermark is None or scraped_at > new_watermark:
+                        new_watermark = scraped_at
+                    if grouped_at is not None and (new_groups_watermark is None or grouped_at > new_groups_watermark):
+                        new_groups_watermark = grouped_at
+                write_batch(write_conn, [(m[0], m[1]) for m in batch], rows)
+                processed += len(batch)
+                mentioned += len(rows)
+
+        # Advance the watermark only once every batch is written; an interrupted run redoes its batches.
+        if new_watermark is not None:
+            set_watermark(write_conn, new_watermark)
+        if new_groups_watermark is not None:
+            set_watermark(write_conn, new_groups_watermark, stage=GROUPS_STAGE_NAME)
+        if processed:
+            mark_data_version(write_conn, STAGE_NAME)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        logging.info(f"Extracted {mentioned} product mentions from {processed} messages in {elapsed:.2f}s "
+                     f"({processed / elapsed:.0f} messages/sec).")
+        return True
+    except psycopg2.Error as e:
+        logging.critical(f"Database connection or operation error: {e}")
+        return False
+    finally:
+        for conn in (read_conn, write_conn):
+            if conn:
+                conn.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract product, price and availability mentions from message text.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Ignore the watermark and rebuild product_mentions from every message.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if not run_extraction(full_refresh=parse_args().full_refresh):
+        sys.exit(1) # Non-zero exit so run_pipeline.py records the stage as failed
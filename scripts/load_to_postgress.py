@@ -1,7 +1,27 @@
 import os
+import sys
 import json
+import time
+import io
+import gzip
+import codecs
+import hashlib
+import argparse
+import logging
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import psycopg2
+import psycopg2.extras
 from dotenv import load_dotenv
+try:
+    import zstandard
+except ImportError: # Optional: only needed to read .jsonl.zst files
+    zstandard = None
+ZSTD_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root, for the shared common package
+from common.data_version import create_data_version_table
+from common.instrumentation import counter, gauge, histogram, job
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,92 +33,603 @@ POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 POSTGRES_HOST = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT')
 RAW_DATA_DIR = os.getenv('RAW_DATA_DIR', 'data/raw/telegram_messages') # Default if not set
+LOAD_MODE = os.getenv('LOAD_MODE', 'bulk') # 'bulk' (COPY + set-based merge) or 'row' (one INSERT per message)
+LOADER_WORKERS = int(os.getenv('LOADER_WORKERS', '4')) # Worker processes for bulk mode, one connection each
+LOADER_KEEP_JSON = os.getenv('LOADER_KEEP_JSON', '').lower() in ('1', 'true', 'yes') # Also store the original payload
+STREAM_CHUNK_SIZE = 1 << 16 # Bytes read at a time when streaming a JSON file
+# Legacy JSON arrays and the scraper's JSON Lines output, optionally gzip/zstd compressed
+MESSAGE_FILE_SUFFIXES = ('.json', '.jsonl', '.jsonl.gz', '.jsonl.zst')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MESSAGES_LOADED = counter('loader_messages_total', "Messages read by the loader, by outcome (inserted, refreshed, duplicate, invalid).")
+FILES_READ = counter('loader_files_total', "Message files considered by the loader, by outcome (loaded, failed, unchanged).")
+DB_ROUNDTRIP_SECONDS = histogram('loader_db_roundtrip_seconds', "Duration of the loader's database statements, by operation.")
+LOADER_THROUGHPUT = gauge('loader_messages_per_second', "Messages read per second by the last load.")
 
-# Ensure the raw data directory exists
-if not os.path.exists(RAW_DATA_DIR):
-    print(f"Error: Raw data directory '{RAW_DATA_DIR}' not found. Please ensure your Telegram JSON files are here.")
-    exit(1)
+# Typed columns of raw.telegram_messages and the scraped JSON field each one comes from. Staging reads these
+# directly, so no JSON is parsed per row downstream.
+TYPED_COLUMNS = [
+    ('channel_name', 'TEXT', 'post_channel_name'),
+    ('date', 'TIMESTAMP WITH TIME ZONE', 'date'),
+    ('text', 'TEXT', 'text'),
+    ('sender_id', 'BIGINT', 'sender_id'),
+    ('views', 'INTEGER', 'views'),
+    ('forwards', 'INTEGER', 'forwards'),
+    ('replies_count', 'INTEGER', 'replies_count'),
+    ('media_path', 'TEXT', 'media_path'),
+    ('media_type', 'TEXT', 'media_type'),
+    ('is_sponsored', 'BOOLEAN', 'is_sponsored'),
+    ('message_link', 'TEXT', 'message_link'),
+]
+TYPED_COLUMN_NAMES = [name for name, _, _ in TYPED_COLUMNS]
+# Accepted spellings of a BOOLEAN field besides JSON true/false
+BOOL_STRINGS = {'true': True, 't': True, '1': True, 'yes': True, 'false': False, 'f': False, '0': False, 'no': False}
+INSERT_COLUMNS = ', '.join(['channel_id', 'message_id'] + TYPED_COLUMN_NAMES + ['message_json'])
+REFRESHED_VALUES = ', '.join(f"COALESCE(EXCLUDED.{name}, t.{name})" for name in TYPED_COLUMN_NAMES)
+
+# Messages scraped again (e.g. the scraper's look-back window) refresh the stored row: non-null values in the
+# new copy win, nulls never erase what is already stored, and rows that would not change are left untouched.
+# loaded_at moves forward on every refresh, so dbt's incremental models pick the change up.
+UPSERT_ON_CONFLICT = f"""
+    ON CONFLICT (channel_id, message_id) DO UPDATE
+    SET ({', '.join(TYPED_COLUMN_NAMES)}, message_json, loaded_at) = (
+        {REFRESHED_VALUES},
+        CASE WHEN EXCLUDED.message_json IS NULL THEN t.message_json
+             ELSE COALESCE(t.message_json, '{{}}'::JSONB) || jsonb_strip_nulls(EXCLUDED.message_json) END,
+        CURRENT_TIMESTAMP
+    )
+    WHERE ({', '.join(f't.{name}' for name in TYPED_COLUMN_NAMES)}) IS DISTINCT FROM ({REFRESHED_VALUES})
+"""
 
 def create_raw_table(cursor):
     """Creates the raw schema and telegram_messages table if they don't exist."""
     cursor.execute("CREATE SCHEMA IF NOT EXISTS raw;")
     cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = 'raw' AND table_name = 'telegram_messages' AND column_name = 'date';
+    """)
+    has_typed_columns = cursor.fetchone()[0] > 0
+    typed_column_defs = ',\n'.join(f"            {name} {sql_type}" for name, sql_type, _ in TYPED_COLUMNS)
+    cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS raw.telegram_messages (
             id SERIAL PRIMARY KEY,
-            message_json JSONB NOT NULL,
+            channel_id BIGINT,
+            message_id BIGINT,
+{typed_column_defs},
+            message_json JSONB, -- Original payload, only written when LOADER_KEEP_JSON is set
             loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    print("Ensured raw.telegram_messages table exists.")
+    # Tables created before the (channel_id, message_id) key existed get the columns added
+    # and back-filled from the JSON payload, and any duplicate rows removed, so the unique index can be built.
+    cursor.execute("""
+        ALTER TABLE raw.telegram_messages
+            ADD COLUMN IF NOT EXISTS channel_id BIGINT,
+            ADD COLUMN IF NOT EXISTS message_id BIGINT;
+    """)
+    cursor.execute("SELECT to_regclass('raw.telegram_messages_channel_message_key');")
+    if cursor.fetchone()[0] is None:
+        cursor.execute("""
+            UPDATE raw.telegram_messages
+            SET channel_id = COALESCE((message_json->>'post_channel_id')::BIGINT, 0),
+                message_id = COALESCE(message_json->>'message_id', message_json->>'id')::BIGINT
+            WHERE message_id IS NULL;
+        """)
+        cursor.execute("""
+            DELETE FROM raw.telegram_messages
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY channel_id, message_id ORDER BY id) AS copy_number
+                    FROM raw.telegram_messages
+                ) ranked
+                WHERE copy_number > 1
+            );
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX telegram_messages_channel_message_key
+                ON raw.telegram_messages (channel_id, message_id);
+        """)
+    # Tables from the JSON-only layout get the typed columns, filled once from the payload they already hold
+    if not has_typed_columns:
+        cursor.execute(
+            "ALTER TABLE raw.telegram_messages "
+            + ', '.join(f"ADD COLUMN IF NOT EXISTS {name} {sql_type}" for name, sql_type, _ in TYPED_COLUMNS)
+            + ", ALTER COLUMN message_json DROP NOT NULL;"
+        )
+        cursor.execute(
+            "UPDATE raw.telegram_messages SET "
+            + ', '.join(f"{name} = (message_json->>'{field}')::{sql_type}" for name, sql_type, field in TYPED_COLUMNS)
+            + " WHERE message_json IS NOT NULL;"
+        )
+    if LOADER_KEEP_JSON:
+        # Payloads are a few hundred bytes, under the default 2 kB threshold at which TOAST starts compressing
+        cursor.execute("ALTER TABLE raw.telegram_messages SET (toast_tuple_target = 256);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS raw.load_manifest (
+            path TEXT PRIMARY KEY,
+            size BIGINT NOT NULL,
+            mtime DOUBLE PRECISION NOT NULL,
+            checksum TEXT NOT NULL,
+            messages INTEGER NOT NULL,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    # Bumped by dbt's on-run-end hook, which expects the table to exist
+    create_data_version_table(cursor)
+    print("Ensured raw.telegram_messages and raw.load_manifest tables exist.")
 
-def load_json_to_db(file_path, cursor):
-    """Loads a single JSON file into the raw.telegram_messages table."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+def message_key(message):
+    """Returns the (channel_id, message_id) dedup key of a scraped message, or None if it has no id."""
+    # The scraper writes 'message_id'/'post_channel_id'; older dumps only carry 'id'.
+    message_id = message.get('message_id', message.get('id'))
+    if message_id is None:
+        return None
+    return int(message.get('post_channel_id') or 0), int(message_id)
 
-        if not isinstance(data, list):
-            data = [data] # Ensure data is a list of messages
+def parse_bool(value):
+    """A JSON boolean, or one of the BOOL_STRINGS; bool() would read "false" as True."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in BOOL_STRINGS:
+        return BOOL_STRINGS[value.strip().lower()]
+    raise ValueError(f"not a boolean: {value!r}")
 
-        for message in data:
-            # Check if message with this 'id' already exists to prevent duplicates
-            message_id = message.get('id')
-            if message_id is None:
-                print(f"Warning: Skipping message in {file_path} due to missing 'id'.")
-                continue
+def typed_values(message):
+    """The message's TYPED_COLUMNS values, converted in Python so a malformed field fails one message, not a COPY.
 
-            # Check for existing message by its original Telegram ID (if available and reliable)
-            # For simplicity, if we are loading entire files, we might just insert,
-            # but for de-duplication, checking the original message ID is better.
-            # Assuming 'id' in JSON is a unique identifier from Telegram.
-            cursor.execute(
-                "SELECT id FROM raw.telegram_messages WHERE (message_json->>'id')::BIGINT = %s;",
-                (message_id,)
-            )
-            if cursor.fetchone():
-                print(f"Message with original ID {message_id} from {file_path} already exists. Skipping.")
+    Raises ValueError or TypeError for a field that doesn't convert.
+    """
+    values = []
+    for _, sql_type, field in TYPED_COLUMNS:
+        value = message.get(field)
+        if field == 'text' and value is None:
+            value = message.get('message') # Older dumps
+        if value is None:
+            pass
+        elif sql_type in ('BIGINT', 'INTEGER'):
+            value = int(value)
+        elif sql_type == 'BOOLEAN':
+            value = parse_bool(value)
+        elif sql_type.startswith('TIMESTAMP'):
+            if not isinstance(value, str):
+                raise TypeError(f"{field} must be an ISO 8601 string, not {type(value).__name__}")
+            datetime.fromisoformat(value.replace('Z', '+00:00')) # Validates; Postgres parses the ISO string itself
+        values.append(value)
+    return values
+
+def copy_field(value):
+    """A value in COPY's text format: \\N for NULL, with backslashes, tabs and newlines escaped."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def iter_json_array(file_path, digest=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the messages of a JSON array file one at a time, reading it in fixed-size chunks."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof = '', 0, False
+
+    with open(file_path, 'rb') as f:
+        def fill():
+            nonlocal buffer, pos, eof
+            raw = f.read(chunk_size)
+            if digest is not None:
+                digest.update(raw)
+            eof = not raw
+            buffer = buffer[pos:] + utf8.decode(raw, final=eof)
+            pos = 0
+
+        def next_char():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if eof:
+                    return ''
+                fill()
+
+        if next_char() != '[':
+            # Not an array: a single message object, which is small enough to read whole.
+            while not eof:
+                fill()
+            yield decoder.decode(buffer[pos:])
+            return
+
+        pos += 1
+        if next_char() == ']':
+            pos += 1
+        else:
+            while True:
+                next_char()
+                while True:
+                    try:
+                        message, pos = decoder.raw_decode(buffer, pos)
+                        break
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        fill() # The item is cut off at the end of the buffer; read more and retry
+                yield message
+
+                separator = next_char()
+                pos += 1
+                if separator == ']':
+                    break
+                if separator != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos - 1)
+
+        # Read any trailing bytes so the checksum covers the whole file.
+        while not eof:
+            fill()
+
+class HashingReader(io.RawIOBase):
+    """Raw binary reader that feeds every byte it reads into a hashlib digest."""
+
+    def __init__(self, f, digest):
+        self._f = f
+        self._digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._f.readinto(b)
+        if self._digest is not None and n:
+            self._digest.update(memoryview(b)[:n])
+        return n
+
+def iter_jsonl(file_path, digest=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the messages of a JSON Lines file (plain, .gz or .zst) one line at a time."""
+    with open(file_path, 'rb') as f:
+        raw = io.BufferedReader(HashingReader(f, digest), buffer_size=chunk_size)
+        if file_path.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=raw)
+        elif file_path.endswith('.zst'):
+            if zstandard is None:
+                raise ValueError("reading .zst files requires the 'zstandard' package")
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+        else:
+            stream = raw
+        lines = io.TextIOWrapper(stream, encoding='utf-8') # Kept referenced: collecting it would close `raw`
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        # Read any trailing bytes so the checksum covers the whole file.
+        while raw.read(chunk_size):
+            pass
+
+def iter_messages(file_path, digest=None):
+    """Streams the messages of a scraped file, either a legacy JSON array or JSON Lines."""
+    if file_path.endswith('.json'):
+        return iter_json_array(file_path, digest)
+    return iter_jsonl(file_path, digest)
+
+def is_message_file(file_name):
+    return file_name.endswith(MESSAGE_FILE_SUFFIXES)
+
+def load_json_to_db(file_path, cursor):
+    """Loads a single JSON file into the raw.telegram_messages table, one INSERT per message."""
+    outcomes = {'inserted': 0, 'unchanged': 0, 'invalid': 0}
+    try:
+        for message in iter_messages(file_path):
+            key = message_key(message)
+            try:
+                values = typed_values(message)
+            except (ValueError, TypeError):
+                key = None
+            if key is None:
+                outcomes['invalid'] += 1
                 continue
 
+            # The unique (channel_id, message_id) index does the de-duplication.
+            start = time.perf_counter()
             cursor.execute(
-                "INSERT INTO raw.telegram_messages (message_json) VALUES (%s);",
-                (json.dumps(message),) # psycogp2 expects string for JSONB
+                f"""
+                INSERT INTO raw.telegram_messages AS t ({INSERT_COLUMNS})
+                VALUES ({', '.join(['%s'] * (len(values) + 3))})
+                {UPSERT_ON_CONFLICT};
+                """,
+                (*key, *values, json.dumps(message) if LOADER_KEEP_JSON else None) # psycogp2 expects string for JSONB
             )
-            print(f"Loaded message {message_id} from {file_path}")
+            DB_ROUNDTRIP_SECONDS.observe(time.perf_counter() - start, operation='insert')
+            outcomes['inserted' if cursor.rowcount else 'unchanged'] += 1
+        FILES_READ.inc(outcome='loaded')
 
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from {file_path}: {e}")
+        FILES_READ.inc(outcome='failed')
     except Exception as e:
         print(f"Error loading {file_path}: {e}")
+        FILES_READ.inc(outcome='failed')
+    for outcome, count in outcomes.items():
+        MESSAGES_LOADED.inc(count, outcome=outcome)
+    print(f"Loaded {outcomes['inserted']} messages from {file_path}; "
+          f"{outcomes['unchanged']} already stored unchanged, {outcomes['invalid']} without an id.")
+
+class CopyStream:
+    """Minimal file-like object that feeds an iterator of COPY text lines to cursor.copy_expert."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT
+    )
+
+def copy_lines(files, stats, loaded):
+    """Yields one COPY text-format line per message across the given (path, size, mtime) files.
+
+    Every file read to the end is appended to `loaded` with its checksum and message count.
+    """
+    for file_path, size, mtime in files:
+        digest = hashlib.sha256()
+        messages = 0
+        try:
+            for message in iter_messages(file_path, digest):
+                key = message_key(message)
+                try:
+                    values = typed_values(message)
+                except (ValueError, TypeError):
+                    key = None
+                if key is None:
+                    stats['invalid'] += 1
+                    continue
+                # json.dumps escapes control characters, so only backslashes need escaping for COPY's text format.
+                payload = json.dumps(message).replace('\\', '\\\\') if LOADER_KEEP_JSON else '\\N'
+                stats['rows'] += 1
+                messages += 1
+                yield '\t'.join([str(key[0]), str(key[1])] + [copy_field(value) for value in values] + [payload]) + '\n'
+        except (OSError, ValueError, EOFError, *ZSTD_ERRORS) as e:
+            # Truncated .gz (EOFError) and corrupt .zst frames fail like unreadable files.
+            # Messages already streamed from a half-read file are still merged; the file is retried next run.
+            print(f"Error reading {file_path}: {e}")
+            stats['failed_files'] += 1
+            continue
+        stats['files'] += 1
+        loaded.append((manifest_path(file_path), size, mtime, digest.hexdigest(), messages))
+
+def bulk_load_partition(files, conn):
+    """Streams one day's JSON files into a staging table with COPY and merges them into raw.telegram_messages.
+
+    The merge and the manifest entries of the files it read are committed in one transaction.
+    """
+    stats = {'files': 0, 'failed_files': 0, 'rows': 0, 'invalid': 0, 'inserted': 0, 'refreshed': 0,
+             'copy_seconds': 0.0, 'merge_seconds': 0.0}
+    loaded = []
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE telegram_messages_stage (
+                seq BIGSERIAL,
+                channel_id BIGINT,
+                message_id BIGINT,
+                {', '.join(f"{name} {sql_type}" for name, sql_type, _ in TYPED_COLUMNS)},
+                message_json JSONB
+            ) ON COMMIT DROP;
+        """)
+        start = time.perf_counter()
+        cursor.copy_expert(
+            f"COPY telegram_messages_stage ({INSERT_COLUMNS}) FROM STDIN",
+            CopyStream(copy_lines(files, stats, loaded))
+        )
+        # COPY time includes reading and parsing the files, which are streamed into it
+        stats['copy_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO raw.telegram_messages AS t ({INSERT_COLUMNS})
+                SELECT DISTINCT ON (channel_id, message_id) {INSERT_COLUMNS}
+                FROM telegram_messages_stage
+                -- A message can appear more than once in a partition (appended JSON Lines, look-back refreshes);
+                -- keep the latest copy, preferring one that carries the media downloaded for it.
+                ORDER BY channel_id, message_id, (media_path IS NOT NULL) DESC, seq DESC
+                {UPSERT_ON_CONFLICT}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged;
+        """)
+        stats['inserted'], stats['refreshed'] = cursor.fetchone()
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO raw.load_manifest (path, size, mtime, checksum, messages)
+            VALUES %s
+            ON CONFLICT (path) DO UPDATE
+            SET size = EXCLUDED.size,
+                mtime = EXCLUDED.mtime,
+                checksum = EXCLUDED.checksum,
+                messages = EXCLUDED.messages,
+                loaded_at = CURRENT_TIMESTAMP;
+        """, loaded)
+    conn.commit()
+    stats['merge_seconds'] = time.perf_counter() - start
+    return stats
+
+def load_partition_worker(partition, files):
+    """Process-pool entry point: loads one day partition on the worker's own connection."""
+    conn = get_connection()
+    try:
+        return partition, bulk_load_partition(files, conn)
+    finally:
+        conn.close()
+
+def manifest_path(file_path):
+    """Manifest key of a file: its path relative to RAW_DATA_DIR, so it survives a different mount point."""
+    return os.path.relpath(file_path, RAW_DATA_DIR)
+
+def load_manifest(cursor):
+    cursor.execute("SELECT path, size, mtime, checksum FROM raw.load_manifest;")
+    return {path: (size, mtime, checksum) for path, size, mtime, checksum in cursor.fetchall()}
+
+def file_checksum(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """sha256 of a file's bytes, the same digest copy_lines records while reading it."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_partitions(data_dir, manifest=None):
+    """Groups the message files under data_dir by day directory (RAW_DATA_DIR/YYYY-MM-DD/<channel>.jsonl).
+
+    Files whose size and mtime match their manifest entry are left out without being opened. A file with the
+    recorded size but a new mtime (copied, restored from a backup, touched) is hashed, and left out too when its
+    checksum still matches.
+    Returns the partitions as {directory: [(path, size, mtime), ...]}, the number of skipped files and the
+    (path, mtime) of the skipped files whose manifest mtime should be brought up to date.
+    """
+    manifest = manifest or {}
+    partitions = {}
+    skipped = 0
+    touched = []
+    for root, _, files in os.walk(data_dir):
+        for file_name in sorted(files):
+            if not is_message_file(file_name):
+                continue
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            key = manifest_path(file_path)
+            size, mtime, checksum = manifest.get(key, (None, None, None))
+            if size == stat.st_size and mtime == stat.st_mtime:
+                skipped += 1
+                continue
+            if size == stat.st_size and checksum and file_checksum(file_path) == checksum:
+                skipped += 1
+                touched.append((key, stat.st_mtime))
+                continue
+            partitions.setdefault(root, []).append((file_path, stat.st_size, stat.st_mtime))
+    return dict(sorted(partitions.items())), skipped, touched
+
+def bulk_load(conn, workers=LOADER_WORKERS, use_manifest=True):
+    """Loads every new or changed day partition with COPY and reports throughput and duplicates skipped."""
+    totals = {'files': 0, 'failed_files': 0, 'rows': 0, 'invalid': 0, 'inserted': 0, 'refreshed': 0,
+              'copy_seconds': 0.0, 'merge_seconds': 0.0}
+    start = time.perf_counter()
+
+    with conn.cursor() as cursor:
+        manifest = load_manifest(cursor) if use_manifest else {}
+    partitions, unchanged, touched = find_partitions(RAW_DATA_DIR, manifest)
+    if touched:
+        # Same content under a new mtime: record the new mtime so the next run skips them without hashing
+        with conn.cursor() as cursor:
+            psycopg2.extras.execute_values(cursor, """
+                UPDATE raw.load_manifest AS m SET mtime = v.mtime
+                FROM (VALUES %s) AS v (path, mtime)
+                WHERE m.path = v.path;
+            """, touched)
+        conn.commit()
+    print(f"Found {sum(len(files) for files in partitions.values())} new or changed files "
+          f"in {len(partitions)} partitions; {unchanged} files already loaded.")
+
+    def add(partition, stats):
+        print(f"Loaded partition {partition}: {stats['inserted']} new and {stats['refreshed']} refreshed "
+              f"of {stats['rows']} messages from {stats['files']} files.")
+        for name, value in stats.items():
+            totals[name] += value
+        # Partitions load in worker processes, so their timings are recorded here from the returned stats
+        DB_ROUNDTRIP_SECONDS.observe(stats['copy_seconds'], operation='copy')
+        DB_ROUNDTRIP_SECONDS.observe(stats['merge_seconds'], operation='merge')
+        MESSAGES_LOADED.inc(stats['inserted'], outcome='inserted')
+        MESSAGES_LOADED.inc(stats['refreshed'], outcome='refreshed')
+        MESSAGES_LOADED.inc(stats['rows'] - stats['inserted'] - stats['refreshed'], outcome='duplicate')
+        MESSAGES_LOADED.inc(stats['invalid'], outcome='invalid')
+        FILES_READ.inc(stats['files'], outcome='loaded')
+        FILES_READ.inc(stats['failed_files'], outcome='failed')
+
+    if workers <= 1:
+        for partition, files in partitions.items():
+            add(partition, bulk_load_partition(files, conn))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(load_partition_worker, partition, files) for partition, files in partitions.items()]
+            for future in as_completed(futures):
+                add(*future.result())
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    FILES_READ.inc(unchanged, outcome='unchanged')
+    LOADER_THROUGHPUT.set(totals['rows'] / elapsed)
+
+    duplicates = totals['rows'] - totals['inserted'] - totals['refreshed']
+    print(
+        f"Loaded {totals['inserted']} new and refreshed {totals['refreshed']} existing messages from {totals['files']} files in {elapsed:.2f}s "
+        f"({totals['rows'] / elapsed:.0f} rows/sec, {totals['files'] / elapsed:.2f} files/sec). "
+        f"Skipped {duplicates} duplicates, {totals['invalid']} messages without an id "
+        f"and {unchanged} unchanged files; {totals['failed_files']} files could not be read."
+    )
+    return totals
+
+def row_load(cursor):
+    """Loads every message file message by message."""
+    for root, _, files in os.walk(RAW_DATA_DIR):
+        for file_name in files:
+            if is_message_file(file_name):
+                file_path = os.path.join(root, file_name)
+                print(f"Processing file: {file_path}")
+                load_json_to_db(file_path, cursor)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load scraped Telegram JSON files into raw.telegram_messages.")
+    parser.add_argument('--mode', choices=['bulk', 'row'], default=LOAD_MODE,
+                        help="'bulk' streams each day's files through COPY; 'row' inserts one message at a time.")
+    parser.add_argument('--workers', type=int, default=LOADER_WORKERS,
+                        help="Number of worker processes loading day partitions in parallel (bulk mode).")
+    parser.add_argument('--ignore-manifest', action='store_true',
+                        help="Re-read every file, even those the manifest records as already loaded.")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    # Ensure the raw data directory exists
+    if not os.path.exists(RAW_DATA_DIR):
+        print(f"Error: Raw data directory '{RAW_DATA_DIR}' not found. Please ensure your Telegram JSON files are here.")
+        sys.exit(1)
+
     conn = None
+    failed = False
     try:
-        conn = psycopg2.connect(
-            dbname=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD,
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT
-        )
-        conn.autocommit = True # Auto-commit each transaction for simplicity in loading
+        conn = get_connection()
 
-        with conn.cursor() as cursor:
-            create_raw_table(cursor)
-
-            for root, _, files in os.walk(RAW_DATA_DIR):
-                for file_name in files:
-                    if file_name.endswith('.json'):
-                        file_path = os.path.join(root, file_name)
-                        print(f"Processing file: {file_path}")
-                        load_json_to_db(file_path, cursor)
+        if args.mode == 'bulk':
+            with conn.cursor() as cursor:
+                create_raw_table(cursor)
+            conn.commit()
+            bulk_load(conn, workers=args.workers, use_manifest=not args.ignore_manifest)
+        else:
+            conn.autocommit = True # Auto-commit each transaction for simplicity in loading
+            with conn.cursor() as cursor:
+                create_raw_table(cursor)
+                row_load(cursor)
         print("Finished loading raw JSON data.")
 
     except Exception as e:
         print(f"Database connection or operation error: {e}")
+        failed = True
     finally:
         if conn:
             conn.close()
             print("Database connection closed.")
+    if failed:
+        sys.exit(1) # Non-zero exit so run_pipeline.py stops the stages that depend on the load
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with job('loader'):
+        main()
@@ -0,0 +1,172 @@
+"""Content-addressed store for downloaded media, shared by the scraper and enrichment.
+
+Every file is stored once under RAW_IMAGES_DIR/objects/<ab>/<cd>/<sha256><ext>, keyed by the SHA-256 of its
+bytes, so an image reposted across channels (or twice in one) takes the disk space of one copy. The per-channel
+folders, RAW_IMAGES_DIR/<Channel_Name>/<telegram file name>, are hard links to the objects.
+
+A message's media_path is the object's key, '<sha256><ext>', which resolve() maps to a path wherever the store is
+mounted. Images also get a thumbnail no larger than MEDIA_THUMBNAIL_SIZE (the model's input size) under
+thumbnails/, which enrichment reads instead of the full-resolution original.
+
+    python scripts/media_store.py --migrate    # move files from the per-channel layout into the store
+"""
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import argparse
+import logging
+from dotenv import load_dotenv
+try:
+    from PIL import Image
+except ImportError: # Optional for the scraper: without Pillow, thumbnails are made on first use by enrichment
+    Image = None
+
+load_dotenv()
+
+RAW_IMAGES_DIR = os.getenv('RAW_IMAGES_DIR', '/app/data/raw/telegram_images')
+OBJECTS_DIR = os.path.join(RAW_IMAGES_DIR, 'objects')
+THUMBNAILS_DIR = os.path.join(RAW_IMAGES_DIR, 'thumbnails')
+INCOMING_DIR = os.path.join(RAW_IMAGES_DIR, 'incoming') # Downloads in progress, on the same file system as objects/
+MEDIA_THUMBNAIL_SIZE = int(os.getenv('MEDIA_THUMBNAIL_SIZE', '640'))
+STORE_DIRS = {'objects', 'thumbnails', 'incoming'}
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]{1,10})?$')
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_key(media_path):
+    return bool(media_path) and KEY_PATTERN.match(media_path) is not None
+
+def key_digest(key):
+    return key.split('.', 1)[0]
+
+def object_path(key):
+    digest = key_digest(key)
+    return os.path.join(OBJECTS_DIR, digest[:2], digest[2:4], key)
+
+def thumbnail_path(key):
+    digest = key_digest(key)
+    return os.path.join(THUMBNAILS_DIR, digest[:2], digest[2:4], f"{digest}.jpg")
+
+def channel_dir(channel_name):
+    return os.path.join(RAW_IMAGES_DIR, channel_name.replace(' ', '_'))
+
+def incoming_path(file_name):
+    """A download's own temp path: concurrent downloads of the same file (a repost) must not share one."""
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    return os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}-{file_name}")
+
+def link(source, target):
+    """Hard-links target to source (copying across file systems); an existing target is left alone."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(source, target)
+
+def make_thumbnail(key):
+    """Writes the key's thumbnail if it is an image and has none yet; returns its path, or None."""
+    path = thumbnail_path(key)
+    if os.path.exists(path):
+        return path
+    if Image is None or not key.lower().endswith(IMAGE_SUFFIXES):
+        return None
+    try:
+        with Image.open(object_path(key)) as img:
+            img = img.convert('RGB')
+            img.thumbnail((MEDIA_THUMBNAIL_SIZE, MEDIA_THUMBNAIL_SIZE), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            img.save(tmp_path, 'JPEG', quality=90)
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        # Any decode failure (truncated file, decompression bomb, MemoryError) just means no thumbnail
+        logger.warning(f"Could not make a thumbnail of {key}: {e}")
+        return None
+
+def ingest(path, channel_name=None, file_name=None):
+    """Adds a file to the store and returns its key.
+
+    Files under incoming/ are moved into place (or dropped, if the content is already stored); any other file is
+    hard-linked. With channel_name, the file also appears in the channel's folder as file_name.
+    """
+    extension = os.path.splitext(file_name or '')[1] or os.path.splitext(path)[1]
+    key = f"{file_sha256(path)}{extension.lower()}"
+    target = object_path(key)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(INCOMING_DIR):
+            os.replace(path, target)
+        else:
+            link(path, target)
+    elif os.path.dirname(os.path.abspath(path)) == os.path.abspath(INCOMING_DIR):
+        os.remove(path) # Same content already stored
+    if channel_name:
+        add_to_channel(key, channel_name, file_name or os.path.basename(path))
+    make_thumbnail(key)
+    return key
+
+def add_to_channel(key, channel_name, file_name):
+    """Makes a stored object appear in the channel's folder as file_name."""
+    link(object_path(key), os.path.join(channel_dir(channel_name), file_name))
+
+def resolve(media_path, channel_name=None):
+    """Filesystem path of a media_path: a store key, an existing path, or a pre-store file name in the channel's folder.
+
+    Returns None if nothing is found.
+    """
+    if not media_path:
+        return None
+    if is_key(media_path):
+        path = object_path(media_path)
+        return path if os.path.exists(path) else None
+    if os.path.exists(media_path):
+        return media_path
+    if channel_name:
+        path = os.path.join(channel_dir(channel_name), os.path.basename(media_path))
+        if os.path.exists(path):
+            return path
+    return None
+
+def migrate():
+    """Moves the files of the per-channel layout into the store, replacing each with a hard link to its object."""
+    files = skipped = 0
+    for entry in sorted(os.listdir(RAW_IMAGES_DIR)):
+        folder = os.path.join(RAW_IMAGES_DIR, entry)
+        if entry in STORE_DIRS or not os.path.isdir(folder):
+            continue
+        for file_name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, file_name)
+            if not os.path.isfile(path):
+                continue
+            if os.stat(path).st_nlink > 1:
+                skipped += 1 # Already a link into the store
+                continue
+            key = ingest(path)
+            if not os.path.samefile(path, object_path(key)):
+                os.remove(path) # A duplicate of content already stored
+                link(object_path(key), path)
+            files += 1
+    print(f"Migrated {files} files into {OBJECTS_DIR}; {skipped} were already linked.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Content-addressed media store maintenance.")
+    parser.add_argument('--migrate', action='store_true', help="Move per-channel files into the store.")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate()
+    else:
+        parser.print_help()
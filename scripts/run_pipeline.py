@@ -0,0 +1,312 @@
+"""Runs the pipeline end to end: scrape -> load -> dedup -> enrich -> dbt -> extract_products -> the product mentions
+mart, and the Parquet export.
+
+Stages form a small DAG and run as subprocesses of the existing scripts. Each stage records a fingerprint of its
+inputs in PIPELINE_STATE_FILE when it succeeds; on the next run a stage whose inputs are unchanged is skipped, and
+a stage downstream of a failure is not started. Every stage is itself incremental (the loader's manifest, the
+detection markers, dbt's incremental models, the extraction watermark), so re-running after a failure resumes
+where it stopped instead of reprocessing finished partitions.
+
+Duplicate grouping and enrichment only depend on the raw table, so while the loader is running they are repeated,
+in that order, every PIPELINE_FOLLOW_INTERVAL seconds over whatever has been loaded so far, then once more when
+loading finishes.
+
+    python scripts/run_pipeline.py                      # every stage whose inputs changed
+    python scripts/run_pipeline.py --skip scrape        # process what is already on disk
+    python scripts/run_pipeline.py --stages dbt,extract --force
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import psycopg2
+from dotenv import load_dotenv
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT) # Repo root, for the shared common package
+from common.instrumentation import histogram, job, span
+
+load_dotenv()
+
+PG_USER = os.getenv('POSTGRES_USER')
+PG_PASSWORD = os.getenv('POSTGRES_PASSWORD')
+PG_DB = os.getenv('POSTGRES_DB')
+PG_HOST = os.getenv('POSTGRES_HOST')
+PG_PORT = os.getenv('POSTGRES_PORT')
+
+RAW_DATA_DIR = os.getenv('RAW_DATA_DIR', 'data/raw/telegram_messages')
+STATE_DIR = os.getenv('STATE_DIR', '/app/data/state') # Shared with the scraper's state
+PIPELINE_STATE_FILE = os.getenv('PIPELINE_STATE_FILE', os.path.join(STATE_DIR, 'pipeline_state.json'))
+PIPELINE_FOLLOW_INTERVAL = float(os.getenv('PIPELINE_FOLLOW_INTERVAL', '30')) # Seconds between overlapped dedup/enrich passes
+DBT_PROJECT_DIR = os.getenv('DBT_PROJECT_DIR', os.path.join(REPO_ROOT, 'dbt_project'))
+ENRICH_MODEL = os.getenv('ENRICH_MODEL', 'yolov8n.pt')
+DRUG_DICTIONARY = os.getenv('DRUG_DICTIONARY', os.path.join(REPO_ROOT, 'scripts', 'drug_dictionary.csv'))
+MENTIONS_MART = 'agg_product_mentions'
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = histogram('pipeline_stage_seconds', "Wall time of each pipeline stage run, by stage and status.",
+                          buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+
+def get_connection():
+    return psycopg2.connect(dbname=PG_DB, user=PG_USER, password=PG_PASSWORD, host=PG_HOST, port=PG_PORT)
+
+def query_one(sql):
+    """First row of a query, or None when the database or the table isn't there yet (the stage then just runs)."""
+    try:
+        conn = get_connection()
+    except psycopg2.Error as e:
+        logger.warning(f"Could not connect to read stage inputs: {e}")
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            row = cur.fetchone()
+            return [str(value) for value in row] if row else None
+    except psycopg2.Error:
+        return None
+    finally:
+        conn.close()
+
+def file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+def tree_fingerprint(root, suffixes=None):
+    """File count, total size and newest mtime under root: changes whenever a file is added, replaced or appended to."""
+    count, size, newest = 0, 0, 0.0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if suffixes and not filename.endswith(suffixes):
+                continue
+            stat = os.stat(os.path.join(dirpath, filename))
+            count, size, newest = count + 1, size + stat.st_size, max(newest, stat.st_mtime)
+    return [count, size, newest]
+
+def raw_fingerprint():
+    # The loader's manifest gets a row per loaded file and a fresh loaded_at whenever a file is reloaded
+    return query_one("SELECT COUNT(*), MAX(loaded_at) FROM raw.load_manifest")
+
+def detections_fingerprint():
+    return query_one("SELECT COUNT(*), MAX(processed_at) FROM image_detections")
+
+# --- Stage inputs: any JSON-serialisable value; None means "unknown", so the stage always runs ---
+
+def load_inputs(state):
+    return {'files': tree_fingerprint(RAW_DATA_DIR, ('.json', '.jsonl', '.jsonl.gz', '.jsonl.zst'))}
+
+def dedup_inputs(state):
+    return raw_fingerprint()
+
+def enrich_inputs(state):
+    raw = raw_fingerprint()
+    return raw and {'raw': raw, 'model': [ENRICH_MODEL, file_fingerprint(ENRICH_MODEL)]}
+
+def dbt_inputs(state):
+    raw = raw_fingerprint()
+    return raw and {'raw': raw, 'detections': detections_fingerprint(),
+                    'project': [tree_fingerprint(os.path.join(DBT_PROJECT_DIR, d)) for d in ('models', 'macros')]}
+
+def extract_inputs(state):
+    # fct_messages only changes when dbt runs, so dbt's last completion stands in for it
+    dbt_completed = state.get('dbt', {}).get('completed_at')
+    return dbt_completed and {'dbt': dbt_completed, 'dictionary': file_fingerprint(DRUG_DICTIONARY)}
+
+def mentions_mart_inputs(state):
+    # product_mentions only changes when extraction runs
+    extract_completed = state.get('extract', {}).get('completed_at')
+    return extract_completed and {'extract': extract_completed,
+                                  'model': file_fingerprint(os.path.join(DBT_PROJECT_DIR, 'models', 'marts', 'agg_product_mentions.sql'))}
+
+def export_inputs(state):
+    dbt_completed = state.get('dbt', {}).get('completed_at')
+    return dbt_completed and {'dbt': dbt_completed}
+
+@dataclass
+class Stage:
+    name: str
+    command: list
+    depends_on: tuple = ()
+    inputs: object = None # callable(state) -> fingerprint; None for stages whose input can't be observed (Telegram)
+    follows: str = None # Upstream stage this one may run alongside, repeating over its partial output
+
+PYTHON = sys.executable
+STAGES = [
+    Stage('scrape', [PYTHON, 'scripts/scrape_telegram.py']),
+    Stage('load', [PYTHON, 'scripts/load_to_postgress.py'], ('scrape',), load_inputs),
+    Stage('dedup', [PYTHON, 'scripts/dedup_messages.py'], ('load',), dedup_inputs, follows='load'),
+    # Enrichment only runs inference for group representatives, so it goes after grouping in each pass
+    Stage('enrich', [PYTHON, 'scripts/enrich_data.py'], ('dedup',), enrich_inputs, follows='load'),
+    # agg_product_mentions reads product_mentions, which extraction writes from fct_messages, so it is built after it
+    Stage('dbt', ['dbt', 'run', '--project-dir', DBT_PROJECT_DIR, '--profiles-dir', DBT_PROJECT_DIR,
+                  '--exclude', MENTIONS_MART], ('load', 'dedup', 'enrich'), dbt_inputs),
+    Stage('extract', [PYTHON, 'scripts/extract_products.py'], ('dbt',), extract_inputs),
+    Stage('mentions_mart', ['dbt', 'run', '--project-dir', DBT_PROJECT_DIR, '--profiles-dir', DBT_PROJECT_DIR,
+                            '--select', MENTIONS_MART], ('extract',), mentions_mart_inputs),
+    Stage('export', [PYTHON, 'scripts/export_parquet.py'], ('dbt',), export_inputs),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+class PipelineState:
+    """JSON store of each stage's last successful run: its input fingerprint, completion time and duration."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.stages = json.load(f).get('stages', {})
+
+    def is_current(self, stage_name, fingerprint):
+        entry = self.stages.get(stage_name)
+        return fingerprint is not None and entry is not None and entry.get('inputs') == fingerprint
+
+    def record(self, stage_name, fingerprint, seconds):
+        self.stages[stage_name] = {
+            'inputs': fingerprint,
+            'completed_at': datetime.now(timezone.utc).isoformat(),
+            'seconds': round(seconds, 3)
+        }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': self.stages}, f, indent=4, default=str)
+        os.replace(tmp_path, self.path)
+
+def run_command(stage):
+    logger.info(f"[{stage.name}] {' '.join(stage.command)}")
+    return subprocess.run(stage.command, cwd=REPO_ROOT).returncode
+
+def run_with_followers(stage, followers):
+    """Runs `stage` while repeating `followers`, in order, over its partial output.
+
+    Returns (stage code, {follower: code}, passes). Follower passes that fail while the upstream is still writing
+    are tolerated; only the final pass, which sees the complete output, decides the followers' outcomes. A
+    follower whose dependency failed in a pass is not run in it.
+    """
+    logger.info(f"[{stage.name}] {' '.join(stage.command)} (with {', '.join(f.name for f in followers)} overlapped)")
+    process = subprocess.Popen(stage.command, cwd=REPO_ROOT)
+    passes = 0
+
+    def run_pass():
+        codes = {}
+        for follower in followers:
+            if any(codes.get(dep) for dep in follower.depends_on):
+                continue
+            codes[follower.name] = run_command(follower)
+        return codes
+
+    while process.poll() is None:
+        passes += 1
+        for name, code in run_pass().items():
+            if code:
+                logger.warning(f"[{name}] Overlapped pass {passes} exited with {code}; retrying after {stage.name}.")
+        try:
+            process.wait(timeout=PIPELINE_FOLLOW_INTERVAL)
+        except subprocess.TimeoutExpired:
+            pass
+    if process.returncode:
+        return process.returncode, None, passes
+    return 0, run_pass(), passes + 1
+
+def run_pipeline(selected, force=False, overlap=True):
+    """Runs the selected stages in dependency order; returns [(stage, status, seconds, note)]."""
+    state = PipelineState(PIPELINE_STATE_FILE)
+    results = {}
+    summary = []
+
+    def finish(stage, status, seconds=0.0, note='', fingerprint=None):
+        results[stage.name] = status
+        summary.append((stage.name, status, seconds, note))
+        if status in ('ok', 'failed'):
+            STAGE_SECONDS.observe(seconds, stage=stage.name, status=status)
+        if status == 'ok':
+            state.record(stage.name, fingerprint, seconds)
+
+    for stage in STAGES:
+        if stage.name in results:
+            continue # Already run alongside the stage it follows
+        if stage.name not in selected:
+            finish(stage, 'skipped', note='not selected')
+            continue
+        blocked_by = [dep for dep in stage.depends_on if results.get(dep) in ('failed', 'blocked')]
+        if blocked_by:
+            finish(stage, 'blocked', note=f"{', '.join(blocked_by)} failed")
+            continue
+
+        fingerprint = stage.inputs(state.stages) if stage.inputs else None
+        if not force and state.is_current(stage.name, fingerprint):
+            finish(stage, 'skipped', note='inputs unchanged')
+            continue
+
+        followers = []
+        if overlap:
+            for s in STAGES:
+                if (s.follows == stage.name and s.name in selected
+                        and set(s.depends_on) <= {stage.name} | set(results) | {f.name for f in followers}):
+                    followers.append(s)
+        start = time.perf_counter()
+        with span('pipeline_stage', stage=stage.name):
+            if not followers:
+                code = run_command(stage)
+            else:
+                code, follower_codes, passes = run_with_followers(stage, followers)
+        seconds = time.perf_counter() - start
+        finish(stage, 'failed' if code else 'ok', seconds, f"exit code {code}" if code else '', fingerprint)
+
+        for follower in followers:
+            if code:
+                finish(follower, 'blocked', note=f"{stage.name} failed")
+            elif follower.name not in follower_codes:
+                failed = [dep for dep in follower.depends_on if follower_codes.get(dep)]
+                finish(follower, 'blocked', note=f"{', '.join(failed)} failed")
+            else:
+                # Inputs as of the final pass, which saw everything the upstream stage wrote
+                follower_code = follower_codes[follower.name]
+                follower_fingerprint = follower.inputs(state.stages) if follower.inputs else None
+                finish(follower, 'failed' if follower_code else 'ok', seconds,
+                       f"{passes} passes overlapped with {stage.name}" + (f", exit code {follower_code}" if follower_code else ''),
+                       follower_fingerprint)
+    return summary
+
+def print_summary(summary):
+    print("\nPipeline summary")
+    print(f"{'stage':<13} {'status':<9} {'seconds':>9}  note")
+    for name, status, seconds, note in summary:
+        print(f"{name:<13} {status:<9} {seconds:>9.1f}  {note}")
+    print(f"{'total':<13} {'':<9} {sum(row[2] for row in summary if 'overlapped' not in row[3]):>9.1f}")
+
+def parse_args():
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Run the pipeline stages whose inputs changed since their last success.")
+    parser.add_argument('--stages', default=','.join(names), help=f"Comma-separated stages to consider (default: all of {','.join(names)}).")
+    parser.add_argument('--skip', default='', help="Comma-separated stages to leave out, e.g. scrape.")
+    parser.add_argument('--force', action='store_true', help="Run the selected stages even if their inputs are unchanged.")
+    parser.add_argument('--no-overlap', action='store_true', help="Run grouping and enrichment only after loading has finished.")
+    args = parser.parse_args()
+    selected = {name.strip() for name in args.stages.split(',') if name.strip()}
+    selected -= {name.strip() for name in args.skip.split(',') if name.strip()}
+    unknown = selected - set(names)
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+    return args, selected
+
+def main():
+    args, selected = parse_args()
+    summary = run_pipeline(selected, force=args.force, overlap=not args.no_overlap)
+    print_summary(summary)
+    if any(status == 'failed' for _, status, _, _ in summary):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    with job('pipeline'):
+        main()
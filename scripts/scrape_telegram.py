@@ -3,12 +3,24 @@ import sys
 import logging
 import asyncio
 import json
-from datetime import datetime
+import gzip
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+try:
+    import zstandard
+except ImportError: # Optional: only needed for SCRAPER_OUTPUT_COMPRESSION=zstd
+    zstandard = None
 from telethon.sync import TelegramClient
-from telethon.tl.types import Channel, MessageMediaPhoto, MessageMediaDocument, DocumentAttributeFilename
+from telethon.tl.types import Channel, MessageMediaPhoto, MessageMediaDocument
 from telethon.errors import SessionPasswordNeededError, FloodWaitError, PeerFloodError, ChannelPrivateError
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root, for the shared common package
+from common.instrumentation import counter, gauge, histogram, span, job
+import media_store
+
 # --- Configuration & Logging ---
 load_dotenv()
 
@@ -21,10 +33,37 @@ RAW_DATA_DIR = os.getenv("RAW_DATA_DIR", "/app/data/raw/telegram_messages")
 RAW_IMAGES_DIR = os.getenv("RAW_IMAGES_DIR", "/app/data/raw/telegram_images")
 LOG_DIR = os.getenv("LOG_DIR", "/app/logs")
 
+# Scheduler settings: channels scraped at once, and the request budget they share
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+SCRAPER_REQUESTS_PER_SECOND = float(os.getenv("SCRAPER_REQUESTS_PER_SECOND", "1"))
+SCRAPER_BURST = int(os.getenv("SCRAPER_BURST", "5"))
+PEER_FLOOD_WAIT_SECONDS = 60 * 5
+MESSAGES_PER_REQUEST = 100 # Telethon fetches history in pages of 100 messages
+
+# Incremental scraping: 'incremental' fetches only messages above each channel's saved high-water mark, 'full' re-reads history
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "incremental")
+SCRAPE_LOOKBACK_DAYS = float(os.getenv("SCRAPE_LOOKBACK_DAYS", "0")) # Re-read recent posts to refresh views/forwards/replies
+STATE_DIR = os.getenv("STATE_DIR", "/app/data/state")
+
+# Output: JSON Lines per channel and day, optionally compressed ('gzip' or 'zstd'), fsync-ed every checkpoint
+SCRAPER_OUTPUT_COMPRESSION = os.getenv("SCRAPER_OUTPUT_COMPRESSION", "") or None
+SCRAPER_FLUSH_EVERY = int(os.getenv("SCRAPER_FLUSH_EVERY", "200")) # Messages buffered before each write
+SCRAPER_CHECKPOINT_SECONDS = float(os.getenv("SCRAPER_CHECKPOINT_SECONDS", "30"))
+
+# Background media downloads: concurrent downloads, queued messages before paging blocks, and retry policy
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv("MEDIA_DOWNLOAD_WORKERS", "4"))
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", "100"))
+MEDIA_DOWNLOAD_RETRIES = int(os.getenv("MEDIA_DOWNLOAD_RETRIES", "3"))
+MEDIA_RETRY_BACKOFF_SECONDS = 2.0
+SCRAPER_STATE_FILE = os.path.join(STATE_DIR, "scraper_state.json")
+MEDIA_INDEX_FILE = os.path.join(STATE_DIR, "media_index.json")
+MEDIA_INDEX_SAVE_EVERY = 100 # New entries between saves of the media index; it is also saved when the pool closes
+
 # Ensure directories exist
 os.makedirs(RAW_DATA_DIR, exist_ok=True)
 os.makedirs(RAW_IMAGES_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
+os.makedirs(STATE_DIR, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -34,6 +73,14 @@ logging.basicConfig(level=logging.INFO,
                     ])
 logger = logging.getLogger(__name__)
 
+SCRAPED_MESSAGES = counter('scraper_messages_total', "Messages scraped, by channel.")
+SCRAPER_THROUGHPUT = gauge('scraper_messages_per_second', "Messages per second of each channel's last scrape.")
+RATE_LIMIT_WAIT_SECONDS = histogram('scraper_rate_limit_wait_seconds', "Time each Telegram request waited for a rate limiter token.")
+REQUEST_SECONDS = histogram('scraper_request_seconds', "Duration of rate-limited Telegram requests (entity lookups, media downloads).")
+FLOOD_WAITS = counter('scraper_flood_waits_total', "Flood-wait errors returned by Telegram, by channel.")
+MEDIA_QUEUE_DEPTH = gauge('scraper_media_queue_depth', "Messages waiting in the media download queue ('current' and 'peak').")
+MEDIA_DOWNLOADS = counter('scraper_media_downloads_total', "Media files handled by the download pool, by outcome.")
+
 # List of Telegram channel identifiers (usernames or full links)
 # IMPORTANT: For private channels, you must be a member first.
 # For public channels, you can use their username (e.g., 'chemedtg') or full link.
@@ -45,120 +92,516 @@ TELEGRAM_CHANNELS = [
     # Example: 'https://t.me/AnotherMedicalChannel'
 ]
 
-async def download_media(client, message, channel_name):
-    """Downloads media (photos/documents) from a message."""
-    if not message.media:
-        return None, None # No media in this message
+class RateLimiter:
+    """Token bucket shared by every scraping task.
 
-    media_path = None
-    media_type = None
+    Each Telegram API request takes a token. A flood-wait reported to any task pauses
+    the whole bucket, so all tasks wait out the time Telegram asked for instead of guessing.
+    """
 
-    try:
-        # Create a channel-specific directory for images
-        channel_image_dir = os.path.join(RAW_IMAGES_DIR, channel_name.replace(' ', '_'))
-        os.makedirs(channel_image_dir, exist_ok=True)
-
-        # Telethon's download_media saves the file to the specified path
-        # It handles different media types (photo, video, document)
-        download_file_path = await client.download_media(message, file=channel_image_dir)
-
-        if download_file_path:
-            media_path = os.path.basename(download_file_path) # Just the filename
-            if isinstance(message.media, MessageMediaPhoto):
-                media_type = 'photo'
-            elif isinstance(message.media, MessageMediaDocument):
-                # Check for document attributes to get original filename
-                if message.media.document.attributes:
-                    for attr in message.media.document.attributes:
-                        if isinstance(attr, DocumentAttributeFilename):
-                            media_path = attr.file_name # Use original filename
-                            break
-                media_type = 'document' # Could be video, audio, etc.
-            else:
-                media_type = 'unknown_media'
-            logger.info(f"Downloaded media '{media_path}' from channel '{channel_name}'.")
-            return media_path, media_type
-    except Exception as e:
-        logger.error(f"Error downloading media from message {message.id} in channel '{channel_name}': {e}", exc_info=False)
-    return None, None
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits for a token and returns the number of seconds spent waiting."""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        return time.monotonic() - start
+
+    def pause(self, seconds):
+        """Blocks every task for `seconds` and drains the bucket."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+@dataclass
+class ChannelStats:
+    """Throughput and wait-time figures for one scraped channel."""
+    channel: str
+    messages: int = 0
+    media: int = 0
+    requests: int = 0
+    flood_waits: int = 0
+    wait_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def messages_per_second(self):
+        return self.messages / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+async def wait_for_token(limiter, stats):
+    stats.requests += 1
+    waited = await limiter.acquire()
+    stats.wait_seconds += waited
+    RATE_LIMIT_WAIT_SECONDS.observe(waited)
+
+def handle_flood(limiter, stats, error):
+    """Reports a FloodWaitError/PeerFloodError to the shared limiter."""
+    seconds = error.seconds + 5 if isinstance(error, FloodWaitError) else PEER_FLOOD_WAIT_SECONDS # Add a small buffer
+    logger.warning(f"Flood error while scraping '{stats.channel}': {error}. Pausing all channels for {seconds} seconds...")
+    stats.flood_waits += 1
+    FLOOD_WAITS.inc(channel=stats.channel)
+    limiter.pause(seconds)
+
+async def rate_limited(limiter, stats, request):
+    """Runs request() behind the limiter, retrying it after flood-waits."""
+    while True:
+        await wait_for_token(limiter, stats)
+        try:
+            start = time.perf_counter()
+            result = await request()
+            REQUEST_SECONDS.observe(time.perf_counter() - start)
+            return result
+        except (FloodWaitError, PeerFloodError) as e:
+            handle_flood(limiter, stats, e)
+
+class JsonlWriter:
+    """Appends messages to a JSON Lines file in buffered chunks, with optional gzip/zstd compression.
+
+    checkpoint() flushes the buffer and fsyncs the file; the scraper advances a channel's
+    high-water mark only at checkpoints, so an interrupted run resumes after the last
+    message known to be on disk.
+    """
+
+    def __init__(self, path, compression=None):
+        self.path = path
+        self.compression = compression
+        if not compression:
+            self._repair_partial_line()
+        self._raw = open(path, 'ab')
+        if compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("SCRAPER_OUTPUT_COMPRESSION=zstd requires the 'zstandard' package.")
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        self._buffer = []
+        self._last_checkpoint = time.monotonic()
+
+    def _repair_partial_line(self):
+        # A crash mid-write can leave a truncated last line; drop it before appending after it.
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    f.truncate(start + newline + 1)
+                    return
+                end = start
+            f.truncate(0)
+
+    def write(self, message):
+        self._buffer.append(json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n')
+        if len(self._buffer) >= SCRAPER_FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._stream.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+
+    def checkpoint_due(self):
+        return time.monotonic() - self._last_checkpoint >= SCRAPER_CHECKPOINT_SECONDS
+
+    def checkpoint(self):
+        """Flushes buffered lines through the compressor and fsyncs them to disk."""
+        self.flush()
+        if self.compression == 'gzip':
+            self._stream.flush()
+        elif self.compression == 'zstd':
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+class ScrapeState:
+    """Small JSON store of the highest message id scraped per channel (its high-water mark)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.channels = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.channels = json.load(f).get('channels', {})
+
+    def high_water_mark(self, channel_id):
+        entry = self.channels.get(str(channel_id))
+        return entry['last_message_id'] if entry else None
+
+    def update(self, channel_id, channel_name, last_message_id):
+        """Records a new high-water mark and persists the store atomically. A mark never moves backwards."""
+        last_message_id = max(last_message_id, self.high_water_mark(channel_id) or 0)
+        self.channels[str(channel_id)] = {
+            'channel_name': channel_name,
+            'last_message_id': last_message_id,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'channels': self.channels}, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+class MediaIndex:
+    """JSON store mapping each Telegram file (its media_file_name) to the media store key it was saved under.
+
+    A file reposted in another channel, or posted again, is then linked from the store instead of downloaded again.
+    Entries are only hints: one whose object is gone is ignored and the file downloaded.
+    """
+
+    def __init__(self, path, save_every=MEDIA_INDEX_SAVE_EVERY):
+        self.path = path
+        self.save_every = save_every
+        self.files = {}
+        self._unsaved = 0
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get('files', {})
+
+    def get(self, file_name):
+        key = self.files.get(file_name)
+        return key if key and media_store.resolve(key) else None
+
+    def record(self, file_name, key):
+        self.files[file_name] = key
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        """Persists the index atomically."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
 
-async def scrape_channel(client, channel_identifier):
-    """Scrapes messages from a single Telegram channel."""
+async def iter_channel_messages(client, entity, limiter, stats, **kwargs):
+    """Iterates a channel's messages oldest to newest behind the shared limiter.
+
+    After a flood-wait the iteration resumes above the last message already yielded.
+    """
+    while True:
+        try:
+            await wait_for_token(limiter, stats)
+            count = 0
+            async for message in client.iter_messages(entity, limit=None, reverse=True, **kwargs):
+                kwargs['min_id'] = message.id
+                kwargs.pop('offset_date', None)
+                yield message
+                count += 1
+                if count % MESSAGES_PER_REQUEST == 0:
+                    await wait_for_token(limiter, stats) # The next message starts a new page request
+            return
+        except (FloodWaitError, PeerFloodError) as e:
+            handle_flood(limiter, stats, e)
+
+def build_message_data(message, entity):
+    """Basic message parsing into the dict stored in the raw JSON files."""
+    return {
+        'message_id': message.id,
+        'date': message.date.isoformat(),
+        'text': message.text,
+        'sender_id': message.sender_id,
+        'views': message.views,
+        'media_path': None,
+        'media_type': None,
+        'is_sponsored': message.sponsored,
+        'replies_count': message.replies.replies if message.replies else 0,
+        'forwards': message.forwards,
+        'post_channel_id': entity.id,
+        'post_channel_name': entity.title,
+        'message_link': f"https://t.me/{entity.username}/{message.id}" if entity.username else None
+    }
+
+def media_type_of(message):
+    if isinstance(message.media, MessageMediaPhoto):
+        return 'photo'
+    if isinstance(message.media, MessageMediaDocument):
+        return 'document' # Could be video, audio, etc.
+    return 'unknown_media'
+
+def media_file_name(message):
+    """Stable file name for a message's media, derived from its Telegram file id, or None if it has no file."""
+    media = message.photo or message.document
+    if media is None:
+        return None
+    extension = message.file.ext if message.file and message.file.ext else ''
+    return f"{media.id}{extension}"
+
+class MediaDownloader:
+    """Bounded pool of asyncio workers downloading media in the background.
+
+    scrape_channel() queues each message with media and keeps paging; a worker downloads the file
+    and back-fills media_path/media_type into the message dict. The queue is bounded, so a slow
+    download pool applies backpressure to message iteration instead of growing without limit.
+    """
+
+    def __init__(self, client, limiter, index, workers=MEDIA_DOWNLOAD_WORKERS, queue_size=MEDIA_QUEUE_SIZE):
+        self.client = client
+        self.limiter = limiter
+        self.index = index
+        self.in_flight = {} # media_file_name -> future resolved when its download finishes
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.max_queue_depth = 0
+        self._started = time.monotonic()
+
+    async def submit(self, message, channel_name, message_data, stats):
+        """Queues a download and returns a future resolved once message_data has been back-filled."""
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, channel_name, message_data, stats, done))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        MEDIA_QUEUE_DEPTH.set(self.queue.qsize(), kind='current')
+        MEDIA_QUEUE_DEPTH.set_max(self.queue.qsize(), kind='peak')
+        return done
+
+    async def close(self):
+        await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.index.save()
+
+    def metrics(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'downloaded': self.downloaded,
+            'skipped_existing': self.skipped,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'bytes_per_second': self.bytes / elapsed if elapsed else 0.0
+        }
+
+    async def _worker(self):
+        while True:
+            message, channel_name, message_data, stats, done = await self.queue.get()
+            try:
+                media_path = await self._download(message, channel_name, stats)
+                if media_path:
+                    message_data['media_path'] = media_path
+                    message_data['media_type'] = media_type_of(message)
+                    stats.media += 1
+            except Exception as e:
+                self.failed += 1
+                MEDIA_DOWNLOADS.inc(outcome='failed')
+                logger.error(f"Error downloading media from message {message.id} in channel '{channel_name}': {e}", exc_info=False)
+            finally:
+                done.set_result(None)
+                self.queue.task_done()
+
+    async def _download(self, message, channel_name, stats):
+        """Stores one message's media and returns its key, downloading it only if the Telegram file isn't stored yet."""
+        file_name = media_file_name(message)
+        if file_name is None:
+            return None
+        while file_name in self.in_flight:
+            await self.in_flight[file_name] # Another worker is fetching the same file; reuse its result
+        key = self.index.get(file_name)
+        if key:
+            self.skipped += 1 # Stored from an earlier run or another post of the same file
+            MEDIA_DOWNLOADS.inc(outcome='skipped_existing')
+            await asyncio.to_thread(media_store.add_to_channel, key, channel_name, file_name)
+            return key
+
+        done = asyncio.get_running_loop().create_future()
+        self.in_flight[file_name] = done
+        try:
+            key = await self._fetch(message, channel_name, stats, file_name)
+            if key:
+                self.index.record(file_name, key)
+            return key
+        finally:
+            del self.in_flight[file_name]
+            done.set_result(None)
+
+    async def _fetch(self, message, channel_name, stats, file_name):
+        """Downloads the media into the media store, retrying with exponential backoff. Returns its key."""
+        channel_path = os.path.join(media_store.channel_dir(channel_name), file_name)
+        if os.path.exists(channel_path):
+            self.skipped += 1 # On disk from before the media index
+            MEDIA_DOWNLOADS.inc(outcome='skipped_existing')
+            return await asyncio.to_thread(media_store.ingest, channel_path) # Hashing only: the object is already linked
+
+        file_path = media_store.incoming_path(file_name)
+        for attempt in range(MEDIA_DOWNLOAD_RETRIES + 1):
+            try:
+                # Telethon's download_media saves the file to the specified path
+                # It handles different media types (photo, video, document)
+                download_file_path = await rate_limited(
+                    self.limiter, stats, lambda: self.client.download_media(message, file=file_path)
+                )
+                break
+            except Exception as e:
+                if attempt == MEDIA_DOWNLOAD_RETRIES:
+                    raise
+                delay = MEDIA_RETRY_BACKOFF_SECONDS * 2 ** attempt
+                logger.warning(f"Retrying media of message {message.id} in '{channel_name}' in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+
+        if not download_file_path:
+            return None
+        self.downloaded += 1
+        self.bytes += os.path.getsize(download_file_path)
+        MEDIA_DOWNLOADS.inc(outcome='downloaded')
+        # Hashing, moving into the store and the thumbnail are file work: keep them off the event loop
+        key = await asyncio.to_thread(media_store.ingest, download_file_path, channel_name, file_name)
+        logger.info(f"Downloaded media '{file_name}' from channel '{channel_name}' as {key}.")
+        return key
+
+def output_file_path_for(output_dir, channel_name):
+    """Path of a channel's JSON Lines file for the day.
+
+    Uncompressed files are appended to across runs. A compressed stream cannot be safely
+    appended to after an interrupted run, so those runs start a new numbered part instead.
+    """
+    base = os.path.join(output_dir, channel_name.replace(' ', '_').replace('/', ''))
+    extension = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}.get(SCRAPER_OUTPUT_COMPRESSION, '.jsonl')
+    path = f"{base}{extension}"
+    part = 1
+    while SCRAPER_OUTPUT_COMPRESSION and os.path.exists(path):
+        path = f"{base}.{part}{extension}"
+        part += 1
+    return path
+
+async def scrape_channel(client, channel_identifier, limiter, state, downloader):
+    """Scrapes messages from a single Telegram channel and returns its ChannelStats."""
+    stats = ChannelStats(channel=str(channel_identifier))
+    start = time.monotonic()
+    writer = None
     try:
-        entity = await client.get_entity(channel_identifier)
+        entity = await rate_limited(limiter, stats, lambda: client.get_entity(channel_identifier))
         if not isinstance(entity, Channel):
             logger.warning(f"'{channel_identifier}' is not a valid Telegram channel or group. Skipping.")
-            return
+            return stats
 
         channel_name = entity.title
         channel_id = entity.id
-        logger.info(f"Scraping channel: '{channel_name}' (ID: {channel_id})")
+        stats.channel = channel_name
+        high_water_mark = state.high_water_mark(channel_id) if SCRAPE_MODE == 'incremental' else None
+        logger.info(f"Scraping channel: '{channel_name}' (ID: {channel_id}), "
+                    f"{'messages after ' + str(high_water_mark) if high_water_mark else 'full history'}")
 
         today_str = datetime.now().strftime('%Y-%m-%d')
         output_dir = os.path.join(RAW_DATA_DIR, today_str)
         os.makedirs(output_dir, exist_ok=True)
 
-        output_file_path = os.path.join(output_dir, f"{channel_name.replace(' ', '_').replace('/', '')}.json")
-        scraped_messages = []
+        output_file_path = output_file_path_for(output_dir, channel_name)
         message_count = 0
+        written_id = 0
+
+        # Messages are written in id order. One waiting on its media download holds back the ones after it,
+        # so everything up to the last written id is complete and the high-water mark can follow it.
+        pending = deque()
 
-        # Check if the file already exists and load existing data to append (optional, for incremental)
-        # For simplicity in this first version, we'll overwrite or assume daily fresh scrape.
-        # If you want to append, you'd load existing JSON here and then skip messages already present.
+        def write_ready():
+            nonlocal written_id
+            while pending and (pending[0][2] is None or pending[0][2].done()):
+                message_id, message_data, _ = pending.popleft()
+                writer.write(message_data)
+                written_id = message_id
 
-        async for message in client.iter_messages(entity, limit=None): # Fetch all messages
+        def checkpoint():
+            writer.checkpoint()
+            if written_id:
+                state.update(channel_id, channel_name, written_id)
+
+        writer = JsonlWriter(output_file_path, SCRAPER_OUTPUT_COMPRESSION)
+
+        # Look-back: re-read recent posts already scraped to refresh their engagement counters.
+        # Their media was downloaded by an earlier run, so media_path stays None and the loader keeps the stored value.
+        if high_water_mark and SCRAPE_LOOKBACK_DAYS > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=SCRAPE_LOOKBACK_DAYS)
+            refreshed = 0
+            async for message in iter_channel_messages(client, entity, limiter, stats,
+                                                       offset_date=cutoff, max_id=high_water_mark + 1):
+                writer.write(build_message_data(message, entity))
+                refreshed += 1
+            logger.info(f"Refreshed counters of {refreshed} messages from the last {SCRAPE_LOOKBACK_DAYS:g} days of '{channel_name}'.")
+
+        async for message in iter_channel_messages(client, entity, limiter, stats, min_id=high_water_mark or 0):
             try:
-                # Basic message parsing
-                message_data = {
-                    'message_id': message.id,
-                    'date': message.date.isoformat(),
-                    'text': message.text,
-                    'sender_id': message.sender_id,
-                    'views': message.views,
-                    'media_path': None,
-                    'media_type': None,
-                    'is_sponsored': message.sponsored,
-                    'replies_count': message.replies.replies if message.replies else 0,
-                    'forwards': message.forwards,
-                    'post_channel_id': entity.id,
-                    'post_channel_name': entity.title,
-                    'message_link': f"https://t.me/{entity.username}/{message.id}" if entity.username else None
-                }
-
-                # Image and other media scraping
+                message_data = build_message_data(message, entity)
+
+                # Image and other media scraping happens in the background pool, which back-fills message_data
+                download = None
                 if message.media:
-                    media_file_name, media_type = await download_media(client, message, channel_name)
-                    message_data['media_path'] = media_file_name
-                    message_data['media_type'] = media_type
-
-                scraped_messages.append(message_data)
-                message_count += 1
-
-                if message_count % 100 == 0:
-                    logger.info(f"Scraped {message_count} messages from '{channel_name}'...")
-
-            except FloodWaitError as fwe:
-                logger.warning(f"Flood wait error for '{channel_name}': {fwe}. Waiting {fwe.seconds} seconds...")
-                await asyncio.sleep(fwe.seconds + 5) # Add a small buffer
-            except PeerFloodError as pfe:
-                logger.warning(f"Peer flood error for '{channel_name}': {pfe}. Waiting for an extended period...")
-                await asyncio.sleep(60 * 5) # Wait 5 minutes
+                    download = await downloader.submit(message, channel_name, message_data, stats)
+                pending.append((message.id, message_data, download))
             except Exception as e:
                 logger.error(f"Error processing message {message.id} from '{channel_name}': {e}", exc_info=True)
 
-        # Save all scraped messages for this channel to JSON
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(scraped_messages, f, ensure_ascii=False, indent=4)
-        logger.info(f"Finished scraping '{channel_name}'. Total messages: {message_count}. Data saved to {output_file_path}")
+            write_ready()
+            if writer.checkpoint_due():
+                checkpoint()
+            message_count += 1
+            if message_count % MESSAGES_PER_REQUEST == 0:
+                logger.info(f"Scraped {message_count} messages from '{channel_name}'... (media queue depth: {downloader.queue.qsize()})")
+
+        stats.messages = message_count
+        await asyncio.gather(*(download for _, _, download in pending if download is not None))
+        write_ready()
+        logger.info(f"Finished scraping '{channel_name}'. New messages: {message_count}, up to ID {written_id or high_water_mark}. Data saved to {output_file_path}")
 
     except ChannelPrivateError:
         logger.error(f"Cannot access private channel '{channel_identifier}'. You must join it first via the Telegram app.")
-    except FloodWaitError as fwe:
-        logger.critical(f"Global Flood wait error: {fwe}. Script will wait and retry after {fwe.seconds} seconds.", exc_info=True)
-        await asyncio.sleep(fwe.seconds + 10)
     except Exception as e:
         logger.critical(f"Failed to scrape channel '{channel_identifier}': {e}", exc_info=True)
+    finally:
+        # Whatever was written is complete, so an interrupted run still checkpoints it and the next run resumes after it.
+        if writer is not None:
+            checkpoint()
+            writer.close()
+        stats.elapsed_seconds = time.monotonic() - start
+    return stats
 
+def log_scrape_summary(all_stats):
+    """Logs per-channel throughput and time spent waiting on the rate limiter."""
+    for stats in all_stats:
+        SCRAPED_MESSAGES.inc(stats.messages, channel=stats.channel)
+        SCRAPER_THROUGHPUT.set(stats.messages_per_second, channel=stats.channel)
+        logger.info(
+            f"'{stats.channel}': {stats.messages} messages ({stats.media} media) in {stats.elapsed_seconds:.1f}s, "
+            f"{stats.messages_per_second:.1f} msg/s, {stats.requests} requests, "
+            f"{stats.wait_seconds:.1f}s waiting on the rate limiter, {stats.flood_waits} flood waits."
+        )
+    total_messages = sum(stats.messages for stats in all_stats)
+    total_wait = sum(stats.wait_seconds for stats in all_stats)
+    logger.info(f"Scraped {total_messages} messages from {len(all_stats)} channels; {total_wait:.1f}s total rate-limit wait.")
 
 async def main():
     if not API_ID or not API_HASH or not PHONE:
@@ -166,16 +609,33 @@ async def main():
         sys.exit(1)
 
     client = TelegramClient(SESSION_NAME, int(API_ID), API_HASH)
+    client.flood_sleep_threshold = 0 # Surface every flood-wait to the shared RateLimiter instead of sleeping per request
 
     try:
         logger.info("Connecting to Telegram...")
         await client.start(phone=PHONE)
         logger.info("Successfully connected to Telegram!")
 
-        # Iterate through all defined channels and scrape
-        for channel_identifier in TELEGRAM_CHANNELS:
-            await scrape_channel(client, channel_identifier)
-            await asyncio.sleep(5) # Small delay between channels to avoid rate limits
+        # Scrape up to SCRAPER_CONCURRENCY channels at once; all of them share one request budget
+        limiter = RateLimiter(SCRAPER_REQUESTS_PER_SECOND, SCRAPER_BURST)
+        state = ScrapeState(SCRAPER_STATE_FILE)
+        downloader = MediaDownloader(client, limiter, MediaIndex(MEDIA_INDEX_FILE))
+        semaphore = asyncio.Semaphore(SCRAPER_CONCURRENCY)
+
+        async def scrape_with_slot(channel_identifier):
+            async with semaphore:
+                with span('scrape_channel', channel=channel_identifier):
+                    return await scrape_channel(client, channel_identifier, limiter, state, downloader)
+
+        all_stats = await asyncio.gather(*(scrape_with_slot(c) for c in TELEGRAM_CHANNELS))
+        await downloader.close()
+        log_scrape_summary(all_stats)
+        metrics = downloader.metrics()
+        logger.info(
+            f"Media pool: {metrics['downloaded']} downloaded ({metrics['bytes'] / 1e6:.1f} MB, "
+            f"{metrics['bytes_per_second'] / 1e3:.1f} KB/s), {metrics['skipped_existing']} already on disk, "
+            f"{metrics['failed']} failed; peak queue depth {metrics['max_queue_depth']}."
+        )
 
     except SessionPasswordNeededError:
         logger.critical("2FA is enabled. Please run interactively once to enter password or consider setting up a password in .env if running headless.")
@@ -193,4 +653,5 @@ async def main():
             logger.info("Disconnected.")
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    with job('scraper'):
+        asyncio.run(main())
\ No newline at end of file
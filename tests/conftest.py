@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts import each other by module name, as when run from scripts/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'scripts')]
+
+load_dotenv()
+# app.database builds its engine URL at import; without a .env, point it at the compose database's published port
+os.environ.setdefault('POSTGRES_HOST', 'localhost')
+os.environ.setdefault('POSTGRES_PORT', '5432')
+
+@pytest.fixture(scope='session')
+def warehouse():
+    """Connection to the compose database; tests that use it are skipped when it cannot be reached."""
+    engine = create_engine(
+        f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
+        f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}",
+        connect_args={'connect_timeout': 3},
+    )
+    try:
+        conn = engine.connect()
+    except OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e.orig}")
+    yield conn
+    conn.close()
+    engine.dispose()
+
+def require_tables(conn, *tables):
+    """Skips the calling test unless the pipeline has built these tables."""
+    for table in tables:
+        if conn.execute(text("SELECT to_regclass(:table)"), {'table': table}).scalar() is None:
+            pytest.skip(f"{table} has not been built; run the pipeline first.")
@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from app import cache
+
+def make_request(path, query_string=b"", headers=()):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query_string,
+                    "headers": [(k.encode(), v.encode()) for k, v in headers]})
+
+def test_cache_key_ignores_parameter_order():
+    a = make_request("/top-products", b"limit=5&channel=x")
+    b = make_request("/top-products", b"channel=x&limit=5")
+    assert cache.cache_key(a, "v1") == cache.cache_key(b, "v1")
+
+def test_cache_key_separates_versions_paths_and_values():
+    request = make_request("/top-products", b"limit=5")
+    keys = {
+        cache.cache_key(request, "v1"),
+        cache.cache_key(request, "v2"),
+        cache.cache_key(make_request("/posting-trends", b"limit=5"), "v1"),
+        cache.cache_key(make_request("/top-products", b"limit=6"), "v1"),
+    }
+    assert len(keys) == 4
+
+def test_cache_key_keeps_repeated_parameters():
+    assert (cache.cache_key(make_request("/search", b"q=a&q=b"), "v1")
+            != cache.cache_key(make_request("/search", b"q=a"), "v1"))
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('"xyz"', False),
+    ('"xyz", "abc"', True),
+    ('*', True),
+])
+def test_etag_matches(header, expected):
+    headers = [("if-none-match", header)] if header else []
+    assert cache.etag_matches(make_request("/top-products", headers=headers), '"abc"') is expected
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(max_entries=2, ttl=60)
+
+    async def scenario():
+        await lru.set("a", 1)
+        await lru.set("b", 2)
+        await lru.get("a") # a is now the most recently used
+        await lru.set("c", 3)
+        return [await lru.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [1, None, 3]
+
+def test_lru_cache_expires_entries():
+    lru = cache.LRUCache(max_entries=2, ttl=-1)
+
+    async def scenario():
+        await lru.set("a", 1)
+        return await lru.get("a")
+
+    assert asyncio.run(scenario()) is None
+    assert lru.size() == 0
+
+@pytest.fixture
+def api(monkeypatch):
+    """A small app behind the cache middleware, with the data version under the test's control."""
+    state = {"version": "v1", "calls": 0}
+
+    async def current_data_version():
+        return state["version"]
+
+    monkeypatch.setattr(cache, "current_data_version", current_data_version)
+    monkeypatch.setattr(cache, "backend", cache.LRUCache())
+    app = FastAPI()
+    app.middleware("http")(cache.response_cache_middleware)
+
+    @app.get("/top-products")
+    def top_products(limit: int = 10):
+        state["calls"] += 1
+        return [{"product_name": "paracetamol", "mention_count": limit}]
+
+    @app.get("/posting-trends")
+    def posting_trends():
+        state["calls"] += 1
+        return PlainTextResponse("trend_period,posting_volume\n", media_type="text/csv")
+
+    @app.get("/search")
+    def search():
+        state["calls"] += 1
+        raise HTTPException(status_code=400, detail="bad query")
+
+    @app.get("/ready")
+    def ready():
+        state["calls"] += 1
+        return {"status": "ok"}
+
+    return TestClient(app), state
+
+def test_miss_then_hit(api):
+    client, state = api
+    first = client.get("/top-products?limit=3")
+    second = client.get("/top-products?limit=3")
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert first.json() == second.json() == [{"product_name": "paracetamol", "mention_count": 3}]
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert state["calls"] == 1
+
+def test_matching_etag_gets_304(api):
+    client, state = api
+    etag = client.get("/top-products").headers["ETag"]
+    response = client.get("/top-products", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    assert state["calls"] == 1
+
+def test_stale_etag_gets_the_body(api):
+    client, _ = api
+    client.get("/top-products")
+    response = client.get("/top-products", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json()[0]["product_name"] == "paracetamol"
+
+def test_new_data_version_misses(api):
+    client, state = api
+    client.get("/top-products")
+    state["version"] = "v2"
+    assert client.get("/top-products").headers["X-Cache"] == "MISS"
+    assert state["calls"] == 2
+
+def test_non_json_errors_and_other_paths_are_not_cached(api):
+    client, state = api
+    for path, status in (("/posting-trends", 200), ("/search", 400), ("/ready", 200)):
+        for _ in range(2):
+            response = client.get(path)
+            assert response.status_code == status
+            assert "X-Cache" not in response.headers
+    assert state["calls"] == 6
+
+def test_cache_hits_are_timed_under_their_route(monkeypatch):
+    from app import main
+
+    async def current_data_version():
+        return "v1"
+
+    async def fetch_data_from_db(db, query, params=None):
+        return [("paracetamol", 3)]
+
+    async def get_db():
+        yield None
+
+    monkeypatch.setattr(cache, "current_data_version", current_data_version)
+    monkeypatch.setattr(cache, "backend", cache.LRUCache())
+    monkeypatch.setattr(main, "fetch_data_from_db", fetch_data_from_db)
+    main.app.dependency_overrides[main.get_db] = get_db
+    try:
+        client = TestClient(main.app)
+        before = dict(main.HTTP_REQUEST_SECONDS.values)
+        statuses = [client.get("/top-products?limit=1").headers["X-Cache"] for _ in range(2)]
+    finally:
+        main.app.dependency_overrides.clear()
+    assert statuses == ["MISS", "HIT"]
+    counts = {dict(key)["route"]: entry["count"] - before.get(key, {"count": 0})["count"]
+              for key, entry in main.HTTP_REQUEST_SECONDS.values.items()}
+    assert counts["/top-products"] == 2
+    assert counts.get("unmatched", 0) == 0
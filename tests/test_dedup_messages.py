@@ -0,0 +1,93 @@
+import numpy as np
+from dedup_messages import (DEDUP_BANDS, DEDUP_NUM_PERM, DEDUP_THRESHOLD, CandidateIndex, Message, buckets,
+                            group_batch, minhash, normalize, similarity)
+
+POST = ("Amoxicillin 500mg capsules available now at our pharmacy in Bole, call us for delivery across "
+        "Addis Ababa, wholesale prices for clinics and hospitals, original packaging with long expiry dates")
+
+IMAGE_KEY = "ab" * 32 + ".jpg" # A media store key: its hash is the key's digest, no file needed
+
+def message(message_id, text, group_id=None, media_path=None):
+    return Message(message_id, None, text, media_path, 'channel', group_id=group_id)
+
+def test_normalize_drops_links_mentions_and_case():
+    assert normalize("Call @PharmaBot NOW: https://t.me/pharma?x=1 or www.pharma.et, t.me/shop") == ['call', 'now', 'or']
+    assert normalize("Panadol 500mg — 20 ብር") == ['panadol', '500mg', '20', 'ብር']
+
+def test_normalize_handles_missing_text():
+    assert normalize(None) == []
+    assert normalize("") == []
+
+def test_minhash_is_deterministic_and_sized():
+    a, b = minhash(normalize(POST)), minhash(normalize(POST))
+    assert a.dtype == np.uint32 and len(a) == DEDUP_NUM_PERM
+    assert np.array_equal(a, b)
+
+def test_minhash_needs_enough_shingles():
+    assert minhash(normalize("panadol in stock")) is None # One 3-shingle
+    assert minhash(normalize("panadol in stock now today")) is not None
+
+def test_minhash_estimates_jaccard_similarity():
+    repost = minhash(normalize(POST + " @pharmabot https://t.me/pharma"))
+    edited = minhash(normalize(POST.replace("Bole", "Piassa")))
+    unrelated = minhash(normalize("Paracetamol syrup for children out of stock until next week, "
+                                  "please check our other branches in Mexico and Megenagna"))
+    original = minhash(normalize(POST))
+    assert similarity(original, repost) == 1.0
+    assert 0.6 < similarity(original, edited) < 1.0 # Jaccard of the shingle sets is 24/30
+    assert similarity(original, unrelated) < 0.2
+
+def test_buckets_one_per_band_and_shared_by_equal_bands():
+    signature = minhash(normalize(POST))
+    assert len(buckets(signature)) == DEDUP_BANDS
+    assert buckets(signature) == buckets(signature.copy())
+    changed = signature.copy()
+    changed[0] ^= 1 # Only the first band differs
+    assert [a == b for a, b in zip(buckets(signature), buckets(changed))] == [False] + [True] * (DEDUP_BANDS - 1)
+
+def test_buckets_of_equal_bands_differ_across_band_numbers():
+    # The band number is part of the hash, so identical rows in two bands don't collide
+    assert len(set(buckets(np.zeros(DEDUP_NUM_PERM, dtype=np.uint32)))) == DEDUP_BANDS
+
+def test_near_duplicates_share_a_bucket_and_unrelated_texts_do_not():
+    original = buckets(minhash(normalize(POST)))
+    edited = buckets(minhash(normalize(POST.replace("Bole", "Piassa"))))
+    unrelated = buckets(minhash(normalize("Paracetamol syrup for children out of stock until next week")))
+    assert set(original) & set(edited)
+    assert not set(original) & set(unrelated)
+
+def test_group_batch_joins_reposts_to_the_earliest_copy():
+    messages = [message(1, POST), message(2, "Ibuprofen 400mg tablets back in stock this week"),
+                message(3, POST + " https://t.me/pharma"), message(4, "in stock"), message(5, "IN STOCK!")]
+    changed = group_batch(messages, CandidateIndex())
+    assert [m.group_id for m in messages] == [1, 2, 1, 4, 4]
+    assert [m.message_id for m in changed] == [1, 2, 4]
+
+def test_group_batch_keeps_a_reloaded_representative_in_its_group():
+    representative = message(1, POST)
+    index = CandidateIndex([representative])
+    reloaded = message(1, POST.replace("Bole", "Piassa"), group_id=1)
+    assert group_batch([reloaded], index) == [reloaded]
+    assert reloaded.group_id == 1
+
+def test_messages_below_the_threshold_start_their_own_group():
+    base = normalize(POST)
+    different = ' '.join(base[:len(base) // 2] + ['completely', 'different', 'ending', 'here', 'instead'])
+    a, b = message(1, POST), message(2, different)
+    assert similarity(a.signature, b.signature) < DEDUP_THRESHOLD
+    group_batch([a, b], CandidateIndex())
+    assert (a.group_id, b.group_id) == (1, 2)
+
+def test_images_must_agree_for_reposts_to_group():
+    messages = [message(1, POST, media_path=IMAGE_KEY), message(2, POST), message(3, POST, media_path=IMAGE_KEY),
+                message(4, POST, media_path="cd" * 32 + ".jpg"), message(5, POST)]
+    group_batch(messages, CandidateIndex())
+    # A text-only copy never joins the group of an image it doesn't have, nor one image another's
+    assert [m.group_id for m in messages] == [1, 2, 1, 4, 2]
+
+def test_media_of_unknown_content_never_groups():
+    unknown = message(2, POST, media_path="missing.jpg") # Not in the store or the channel's folder
+    assert unknown.image_hash == "unknown:2"
+    messages = [message(1, POST), unknown, message(3, POST, media_path="missing.jpg"), message(4, POST)]
+    group_batch(messages, CandidateIndex())
+    assert [m.group_id for m in messages] == [1, 2, 3, 1]
@@ -0,0 +1,68 @@
+import pytest
+from extract_products import AhoCorasick, availability, extract_mentions, find_prices, load_dictionary
+
+@pytest.fixture(scope='module')
+def matcher():
+    return AhoCorasick(load_dictionary())
+
+def test_matcher_finds_overlapping_aliases():
+    matcher = AhoCorasick({'he': 'a', 'she': 'b', 'hers': 'c', 'his': 'd'})
+    assert sorted(matcher.search('ushers')) == [(1, 4, 'b'), (2, 4, 'a'), (2, 6, 'c')]
+
+def test_alias_inside_a_longer_alias_is_not_its_own_mention(matcher):
+    rows = extract_mentions("Amoxicillin clavulanate 625mg 450 birr", matcher)
+    assert [row[0] for row in rows] == ['amoxicillin clavulanate']
+
+def test_aliases_map_to_their_product(matcher):
+    rows = extract_mentions("Panadol and Brufen in stock", matcher)
+    assert {row[0] for row in rows} == {'paracetamol', 'ibuprofen'}
+
+def test_alias_must_be_a_whole_word(matcher):
+    assert extract_mentions("paracetamoll 20 birr", matcher) == []
+    assert extract_mentions("superpanadol", matcher) == []
+
+@pytest.mark.parametrize("text, expected", [
+    ("250 birr", (250.0, 'ETB')),
+    ("ETB 1,200", (1200.0, 'ETB')),
+    ("etb1200", (1200.0, 'ETB')),
+    ("1200br", (1200.0, 'ETB')),
+    ("br. 75", (75.0, 'ETB')),
+    ("35.50 birr", (35.5, 'ETB')),
+    ("350 ብር", (350.0, 'ETB')),
+    ("$12", (12.0, 'USD')),
+    ("12.99$", (12.99, 'USD')),
+])
+def test_price_formats(text, expected):
+    assert [price[2:] for price in find_prices(text.lower())] == [expected]
+
+def test_numbers_without_a_currency_are_not_prices():
+    assert find_prices("500mg, 20 tablets") == []
+
+@pytest.mark.parametrize("text, expected", [
+    ("available now", True),
+    ("in stock", True),
+    ("አለ", True),
+    ("out of stock", False),
+    ("not available this week", False),
+    ("sold out", False),
+    ("የለም", False),
+    ("ፓናዶል አለ።", True), # Ethiopic full stop after the word
+    ("አለመኖሩ", None), # "its absence": አለ inside a longer word
+    ("አለን", None),
+    ("availableness", None),
+    ("call us", None),
+])
+def test_availability_phrases(text, expected):
+    assert availability(text) is expected
+
+def test_price_follows_the_mention(matcher):
+    assert extract_mentions("Cipro $12 out of stock", matcher) == [('ciprofloxacin', 12.0, 'USD', False)]
+
+def test_price_opening_the_message(matcher):
+    assert extract_mentions("ETB 450 - Augmentin 625mg available", matcher) == [
+        ('amoxicillin clavulanate', 450.0, 'ETB', True)
+    ]
+
+def test_price_beyond_the_window_is_not_attributed(matcher):
+    text = "Panadol " + "x" * 100 + " 20 birr"
+    assert extract_mentions(text, matcher) == [('paracetamol', None, None, None)]
@@ -0,0 +1,52 @@
+import pytest
+from load_to_postgress import TYPED_COLUMNS, copy_field, typed_values
+
+def message(**fields):
+    return {'message_id': 1, 'post_channel_id': 10, 'date': '2024-03-01T08:00:00+00:00', **fields}
+
+def typed(**fields):
+    return dict(zip((name for name, _, _ in TYPED_COLUMNS), typed_values(message(**fields))))
+
+def test_values_are_converted_to_their_column_types():
+    values = typed(views='120', forwards=3, is_sponsored=False, post_channel_name='CheMed')
+    assert (values['views'], values['forwards'], values['is_sponsored'], values['channel_name']) == (120, 3, False, 'CheMed')
+    assert values['date'] == '2024-03-01T08:00:00+00:00'
+
+def test_text_falls_back_to_the_older_message_field():
+    assert typed(message='hello')['text'] == 'hello'
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("true", True), ("False", False), ("0", False), ("1", True), (" t ", True), ("no", False),
+])
+def test_booleans_accept_json_booleans_and_known_strings(value, expected):
+    assert typed(is_sponsored=value)['is_sponsored'] is expected
+
+@pytest.mark.parametrize("value", ["maybe", "", 2, 0, [], {}])
+def test_other_booleans_are_rejected(value):
+    with pytest.raises(ValueError):
+        typed_values(message(is_sponsored=value))
+
+@pytest.mark.parametrize("value, error", [
+    (1709280000, TypeError), # Epoch seconds from an older dump
+    (1709280000.5, TypeError),
+    ({"$date": "2024-03-01"}, TypeError),
+    ("yesterday", ValueError),
+])
+def test_malformed_timestamps_fail_with_value_or_type_errors(value, error):
+    with pytest.raises(error):
+        typed_values(message(date=value))
+
+def test_malformed_integers_fail_with_value_or_type_errors():
+    with pytest.raises(ValueError):
+        typed_values(message(views='many'))
+    with pytest.raises(TypeError):
+        typed_values(message(views=[1]))
+
+def test_zulu_timestamps_are_accepted():
+    assert typed(date='2024-03-01T08:00:00Z')['date'] == '2024-03-01T08:00:00Z'
+
+@pytest.mark.parametrize("value, expected", [
+    (None, '\\N'), (True, 't'), (False, 'f'), (12, '12'), ("a\tb\nc\\d", 'a\\tb\\nc\\\\d'),
+])
+def test_copy_field_escapes_for_copy_text_format(value, expected):
+    assert copy_field(value) == expected
@@ -0,0 +1,27 @@
+import os
+import pytest
+import media_store
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    for name, folder in (('RAW_IMAGES_DIR', ''), ('OBJECTS_DIR', 'objects'), ('THUMBNAILS_DIR', 'thumbnails'),
+                         ('INCOMING_DIR', 'incoming')):
+        monkeypatch.setattr(media_store, name, str(tmp_path / folder))
+    return tmp_path
+
+def test_incoming_paths_are_unique_per_download(store):
+    first, second = media_store.incoming_path('123.jpg'), media_store.incoming_path('123.jpg')
+    assert first != second
+    assert all(path.endswith('-123.jpg') for path in (first, second))
+
+def test_concurrent_downloads_of_one_file_both_ingest(store):
+    paths = [media_store.incoming_path('123.jpg') for _ in range(2)]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(b'same bytes')
+    keys = [media_store.ingest(path, channel, '123.jpg') for path, channel in zip(paths, ('Channel A', 'Channel B'))]
+    assert keys[0] == keys[1]
+    assert os.listdir(media_store.INCOMING_DIR) == []
+    for channel in ('Channel A', 'Channel B'):
+        assert os.path.samefile(os.path.join(media_store.channel_dir(channel), '123.jpg'),
+                                media_store.object_path(keys[0]))
@@ -0,0 +1,72 @@
+"""OnnxBackend's own pre- and post-processing, checked without a model: letterboxing and non-maximum suppression."""
+import numpy as np
+import pytest
+from PIL import Image
+import enrich_data
+from enrich_data import ENRICH_CONFIDENCE, ENRICH_IMAGE_SIZE, OnnxBackend
+
+GREY = 114 / 255.0
+
+@pytest.fixture
+def backend():
+    # Only the numpy post-processing is under test, so no ONNX session is built
+    backend = OnnxBackend.__new__(OnnxBackend)
+    backend.np = np
+    backend.names = {0: 'pill', 1: 'bottle'}
+    return backend
+
+def test_letterbox_scales_to_fit_and_centres(backend):
+    image = Image.new('RGB', (200, 100), (0, 0, 0))
+    image.paste((255, 255, 255), (50, 25, 100, 75)) # A white box at x 50-100, y 25-75
+    array = backend.letterbox(image)
+    assert array.shape == (3, ENRICH_IMAGE_SIZE, ENRICH_IMAGE_SIZE)
+    assert array.dtype == np.float32
+
+    # 200x100 scales by 3.2 to 640x320, padded with 160 grey rows above and below
+    scale, pad_y = ENRICH_IMAGE_SIZE / 200, (ENRICH_IMAGE_SIZE - 320) // 2
+    assert np.allclose(array[:, :pad_y], GREY) and np.allclose(array[:, pad_y + 320:], GREY)
+
+    white = np.argwhere(array[0] > 0.9)
+    (top, left), (bottom, right) = white.min(axis=0), white.max(axis=0) + 1
+    expected = (25 * scale + pad_y, 50 * scale, 75 * scale + pad_y, 100 * scale)
+    assert np.allclose((top, left, bottom, right), expected, atol=2)
+
+def test_letterbox_pads_tall_images_at_the_sides(backend):
+    array = backend.letterbox(Image.new('RGB', (50, 100), (255, 0, 0)))
+    assert np.allclose(array[:, :, :160], GREY) and np.allclose(array[:, :, 480:], GREY)
+    assert np.allclose(array[0, :, 160:480], 1.0) and np.allclose(array[1, :, 160:480], 0.0)
+
+def test_nms_keeps_the_best_of_overlapping_boxes(backend):
+    # IoU of the first two is 90.25 / 109.75, over ENRICH_IOU
+    boxes = np.array([[0, 0, 10, 10], [0.5, 0.5, 10.5, 10.5], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.5], dtype=np.float32)
+    assert [int(i) for i in backend.non_max_suppression(boxes, scores)] == [1, 2]
+
+def test_nms_keeps_boxes_below_the_iou_threshold(backend):
+    # IoU of these two is 25 / 175, well under ENRICH_IOU
+    boxes = np.array([[0, 0, 10, 10], [5, 5, 15, 15]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    assert [int(i) for i in backend.non_max_suppression(boxes, scores)] == [0, 1]
+
+def test_nms_caps_detections(backend, monkeypatch):
+    monkeypatch.setattr(enrich_data, 'ENRICH_MAX_DETECTIONS', 2)
+    boxes = np.array([[i * 20, 0, i * 20 + 10, 10] for i in range(5)], dtype=np.float32)
+    scores = np.array([0.1, 0.5, 0.3, 0.9, 0.7], dtype=np.float32)
+    assert [int(i) for i in backend.non_max_suppression(boxes, scores)] == [3, 4]
+
+def model_output(anchors):
+    """A (4 + classes, anchors) YOLOv8 output from (cx, cy, w, h, pill score, bottle score) rows."""
+    return np.array(anchors, dtype=np.float32).T
+
+def test_detections_suppress_within_a_class_only(backend):
+    output = model_output([
+        (100, 100, 50, 50, 0.90, 0.0),
+        (102, 101, 50, 50, 0.80, 0.0),  # Same pill, lower score: suppressed
+        (100, 100, 50, 50, 0.0, 0.70),  # Same box, other class: kept
+        (400, 400, 40, 40, ENRICH_CONFIDENCE / 2, 0.0),  # Below the confidence threshold
+    ])
+    detections = backend.detections(output)
+    assert [(d['class_name'], round(d['confidence'], 2)) for d in detections] == [('pill', 0.9), ('bottle', 0.7)]
+
+def test_detections_of_an_empty_output(backend):
+    assert backend.detections(model_output([(100, 100, 50, 50, 0.01, 0.02)])) == []
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+from datetime import date
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from app.pagination import (RowEncoder, cursor_for_row, decode_cursor, encode_cursor, keyset_query, keyset_rows,
+                            row_after, validate_format)
+
+# score DESC with ties, then name ASC with ties, then id ASC as the unique tie-breaker
+ORDER = [("score", "desc", int), ("name", "asc", str), ("id", "asc", int)]
+ROWS = [(1, "b", 5), (2, "a", 5), (3, "a", 5), (4, "c", 3), (5, "a", 3), (6, "a", 3), (7, "b", 9),
+        (8, "a", 1), (9, "b", 1), (10, "b", 1), (11, "a", 9), (12, "c", 5)]
+
+@pytest.fixture(scope="module")
+def db():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER, name TEXT, score INTEGER)"))
+        conn.execute(text("INSERT INTO items VALUES (:id, :name, :score)"),
+                     [{"id": i, "name": n, "score": s} for i, n, s in ROWS])
+    with engine.connect() as conn:
+        yield conn
+
+def expected_order():
+    return [i for i, _, _ in sorted(ROWS, key=lambda r: (-r[2], r[1], r[0]))]
+
+def test_cursor_round_trip():
+    order = [("day", "asc", date.fromisoformat), ("rank", "desc", float), ("name", "asc", str)]
+    cursor = encode_cursor([date(2024, 3, 1), 0.25, "ዜና/ch"])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, order) == [date(2024, 3, 1), 0.25, "ዜና/ch"]
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor([1, "a"]), encode_cursor(["x", "a", 1])])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, ORDER)
+    assert error.value.status_code == 400
+
+def test_keyset_query_first_page():
+    query, params = keyset_query("SELECT * FROM items", ORDER, limit=5)
+    assert "WHERE" not in query
+    assert query.endswith("ORDER BY page.score DESC, page.name ASC, page.id ASC LIMIT :page_limit")
+    assert params == {"page_limit": 5}
+
+def test_keyset_query_expands_the_row_comparison():
+    query, params = keyset_query("SELECT * FROM items", ORDER, after=encode_cursor([5, "a", 3]))
+    assert ("WHERE (page.score < :after_0)"
+            " OR (page.score = :after_0 AND page.name > :after_1)"
+            " OR (page.score = :after_0 AND page.name = :after_1 AND page.id > :after_2)") in query
+    assert params == {"after_0": 5, "after_1": "a", "after_2": 3}
+
+def walk(fetch_page, limit):
+    """Follows cursors from the first page until a short page, as a client would."""
+    seen, after = [], None
+    while True:
+        page = fetch_page(after, limit)
+        seen.extend(row._mapping["id"] for row in page)
+        if len(page) < limit:
+            return seen
+        after = cursor_for_row(page[-1], ORDER)
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 12, 50])
+def test_sql_pages_have_no_gaps_or_duplicates(db, limit):
+    def fetch_page(after, limit):
+        query, params = keyset_query("SELECT id, name, score FROM items", ORDER, after, limit)
+        return db.execute(text(query), params).fetchall()
+
+    assert walk(fetch_page, limit) == expected_order()
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 12, 50])
+def test_in_memory_pages_have_no_gaps_or_duplicates(db, limit):
+    rows = db.execute(text("SELECT id, name, score FROM items")).fetchall()
+    assert walk(lambda after, limit: keyset_rows(rows, ORDER, after, limit), limit) == expected_order()
+
+def test_sql_cursor_continues_in_memory(db):
+    # A client may get its first page from SQL and the next one from the snapshot, or the other way round
+    query, params = keyset_query("SELECT id, name, score FROM items", ORDER, limit=4)
+    first = db.execute(text(query), params).fetchall()
+    rows = db.execute(text("SELECT id, name, score FROM items")).fetchall()
+    rest = keyset_rows(rows, ORDER, after=cursor_for_row(first[-1], ORDER))
+    assert [row._mapping["id"] for row in first + rest] == expected_order()
+
+def test_row_after_tie_breaks_on_the_last_column(db):
+    row = db.execute(text("SELECT 6 AS id, 'a' AS name, 3 AS score")).fetchone()
+    assert row_after(row, ORDER, [3, "a", 5])
+    assert not row_after(row, ORDER, [3, "a", 6]) # The cursor row itself is not repeated
+    assert not row_after(row, ORDER, [3, "a", 7])
+    assert row_after(row, ORDER, [4, "z", 99])
+
+ITEMS = [
+    {"channel_name": "a,b", "mentions": 2, "distinct_detected_classes": ["pill", "bottle"], "min_price": None},
+    {"channel_name": 'say "hi"', "mentions": 1, "distinct_detected_classes": [], "min_price": 12.5},
+]
+
+def test_ndjson_encoding():
+    encoder = RowEncoder("ndjson")
+    lines = [encoder.encode(item) for item in ITEMS]
+    assert all(line.endswith("\n") and line.count("\n") == 1 for line in lines)
+    assert [json.loads(line) for line in lines] == ITEMS
+
+def test_ndjson_encodes_dates_as_strings():
+    assert RowEncoder("ndjson").encode({"trend_period": date(2024, 1, 1)}) == '{"trend_period": "2024-01-01"}\n'
+
+def test_csv_encoding_writes_one_header_and_json_lists():
+    encoder = RowEncoder("csv")
+    chunks = [encoder.encode(item) for item in ITEMS]
+    assert chunks[0].startswith("channel_name,mentions,distinct_detected_classes,min_price\r\n")
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert [row["channel_name"] for row in rows] == ["a,b", 'say "hi"']
+    assert json.loads(rows[0]["distinct_detected_classes"]) == ["pill", "bottle"]
+    assert rows[0]["min_price"] == "" and rows[1]["min_price"] == "12.5"
+
+def test_validate_format():
+    for fmt in ("json", "ndjson", "csv"):
+        validate_format(fmt)
+    with pytest.raises(HTTPException) as error:
+        validate_format("xml")
+    assert error.value.status_code == 400
@@ -0,0 +1,44 @@
+"""The text-search queries must be answerable from fct_messages' GIN indexes (see the post-hooks in fct_messages.sql)."""
+import pytest
+from sqlalchemy import text
+from conftest import require_tables
+from app.main import search_match
+
+FTS_INDEX = 'fct_messages_content_fts_idx'
+TRGM_INDEX = 'fct_messages_content_trgm_idx'
+
+def plan_indexes(conn, query, params):
+    """Names of the indexes the plan of a query reads, with sequential scans ruled out.
+
+    With enable_seqscan off the planner still falls back to a sequential scan when no index can answer the
+    predicate, so the test holds however few rows the database has.
+    """
+    with conn.begin():
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar()
+    names = set()
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if 'Index Name' in node:
+            names.add(node['Index Name'])
+        nodes.extend(node.get('Plans', []))
+    return names
+
+@pytest.fixture
+def fct(warehouse):
+    require_tables(warehouse, 'public.fct_messages')
+    return warehouse
+
+def test_full_text_search_uses_fts_index(fct):
+    query = f"SELECT fm.message_id FROM fct_messages fm WHERE {search_match(fuzzy=False)}"
+    assert FTS_INDEX in plan_indexes(fct, query, {'q': 'paracetamol tablets'})
+
+def test_fuzzy_search_uses_both_indexes(fct):
+    query = f"SELECT fm.message_id FROM fct_messages fm WHERE {search_match(fuzzy=True)}"
+    assert {FTS_INDEX, TRGM_INDEX} <= plan_indexes(fct, query, {'q': 'paracetamol'})
+
+def test_substring_ilike_uses_trigram_index(fct):
+    # The substring match /product-availability ran before product_mentions replaced it; ad-hoc queries still use it
+    query = "SELECT fm.message_id FROM fct_messages fm WHERE fm.message_content ILIKE '%' || :term || '%'"
+    assert TRGM_INDEX in plan_indexes(fct, query, {'term': 'amoxicillin'})
@@ -0,0 +1,252 @@
+"""The snapshot must answer the aggregate endpoints exactly as SQL does, and page with the same keyset cursors.
+
+The first tests build a snapshot from a synthetic warehouse and check it against a direct computation of each
+endpoint's SQL semantics. The last one compares the live API in both serving modes on the compose database.
+"""
+import asyncio
+import random
+from datetime import date, timedelta
+import pytest
+from app import snapshot
+from app.pagination import cursor_for_row, encode_cursor, keyset_rows
+from app.snapshot import Snapshot, SnapshotBuilder
+
+CHANNELS = {10: "chemed", 20: "lobelia", 30: None} # 30 has messages but no dim_channels row
+CLASSES = ["pill", "bottle", "person"]
+PRODUCTS = ["paracetamol", "ibuprofen", "amoxicillin", "vitamin c"]
+FIRST_DAY = date(2020, 12, 20) # Spans ISO week 53 of 2020, which runs into January 2021
+
+# Sort keys of the endpoints, as in app/main.py
+TOP_PRODUCTS_ORDER = [("mention_count", "desc", int), ("product_name", "asc", str)]
+VISUAL_ORDER = [("messages_with_media", "desc", int), ("channel_name", "asc", str)]
+DAY_ORDER = [("trend_period", "asc", date.fromisoformat)]
+WEEK_ORDER = [("year", "asc", int), ("week_of_year", "asc", int)]
+MONTH_ORDER = [("trend_period", "asc", str)]
+
+def make_messages(seed=7, count=600):
+    rng = random.Random(seed)
+    messages = []
+    for message_id in range(1, count + 1):
+        has_media = rng.random() < 0.5
+        detected = [rng.choice(CLASSES) for _ in range(rng.randint(1, 3))] if has_media and rng.random() < 0.6 else None
+        group = message_id if rng.random() < 0.7 else rng.randint(1, message_id) # Reposts share a group
+        messages.append({
+            "message_id": message_id, "channel_sk": rng.choice(list(CHANNELS)),
+            "day": FIRST_DAY + timedelta(days=rng.randint(0, 50)), "has_media": has_media, "detected": detected,
+            "products": rng.sample(PRODUCTS, rng.randint(0, 2)), "group": group,
+            "dated": rng.random() < 0.95, # A few mentions have no message_date
+        })
+    return messages
+
+def first_mentions(messages):
+    """{(product, group): the message holding the group's first mention of the product}, as agg_product_mentions
+    picks it: earliest message_date, undated last, then lowest message_id."""
+    firsts = {}
+    for m in sorted(messages, key=lambda m: (not m["dated"], m["day"], m["message_id"])):
+        for product in m["products"]:
+            firsts.setdefault((product, m["group"]), m)
+    return firsts
+
+def query_rows(messages):
+    """What the SNAPSHOT_QUERIES return for these messages."""
+    channel_days, channel_classes, mentions = {}, set(), {}
+    for m in messages:
+        counts = channel_days.setdefault((m["channel_sk"], m["day"]), [0, 0, 0])
+        counts[0] += 1
+        if m["has_media"] and m["detected"] is not None:
+            counts[1] += 1
+            counts[2] += len(m["detected"])
+            channel_classes.update((m["channel_sk"], m["day"], name) for name in m["detected"])
+    for (product, _), m in first_mentions(messages).items():
+        key = (product, m["channel_sk"], m["day"] if m["dated"] else None)
+        mentions[key] = mentions.get(key, 0) + 1
+    return {
+        "channel_days": [(channel, day, *counts) for (channel, day), counts in channel_days.items()],
+        "channel_classes": sorted(channel_classes),
+        "mentions": sorted(((*key, count) for key, count in mentions.items()), key=str),
+    }
+
+@pytest.fixture(scope="module")
+def messages():
+    return make_messages()
+
+@pytest.fixture(scope="module")
+def built(messages, tmp_path_factory):
+    builder = SnapshotBuilder()
+    for table, records in query_rows(messages).items():
+        for i in range(0, len(records), 37): # Several chunks per table, as when streamed
+            builder.add(table, records[i:i + 37])
+    path = str(tmp_path_factory.mktemp("snapshot") / "v-test")
+    builder.write(path, "test-version", {sk: name for sk, name in CHANNELS.items() if name is not None})
+    return Snapshot(path)
+
+def selected(messages, start_date, end_date, channel, dated_only=False):
+    channel_sks = {sk for sk, name in CHANNELS.items() if name == channel}
+    for m in messages:
+        if channel is not None and m["channel_sk"] not in channel_sks:
+            continue
+        if dated_only and not m["dated"] and (start_date or end_date):
+            continue
+        if (start_date and m["day"] < start_date) or (end_date and m["day"] > end_date):
+            continue
+        yield m
+
+def expected_top_products(messages, start_date, end_date, channel):
+    # Each repost group counts once, where it first mentioned the product
+    firsts = first_mentions(messages)
+    counts = {}
+    for m in selected(messages, start_date, end_date, channel, dated_only=True):
+        for product in m["products"]:
+            if firsts[(product, m["group"])] is m:
+                counts[product] = counts.get(product, 0) + 1
+    return set(counts.items())
+
+def expected_visual_content(messages, start_date, end_date, channel):
+    channels = {}
+    for m in selected(messages, start_date, end_date, channel):
+        if CHANNELS[m["channel_sk"]] is None or not (m["has_media"] and m["detected"] is not None):
+            continue
+        entry = channels.setdefault(CHANNELS[m["channel_sk"]], [0, 0, set()])
+        entry[0] += 1
+        entry[1] += len(m["detected"])
+        entry[2].update(m["detected"])
+    return {(name, count, count, objects, tuple(sorted(classes))) for name, (count, objects, classes) in channels.items()}
+
+def expected_trends(messages, grain, start_date, end_date, channel):
+    totals = {}
+    for m in selected(messages, start_date, end_date, channel):
+        day = m["day"]
+        if grain == "day":
+            key = (day,)
+        elif grain == "week":
+            # EXTRACT(YEAR) with EXTRACT(WEEK): calendar year, ISO week
+            key = (f"{day.year}-{day.isocalendar()[1]}", day.year, day.isocalendar()[1])
+        else:
+            key = (day.strftime("%Y-%m"),)
+        totals[key] = totals.get(key, 0) + 1
+    return {(key[0], total, *key[1:]) for key, total in totals.items()}
+
+FILTERS = [
+    (None, None, None),
+    (date(2020, 12, 28), None, None),
+    (None, date(2021, 1, 3), None),
+    (date(2020, 12, 25), date(2021, 1, 15), "chemed"),
+    (None, None, "lobelia"),
+    (None, None, "no-such-channel"),
+]
+
+@pytest.mark.parametrize("start_date, end_date, channel", FILTERS)
+def test_top_products(built, messages, start_date, end_date, channel):
+    answer = built.top_products(start_date, end_date, channel)
+    assert set(answer) == expected_top_products(messages, start_date, end_date, channel)
+
+@pytest.mark.parametrize("start_date, end_date, channel", FILTERS)
+def test_channel_visual_content(built, messages, start_date, end_date, channel):
+    answer = {(*row[:4], tuple(row[4])) for row in built.channel_visual_content(start_date, end_date, channel)}
+    assert answer == expected_visual_content(messages, start_date, end_date, channel)
+
+@pytest.mark.parametrize("grain", ["day", "week", "month"])
+@pytest.mark.parametrize("start_date, end_date, channel", FILTERS)
+def test_posting_trends(built, messages, grain, start_date, end_date, channel):
+    assert set(built.posting_trends(grain, start_date, end_date, channel)) == expected_trends(
+        messages, grain, start_date, end_date, channel)
+
+def test_week_53_keeps_its_calendar_year(built):
+    periods = {row._mapping["trend_period"] for row in built.posting_trends("week")}
+    assert {"2020-53", "2021-53", "2021-1"} <= periods
+
+def test_rows_are_plain_python_values(built):
+    # Cursors are JSON-encoded from these values, so numpy scalars must not leak out
+    for row in built.top_products() + built.channel_visual_content() + built.posting_trends("day"):
+        assert all(type(value).__module__ == "builtins" or isinstance(value, date) for value in row)
+
+@pytest.mark.parametrize("answer, order", [
+    (lambda s: s.top_products(), TOP_PRODUCTS_ORDER),
+    (lambda s: s.channel_visual_content(), VISUAL_ORDER),
+    (lambda s: s.posting_trends("day"), DAY_ORDER),
+    (lambda s: s.posting_trends("week"), WEEK_ORDER),
+    (lambda s: s.posting_trends("month"), MONTH_ORDER),
+])
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_pages_walk_without_gaps(built, answer, order, limit):
+    rows = answer(built)
+    seen, after = [], None
+    while True:
+        page = keyset_rows(rows, order, after, limit)
+        seen.extend(page)
+        if len(page) < limit:
+            break
+        after = cursor_for_row(page[-1], order)
+    assert seen == keyset_rows(rows, order)
+    assert len(seen) == len(rows)
+
+def test_sql_cursor_values_continue_on_the_snapshot(built):
+    from decimal import Decimal
+    # Postgres returns EXTRACT() as numeric, so a weekly cursor from a SQL page carries Decimals
+    rows = keyset_rows(built.posting_trends("week"), WEEK_ORDER)
+    cursor = encode_cursor([Decimal(rows[1]._mapping["year"]), Decimal(rows[1]._mapping["week_of_year"])])
+    assert keyset_rows(rows, WEEK_ORDER, after=cursor) == rows[2:]
+    # Daily cursors carry a date, weekly/monthly ones strings and ints
+    cursor = encode_cursor([date.fromisoformat(str(built.posting_trends("day")[3][0]))])
+    assert keyset_rows(built.posting_trends("day"), DAY_ORDER, after=cursor) == keyset_rows(built.posting_trends("day"), DAY_ORDER)[4:]
+
+ENDPOINTS = [
+    "/top-products",
+    "/top-products?channel=CheMed123",
+    "/channel-visual-content",
+    "/channel-visual-content?start_date=2024-01-01",
+    "/posting-trends?grain=day",
+    "/posting-trends?grain=week",
+    "/posting-trends?grain=week&start_date=2024-01-01",
+    "/posting-trends?grain=month",
+]
+
+def test_snapshot_matches_sql_on_the_warehouse(warehouse, monkeypatch, tmp_path):
+    from conftest import require_tables
+    require_tables(warehouse, "public.fct_messages", "public.agg_product_mentions", "public.agg_channel_visual_content",
+                   "public.agg_daily_posting_volume", "public.agg_weekly_posting_volume")
+    from fastapi.testclient import TestClient
+    from app import cache
+    from app.database import engine
+    from app.main import app
+
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "CACHEABLE_PATHS", set()) # Both modes must actually run
+
+    async def build():
+        try:
+            return await snapshot.build("compare")
+        finally:
+            await engine.dispose() # Its connections belong to this event loop, not the test client's
+
+    built = Snapshot(asyncio.run(build()))
+
+    async def current_data_version():
+        return "compare"
+
+    monkeypatch.setattr(snapshot, "current_data_version", current_data_version)
+    monkeypatch.setitem(snapshot._state, "snapshot", built)
+    monkeypatch.setattr(snapshot, "SERVING_MODE", "sql")
+
+    def pages(client, url, mode, limit=3, switch_after=None):
+        """Every page of url, following X-Next-Cursor; switch_after pages in, flips to the other serving mode."""
+        seen, after, count = [], None, 0
+        while True:
+            count += 1
+            current = mode if switch_after is None or count <= switch_after else {"sql": "snapshot", "snapshot": "sql"}[mode]
+            monkeypatch.setattr(snapshot, "SERVING_MODE", current)
+            separator = "&" if "?" in url else "?"
+            response = client.get(f"{url}{separator}limit={limit}" + (f"&after={after}" if after else ""))
+            assert response.status_code == 200, response.text
+            seen.extend(response.json())
+            after = response.headers.get("X-Next-Cursor")
+            if not after:
+                return seen
+
+    # One client for every request, so the pool's connections stay on a single event loop
+    with TestClient(app) as client:
+        for url in ENDPOINTS:
+            from_sql = pages(client, url, "sql")
+            assert pages(client, url, "snapshot") == from_sql, url
+            assert pages(client, url, "sql", switch_after=1) == from_sql, url
+            assert pages(client, url, "snapshot", switch_after=1) == from_sql, url